@@ -0,0 +1,114 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from .run_sim import simulate_policy
+from .policies import OraclePolicy
+from .seed_sweep import build_world_and_contexts, make_thompson, summarize
+
+
+def run_batch_sizes(
+    seed,
+    rounds,
+    candidate_videos,
+    candidate_brands,
+    num_cohorts,
+    segment_len,
+    impressions_per_pull,
+    batch_sizes,
+):
+    world, contexts = build_world_and_contexts(
+        seed, rounds, candidate_videos, candidate_brands, num_cohorts, segment_len
+    )
+    denom = rounds * impressions_per_pull
+    oracle = simulate_policy(
+        world, OraclePolicy(), contexts, seed=seed + 10, impressions_per_pull=impressions_per_pull
+    )
+    oracle_rate = oracle.sum() / denom
+
+    rows = []
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        succ = simulate_policy(
+            world,
+            make_thompson(world, num_cohorts, seed),
+            contexts,
+            seed=seed + 10,
+            impressions_per_pull=impressions_per_pull,
+            batch_size=batch_size,
+        )
+        elapsed = time.perf_counter() - start
+        rate = succ.sum() / denom
+        rows.append(
+            {
+                "seed": seed,
+                "batch_size": batch_size,
+                "thompson": rate,
+                "oracle_constrained": oracle_rate,
+                "regret": oracle_rate - rate,
+                "rounds_per_sec": rounds / elapsed,
+            }
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=20000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--candidate-videos", type=int, default=12)
+    parser.add_argument("--candidate-brands", type=int, default=5)
+    parser.add_argument("--num-cohorts", type=int, default=8)
+    parser.add_argument("--segment-len", type=int, default=1)
+    parser.add_argument("--impressions-per-pull", type=int, default=10)
+    parser.add_argument("--out-csv", type=str, default="results/batch_sweep.csv")
+    parser.add_argument("--out-summary", type=str, default="results/batch_summary_table.md")
+    args = parser.parse_args()
+
+    if min(args.batch_sizes) < 1:
+        raise ValueError("batch sizes must be >= 1")
+    os.makedirs(os.path.dirname(args.out_csv), exist_ok=True)
+
+    all_rows = []
+    for seed in range(args.seeds):
+        all_rows.extend(
+            run_batch_sizes(
+                seed=seed,
+                rounds=args.rounds,
+                candidate_videos=args.candidate_videos,
+                candidate_brands=args.candidate_brands,
+                num_cohorts=args.num_cohorts,
+                segment_len=args.segment_len,
+                impressions_per_pull=args.impressions_per_pull,
+                batch_sizes=args.batch_sizes,
+            )
+        )
+
+    fieldnames = ["seed", "batch_size", "thompson", "oracle_constrained", "regret", "rounds_per_sec"]
+    with open(args.out_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(all_rows)
+
+    summary_lines = []
+    summary_lines.append("| Batch size | Thompson (mean±std) | Regret vs oracle (mean±std) | Rounds/sec |")
+    summary_lines.append("|---|---|---|---|")
+    for batch_size in args.batch_sizes:
+        rows = [r for r in all_rows if r["batch_size"] == batch_size]
+        ts_mean, ts_std = summarize(rows, "thompson")
+        reg_mean, reg_std = summarize(rows, "regret")
+        rps = np.mean([r["rounds_per_sec"] for r in rows])
+        summary_lines.append(
+            f"| {batch_size} | {ts_mean:.3f}±{ts_std:.3f} | {reg_mean:.3f}±{reg_std:.3f} | {rps:.0f} |"
+        )
+
+    with open(args.out_summary, "w") as f:
+        f.write("\n".join(summary_lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
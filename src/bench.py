@@ -0,0 +1,182 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from .run_sim import make_world, make_contexts, policy_factories, simulate_policy
+
+# Throughput benchmarks for World CTR scoring, policy selection and
+# simulate_policy. `python -m src.bench` sweeps catalog size, candidate counts,
+# cohorts and rounds and writes one JSON record per (config, policy); with
+# --compare it flags records that regressed against a stored baseline.
+CONFIG_KEYS = ("num_videos", "candidate_videos", "num_cohorts", "rounds", "batch_size")
+# Per metric, whether larger values are better; used by compare().
+METRICS = {
+    "rounds_per_sec": True,
+    "select_p50_us": False,
+    "select_p99_us": False,
+    "ctr_p50_us": False,
+    "peak_mib": False,
+}
+
+
+def _percentiles_us(samples):
+    p50, p90, p99 = np.percentile(np.asarray(samples) * 1e6, [50, 90, 99])
+    return float(p50), float(p90), float(p99)
+
+
+def _call_latencies(fn, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_policy(world, make_policy, contexts, batch_size=1, repeat=3, latency_calls=200, seed=0):
+    # Best-of-repeat throughput of a fresh policy, then peak traced memory of one
+    # more run (the policy is built before tracing starts, so this is what the
+    # run allocates), then per-call select_arm / expected_ctr latencies on the
+    # warm policy.
+    timings = []
+    for _ in range(repeat):
+        policy = make_policy()
+        start = time.perf_counter()
+        simulate_policy(world, policy, contexts, seed=seed, batch_size=batch_size)
+        timings.append(time.perf_counter() - start)
+
+    traced = make_policy()
+    tracemalloc.start()
+    simulate_policy(world, traced, contexts, seed=seed, batch_size=batch_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rows = contexts[: min(latency_calls, len(contexts))]
+    select = _call_latencies(
+        lambda u, c, v, b: policy.select_arm(world, u, v, b, cohort_id=c), list(rows)
+    )
+    arms = [policy.select_arm(world, u, v, b, cohort_id=c) for u, c, v, b in rows]
+    ctr = _call_latencies(world.expected_ctr, [(u, *arm) for u, arm in zip(rows.users.tolist(), arms)])
+
+    select_p50, select_p90, select_p99 = _percentiles_us(select)
+    ctr_p50, ctr_p90, ctr_p99 = _percentiles_us(ctr)
+    return {
+        "rounds_per_sec": len(contexts) / min(timings),
+        "select_p50_us": select_p50,
+        "select_p90_us": select_p90,
+        "select_p99_us": select_p99,
+        "ctr_p50_us": ctr_p50,
+        "ctr_p90_us": ctr_p90,
+        "ctr_p99_us": ctr_p99,
+        "peak_mib": peak / 2**20,
+    }
+
+
+def run_benchmarks(configs, policies=None, repeat=3, seed=0, progress=False):
+    results = []
+    for config in configs:
+        world, user_to_cohort = make_world(seed, config["num_cohorts"], num_videos=config["num_videos"])
+        contexts = make_contexts(
+            world,
+            config["rounds"],
+            config["candidate_videos"],
+            5,
+            user_to_cohort,
+            seed=seed + 1,
+            vectorized=True,
+        )
+        factories = policy_factories(world, config["num_cohorts"], seed)
+        for name in policies or list(factories):
+            record = bench_policy(
+                world,
+                factories[name],
+                contexts,
+                batch_size=config["batch_size"],
+                repeat=repeat,
+                seed=seed + 10,
+            )
+            results.append({**config, "policy": name, **record})
+            if progress:
+                print(f"{_key(results[-1])}: {record['rounds_per_sec']:.0f} rounds/sec", flush=True)
+    return results
+
+
+def _key(record):
+    return " ".join(f"{k}={record[k]}" for k in CONFIG_KEYS) + f" policy={record['policy']}"
+
+
+def compare(results, baseline, tolerance=0.25):
+    # Records slower or heavier than their baseline match by more than tolerance
+    # (relative); returns a list of human-readable regression lines.
+    base = {_key(r): r for r in baseline}
+    regressions = []
+    for record in results:
+        ref = base.get(_key(record))
+        if ref is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            new, old = record[metric], ref[metric]
+            if old <= 0:
+                continue
+            change = new / old - 1.0
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{_key(record)}: {metric} {old:.1f} -> {new:.1f} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-videos", type=int, nargs="+", default=[200, 5000])
+    parser.add_argument("--candidate-videos", type=int, nargs="+", default=[12, 48])
+    parser.add_argument("--num-cohorts", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[2000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1])
+    parser.add_argument("--policies", type=str, nargs="+", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default="results/bench.json")
+    parser.add_argument("--compare", type=str, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.repeat < 1:
+        raise ValueError("repeat must be >= 1")
+    configs = [
+        dict(zip(CONFIG_KEYS, values))
+        for values in itertools.product(
+            args.num_videos, args.candidate_videos, args.num_cohorts, args.rounds, args.batch_sizes
+        )
+    ]
+    results = run_benchmarks(configs, args.policies, repeat=args.repeat, seed=args.seed, progress=True)
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved benchmark results to {os.path.abspath(args.out)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+from collections import deque
+
+import numpy as np
+
+from .posteriors import SparseArmCounts
+
+# A checkpoint is a directory holding one .npy file per array (policy.<attr>.npy
+# for policy state, successes.npy for the per-round buffer) plus manifest.json
+# with the round index, RNG states and scalar policy fields. Arrays are
+# memory-mapped copy-on-write on restore, so reloading a large posterior only
+# touches the pages a run actually reads or updates.
+MANIFEST = "manifest.json"
+
+
+def _generator_from_state(state):
+    rng = np.random.Generator(getattr(np.random, state["bit_generator"])())
+    rng.bit_generator.state = state
+    return rng
+
+
+def policy_state(policy):
+    # (arrays, fields) for a policy: numpy arrays (sparse stores flattened to
+    # "name.attr") go to .npy files; Generators and scalars go to the manifest.
+    # Profiling proxies are looked through via __wrapped__.
+    policy = getattr(policy, "__wrapped__", policy)
+    arrays, fields = {}, {}
+    for name, value in vars(policy).items():
+        if isinstance(value, np.ndarray):
+            arrays[name] = value
+        elif isinstance(value, SparseArmCounts):
+            for attr, arr in vars(value).items():
+                if isinstance(arr, np.ndarray):
+                    arrays[f"{name}.{attr}"] = arr
+            fields[name] = {"sparse": {"delta_capacity": value.delta_capacity}}
+        elif isinstance(value, deque):
+            arrays[name] = np.array(list(value))
+            fields[name] = {"deque": True}
+        elif isinstance(value, np.random.Generator):
+            fields[name] = {"generator": value.bit_generator.state}
+        elif isinstance(value, list) and all(isinstance(g, np.random.Generator) for g in value):
+            fields[name] = {"generators": [g.bit_generator.state for g in value]}
+        elif isinstance(value, np.generic):
+            fields[name] = {"value": value.item()}
+        elif value is None or isinstance(value, (bool, int, float, str)):
+            fields[name] = {"value": value}
+        else:
+            raise TypeError(f"cannot checkpoint {type(policy).__name__}.{name} ({type(value).__name__})")
+    return arrays, fields
+
+
+def _save_array(path, name, arr):
+    np.save(os.path.join(path, f"{name}.npy"), np.asarray(arr))
+
+
+def save_checkpoint(path, policy, rng, round_index, successes, metrics=None):
+    # Written to a sibling temp directory and swapped in, so an interrupted save
+    # leaves the previous checkpoint intact.
+    policy = getattr(policy, "__wrapped__", policy)
+    arrays, fields = policy_state(policy)
+    tmp = path.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, arr in arrays.items():
+        _save_array(tmp, f"policy.{name}", arr)
+    _save_array(tmp, "successes", successes)
+    manifest = {
+        "policy": type(policy).__name__,
+        "round": int(round_index),
+        "rng": rng.bit_generator.state,
+        "arrays": sorted(arrays),
+        "fields": fields,
+    }
+    if metrics is not None:
+        manifest["metrics"] = metrics.state_dict()
+    with open(os.path.join(tmp, MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    old = path.rstrip(os.sep) + ".old"
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+
+def has_checkpoint(path):
+    return path is not None and os.path.exists(os.path.join(path, MANIFEST))
+
+
+def restore_policy(path, policy, mmap_mode="c"):
+    # Loads a checkpoint's policy state into a policy built with the same
+    # configuration; this alone warm-starts a fresh run from a saved posterior.
+    policy = getattr(policy, "__wrapped__", policy)
+    manifest = read_manifest(path)
+    if manifest["policy"] != type(policy).__name__:
+        raise ValueError(f"checkpoint holds a {manifest['policy']}, not a {type(policy).__name__}")
+    arrays = {
+        name: np.load(os.path.join(path, f"policy.{name}.npy"), mmap_mode=mmap_mode)
+        for name in manifest["arrays"]
+    }
+    for name, field in manifest["fields"].items():
+        if "sparse" in field:
+            store = SparseArmCounts(**field["sparse"])
+            for key in list(arrays):
+                if key.startswith(name + "."):
+                    setattr(store, key[len(name) + 1 :], arrays.pop(key))
+            setattr(policy, name, store)
+        elif "deque" in field:
+            setattr(policy, name, deque(np.array(arrays.pop(name))))
+        elif "generator" in field:
+            setattr(policy, name, _generator_from_state(field["generator"]))
+        elif "generators" in field:
+            setattr(policy, name, [_generator_from_state(s) for s in field["generators"]])
+        else:
+            setattr(policy, name, field["value"])
+    for name, arr in arrays.items():
+        current = getattr(policy, name, None)
+        if isinstance(current, np.ndarray) and current.shape != arr.shape:
+            raise ValueError(f"checkpoint {name} has shape {arr.shape}, policy expects {current.shape}")
+        setattr(policy, name, arr)
+    return manifest
+
+
+def load_checkpoint(path, policy, mmap_mode="c", metrics=None):
+    # Restores the policy (and a StreamingMetrics, if given) in place; returns
+    # (rng, round_index, successes).
+    manifest = restore_policy(path, policy, mmap_mode=mmap_mode)
+    if metrics is not None and "metrics" in manifest:
+        metrics.load_state_dict(manifest["metrics"])
+    successes = np.load(os.path.join(path, "successes.npy"), mmap_mode=mmap_mode)
+    return _generator_from_state(manifest["rng"]), manifest["round"], successes
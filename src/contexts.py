@@ -0,0 +1,188 @@
+import os
+
+import numpy as np
+
+
+class ContextBatch:
+    # Contexts stored as contiguous arrays: users (T,), cohorts (T,), videos (T, Kv)
+    # and brands (T, Kb). Indexing with an int yields the legacy
+    # (user, cohort_id, videos, brands) tuple; slices and index arrays yield batches.
+    def __init__(self, users, cohorts, videos, brands):
+        users = np.asanyarray(users)
+        cohorts = np.asanyarray(cohorts)
+        videos = np.asanyarray(videos)
+        brands = np.asanyarray(brands)
+        if users.ndim != 1 or cohorts.shape != users.shape:
+            raise ValueError("users and cohorts must be 1-D arrays of the same length")
+        if videos.ndim != 2 or brands.ndim != 2:
+            raise ValueError("videos and brands must be 2-D (rounds x candidates) arrays")
+        if len(videos) != len(users) or len(brands) != len(users):
+            raise ValueError("videos and brands must have one row per round")
+        self.users = users
+        self.cohorts = cohorts
+        self.videos = videos
+        self.brands = brands
+
+    def __len__(self):
+        return len(self.users)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            return int(self.users[idx]), int(self.cohorts[idx]), self.videos[idx], self.brands[idx]
+        return ContextBatch(self.users[idx], self.cohorts[idx], self.videos[idx], self.brands[idx])
+
+    def __iter__(self):
+        for u, c, vids, brands in zip(self.users.tolist(), self.cohorts.tolist(), self.videos, self.brands):
+            yield u, c, vids, brands
+
+    @property
+    def num_candidate_videos(self):
+        return self.videos.shape[1]
+
+    @property
+    def num_candidate_brands(self):
+        return self.brands.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.users.nbytes + self.cohorts.nbytes + self.videos.nbytes + self.brands.nbytes
+
+    @classmethod
+    def from_tuples(cls, contexts):
+        contexts = list(contexts)
+        if not contexts:
+            return cls(
+                np.zeros(0, dtype=int), np.zeros(0, dtype=int),
+                np.zeros((0, 0), dtype=int), np.zeros((0, 0), dtype=int),
+            )
+        users, cohorts, videos, brands = zip(*contexts)
+        return cls(np.array(users), np.array(cohorts), np.stack(videos), np.stack(brands))
+
+    def to_tuples(self):
+        return list(self)
+
+    def save(self, path):
+        # "*.npz" writes a single archive; any other path is a directory of .npy
+        # files that load() can memory-map.
+        arrays = {"users": self.users, "cohorts": self.cohorts, "videos": self.videos, "brands": self.brands}
+        if path.endswith(".npz"):
+            np.savez(path, **arrays)
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, arr in arrays.items():
+            np.save(os.path.join(path, name + ".npy"), arr)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                return cls(data["users"], data["cohorts"], data["videos"], data["brands"])
+        return cls(
+            *[
+                np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+                for name in ("users", "cohorts", "videos", "brands")
+            ]
+        )
+
+
+def as_context_batch(contexts):
+    if isinstance(contexts, ContextBatch):
+        return contexts
+    return ContextBatch.from_tuples(contexts)
+
+
+def _sample_without_replacement(rng, n, k, rows):
+    # Each row holds k distinct ints from [0, n). Dense draws take the k smallest
+    # of n random keys per row; sparse ones draw with replacement and redraw the
+    # rows that collided, which keeps memory at rows x k for huge catalogs.
+    if n <= 4 * k:
+        keys = rng.random((rows, n))
+        return np.argpartition(keys, k - 1, axis=1)[:, :k] if k < n else np.argsort(keys, axis=1)
+    out = rng.integers(n, size=(rows, k))
+    while True:
+        srt = np.sort(out, axis=1)
+        dup = (srt[:, 1:] == srt[:, :-1]).any(axis=1)
+        if not dup.any():
+            return out
+        out[dup] = rng.integers(n, size=(int(dup.sum()), k))
+
+
+def iter_contexts(
+    world,
+    num_rounds,
+    candidate_videos,
+    candidate_brands,
+    user_to_cohort,
+    segment_len=1,
+    seed=0,
+    chunk_size=65_536,
+):
+    # Lazily yields ContextBatch chunks of at most chunk_size rounds. Users, videos
+    # and brands use independent child streams of seed; output is deterministic
+    # for a given (seed, chunk_size). As in make_contexts, a new user is drawn at
+    # every segment_len boundary, and segment_len=1 keeps the first user throughout.
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be >= 1")
+    user_rng, video_rng, brand_rng = [
+        np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3)
+    ]
+    user_to_cohort = np.asarray(user_to_cohort)
+    num_brands = min(candidate_brands, world.num_brands)
+    last_segment = -1
+    last_user = None
+    for start in range(0, num_rounds, chunk_size):
+        stop = min(start + chunk_size, num_rounds)
+        rows = stop - start
+        if segment_len > 1:
+            segments = np.arange(start, stop) // segment_len
+        else:
+            segments = np.zeros(rows, dtype=int)
+        first = int(segments[0])
+        segment_users = user_rng.integers(world.num_users, size=int(segments[-1]) - last_segment)
+        if first == last_segment:
+            segment_users = np.concatenate([[last_user], segment_users])
+        users = segment_users[segments - first]
+        last_segment, last_user = int(segments[-1]), int(users[-1])
+
+        videos = _sample_without_replacement(video_rng, world.num_videos, candidate_videos, rows)
+        if candidate_brands >= world.num_brands:
+            brands = np.tile(np.arange(world.num_brands, dtype=int), (rows, 1))
+        else:
+            brands = _sample_without_replacement(brand_rng, world.num_brands, num_brands, rows)
+        yield ContextBatch(users, user_to_cohort[users].astype(int), videos, brands)
+
+
+def sample_contexts(
+    world,
+    num_rounds,
+    candidate_videos,
+    candidate_brands,
+    user_to_cohort,
+    segment_len=1,
+    seed=0,
+    chunk_size=65_536,
+):
+    chunks = list(
+        iter_contexts(
+            world,
+            num_rounds,
+            candidate_videos,
+            candidate_brands,
+            user_to_cohort,
+            segment_len=segment_len,
+            seed=seed,
+            chunk_size=chunk_size,
+        )
+    )
+    if not chunks:
+        return ContextBatch.from_tuples([])
+    return concat_context_batches(chunks)
+
+
+def concat_context_batches(batches):
+    return ContextBatch(
+        np.concatenate([c.users for c in batches]),
+        np.concatenate([c.cohorts for c in batches]),
+        np.concatenate([c.videos for c in batches]),
+        np.concatenate([c.brands for c in batches]),
+    )
@@ -0,0 +1,145 @@
+import tempfile
+
+import numpy as np
+
+# Largest grid kept in process memory; bigger grids are backed by a memmap so
+# resident memory stays bounded by the pages being touched.
+MAX_RESIDENT_BYTES = 256 * 2**20
+
+
+class CTRCache:
+    # True-CTR grid (T, Kv, Kb, 2) over every arm of one run's contexts, shared by
+    # acceptability stats, CTR-scoring policies and the reward step of each
+    # simulate_policy call so each (u, v, b, a) is scored once per run instead
+    # of once per policy. Rows are filled chunk_size contexts at a time on first
+    # access. With path, or when the grid exceeds max_bytes, it lives in a memmap
+    # (a .npy file at path, else an anonymous temporary file) rather than in
+    # memory. close() releases the grid once every consumer is done with it.
+    # The grid deliberately spans the whole run rather than a rolling window:
+    # each policy replays the run from round 0, so a window would rescore every
+    # row once per policy. Resident memory is bounded by max_bytes, but the
+    # backing file (and page cache) grows linearly with the number of rounds.
+    def __init__(self, world, contexts, chunk_size=4096, path=None, max_bytes=MAX_RESIDENT_BYTES):
+        self.world = world
+        self.contexts = contexts
+        self.chunk_size = chunk_size
+        shape = (len(contexts), contexts.num_candidate_videos, contexts.num_candidate_brands, 2)
+        if path is not None:
+            self.ctr = np.lib.format.open_memmap(path, mode="w+", dtype=float, shape=shape)
+        elif np.prod(shape) * np.dtype(float).itemsize > max_bytes:
+            self.ctr = np.memmap(tempfile.TemporaryFile(), dtype=float, mode="w+", shape=shape)
+        else:
+            self.ctr = np.empty(shape)
+        self.filled = np.zeros(-(-len(contexts) // chunk_size), dtype=bool)
+
+    @property
+    def nbytes(self):
+        return self.ctr.nbytes
+
+    @property
+    def in_memory(self):
+        return not isinstance(self.ctr, np.memmap)
+
+    def close(self):
+        # Drops the grid (a temporary backing file goes with it); the cache
+        # must not be used afterwards.
+        if isinstance(self.ctr, np.memmap):
+            self.ctr._mmap.close()
+        self.ctr = None
+
+    def _fill(self, chunk):
+        lo = chunk * self.chunk_size
+        rows = self.contexts[lo : lo + self.chunk_size]
+        self.ctr[lo : lo + len(rows)] = self.world.expected_ctr_grid(rows.users, rows.videos, rows.brands)
+        self.filled[chunk] = True
+
+    def grid(self, start, stop):
+        for chunk in range(start // self.chunk_size, -(-stop // self.chunk_size)):
+            if not self.filled[chunk]:
+                self._fill(chunk)
+        return self.ctr[start:stop]
+
+    def row(self, t):
+        if not self.filled[t // self.chunk_size]:
+            self._fill(t // self.chunk_size)
+        return self.ctr[t]
+
+    def positions(self, start, stop, videos, brands):
+        # Candidate positions of one (video, brand) per row of [start, stop), and
+        # whether every pair is actually among that row's candidates.
+        video_hit = self.contexts.videos[start:stop] == np.asarray(videos)[:, None]
+        brand_hit = self.contexts.brands[start:stop] == np.asarray(brands)[:, None]
+        found = bool(video_hit.any(axis=1).all() and brand_hit.any(axis=1).all())
+        return np.argmax(video_hit, axis=1), np.argmax(brand_hit, axis=1), found
+
+    def arm_ctr(self, start, stop, video_pos, brand_pos, actions):
+        return self.grid(start, stop)[np.arange(stop - start), video_pos, brand_pos, actions]
+
+
+class CachedWorld:
+    # World view that answers CTR queries for the current rounds from a CTRCache.
+    # simulate_policy seeks it to the round (or batch) being served; queries on
+    # exactly those contexts are read from the cache and anything else is passed
+    # through to the wrapped world, so policies need no cache awareness.
+    def __init__(self, world, cache):
+        self.world = world
+        self.cache = cache
+        self.seek(0, 0)
+
+    def __getattr__(self, name):
+        return getattr(self.world, name)
+
+    def seek(self, start, stop):
+        # Called every round, so the current rows are only sliced when a batched
+        # query needs them.
+        self.start, self.stop = start, stop
+
+    def _is_current(self, user_ids, candidate_videos=None, candidate_brands=None):
+        contexts = self.cache.contexts
+        users = np.asarray(user_ids)
+        if users.ndim == 0:
+            if self.stop - self.start != 1:
+                return False
+            users = users[None]
+            candidate_videos = None if candidate_videos is None else np.asarray(candidate_videos)[None]
+            candidate_brands = None if candidate_brands is None else np.asarray(candidate_brands)[None]
+        current = contexts.users[self.start : self.stop]
+        if users.shape != current.shape or not np.array_equal(users, current):
+            return False
+        if candidate_videos is None:
+            return True
+        return np.array_equal(candidate_videos, contexts.videos[self.start : self.stop]) and np.array_equal(
+            candidate_brands, contexts.brands[self.start : self.stop]
+        )
+
+    def expected_ctr_grid(self, user_ids, candidate_videos, candidate_brands):
+        if self._is_current(user_ids, candidate_videos, candidate_brands):
+            grid = self.cache.grid(self.start, self.stop)
+            return grid[0] if np.ndim(user_ids) == 0 else grid
+        return self.world.expected_ctr_grid(user_ids, candidate_videos, candidate_brands)
+
+    def _arm_ctr(self, video_ids, brand_ids, action_ids):
+        video_pos, brand_pos, found = self.cache.positions(self.start, self.stop, video_ids, brand_ids)
+        if not found:
+            return None
+        return self.cache.arm_ctr(self.start, self.stop, video_pos, brand_pos, action_ids)
+
+    def expected_ctr_batch(self, user_ids, video_ids, brand_ids, action_ids):
+        # One arm per current round (the reward step); other shapes pass through.
+        if np.ndim(video_ids) == 1 and np.shape(video_ids) == np.shape(user_ids) and self._is_current(user_ids):
+            ctr = self._arm_ctr(video_ids, brand_ids, action_ids)
+            if ctr is not None:
+                return ctr
+        return self.world.expected_ctr_batch(user_ids, video_ids, brand_ids, action_ids)
+
+    def expected_ctr(self, user_id, video_id, brand_id, action_id):
+        # The per-round reward step; looked up with Python scalars since numpy
+        # call overhead dominates at this size.
+        t = self.start
+        contexts = self.cache.contexts
+        if self.stop - t == 1 and user_id == contexts.users[t]:
+            videos = contexts.videos[t].tolist()
+            brands = contexts.brands[t].tolist()
+            if video_id in videos and brand_id in brands:
+                return float(self.cache.row(t)[videos.index(video_id), brands.index(brand_id), action_id])
+        return self.world.expected_ctr(user_id, video_id, brand_id, action_id)
@@ -0,0 +1,288 @@
+import argparse
+import csv
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .run_sim import make_world, make_contexts
+from .ctr_cache import CTRCache
+from .seed_sweep import run_policies
+
+# Every sweepable parameter with its default. A grid overrides any subset; each
+# task is one full assignment and yields one row of the results file.
+DEFAULTS = {
+    "seed": 0,
+    "rounds": 2000,
+    "candidate_videos": 12,
+    "candidate_brands": 5,
+    "num_cohorts": 1,
+    "num_users": 200,
+    "num_videos": 200,
+    "lazy_world": False,
+    "segment_len": 1,
+    "vectorized_contexts": False,
+    "eta": 0.35,
+    "gamma": 0.5,
+    "delta": 0.01,
+    "beta0": 0.0,
+    "impressions_per_pull": 1,
+    "batch_size": 1,
+}
+PARAMS = tuple(DEFAULTS)
+# What each built object depends on. World model parameters do not change its
+# random draws, so worlds that differ only in them share one set of contexts;
+# rounds, candidates and segmenting change only the contexts, so they share
+# one world. A CTR grid depends on both.
+DRAW_PARAMS = ("seed", "num_cohorts", "num_users", "num_videos", "lazy_world")
+MODEL_PARAMS = ("eta", "gamma", "delta", "beta0")
+WORLD_PARAMS = DRAW_PARAMS + MODEL_PARAMS
+CONTEXT_PARAMS = DRAW_PARAMS + (
+    "rounds",
+    "candidate_videos",
+    "candidate_brands",
+    "segment_len",
+    "vectorized_contexts",
+)
+CTR_PARAMS = CONTEXT_PARAMS + MODEL_PARAMS
+METRICS = ("rejected_frac", "better_frac", "random", "no_edit_greedy", "thompson", "ucb", "oracle_constrained")
+COLUMNS = PARAMS + METRICS
+
+
+def _key(task, names=PARAMS):
+    return tuple(task[name] for name in names)
+
+
+def expand_grid(grid, seeds=None):
+    # All combinations of grid ({param: [values]}) over the defaults; seeds, if
+    # given, is the innermost axis.
+    unknown = set(grid) - set(PARAMS)
+    if unknown:
+        raise ValueError(f"unknown grid parameters: {', '.join(sorted(unknown))}")
+    grid = dict(grid)
+    if seeds is not None:
+        grid["seed"] = list(seeds)
+    names = list(grid)
+    return [{**DEFAULTS, **dict(zip(names, values))} for values in itertools.product(*grid.values())]
+
+
+class BuildCache:
+    # Worlds, contexts and true-CTR grids built for one job, each keyed by the
+    # parameters it depends on, so tasks that differ only in e.g. eta or
+    # impressions_per_pull reuse the same contexts (and the same CTR grid when
+    # the world is shared). builds counts what was actually constructed.
+    def __init__(self):
+        self.worlds = {}
+        self.contexts = {}
+        self.ctr_caches = {}
+        self.builds = {"world": 0, "contexts": 0}
+
+    def world(self, task):
+        key = _key(task, WORLD_PARAMS)
+        if key not in self.worlds:
+            self.worlds[key] = make_world(
+                task["seed"],
+                task["num_cohorts"],
+                num_users=task["num_users"],
+                num_videos=task["num_videos"],
+                lazy=task["lazy_world"],
+                **{name: task[name] for name in MODEL_PARAMS},
+            )
+            self.builds["world"] += 1
+        return self.worlds[key]
+
+    def get_contexts(self, task):
+        key = _key(task, CONTEXT_PARAMS)
+        if key not in self.contexts:
+            world, user_to_cohort = self.world(task)
+            self.contexts[key] = make_contexts(
+                world,
+                task["rounds"],
+                task["candidate_videos"],
+                task["candidate_brands"],
+                user_to_cohort,
+                segment_len=task["segment_len"],
+                seed=task["seed"] + 1,
+                vectorized=task["vectorized_contexts"],
+            )
+            self.builds["contexts"] += 1
+        return self.contexts[key]
+
+    def ctr_cache(self, task):
+        key = _key(task, CTR_PARAMS)
+        if key not in self.ctr_caches:
+            self.ctr_caches[key] = CTRCache(self.world(task)[0], self.get_contexts(task))
+        return self.ctr_caches[key]
+
+    def release_ctr_cache(self, task):
+        # Frees the CTR grid of task's world and contexts once no task needs it.
+        cache = self.ctr_caches.pop(_key(task, CTR_PARAMS), None)
+        if cache is not None:
+            cache.close()
+
+
+def run_grid_task(task, cache=None):
+    cache = BuildCache() if cache is None else cache
+    world, _ = cache.world(task)
+    metrics = run_policies(
+        world,
+        cache.get_contexts(task),
+        task["seed"],
+        task["num_cohorts"],
+        task["impressions_per_pull"],
+        batch_size=task["batch_size"],
+        ctr_cache=cache.ctr_cache(task),
+    )
+    return {**task, **{k: float(v) for k, v in metrics.items()}}
+
+
+def run_grid_job(tasks):
+    # Tasks run in one process with one cache (see group_jobs). Tasks sharing a
+    # CTR grid run back to back and the grid is released after
+    # the last of them, so at most one grid is held at a time.
+    cache = BuildCache()
+    order = sorted(range(len(tasks)), key=lambda i: _key(tasks[i], CTR_PARAMS))
+    rows = [None] * len(tasks)
+    for n, i in enumerate(order):
+        rows[i] = run_grid_task(tasks[i], cache)
+        if n + 1 == len(order) or _key(tasks[order[n + 1]], CTR_PARAMS) != _key(tasks[i], CTR_PARAMS):
+            cache.release_ctr_cache(tasks[i])
+    return rows
+
+
+def _parse(name, text):
+    default = DEFAULTS.get(name, 0.0)
+    if isinstance(default, bool):
+        return text in ("True", "true", "1")
+    return type(default)(text)
+
+
+def append_rows(path, rows):
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction="ignore")
+        if new:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_rows(path):
+    # One row per task; a task written more than once keeps its latest row.
+    if not os.path.exists(path):
+        return []
+    rows = {}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            row = {name: _parse(name, value) for name, value in row.items()}
+            rows[_key(row)] = row
+    return list(rows.values())
+
+
+def load_results(path, columns=None, **where):
+    # Columns of the results file as {name: array}, restricted to rows whose
+    # parameters match where (a value or a list of accepted values). Safe to
+    # call while a sweep is still appending.
+    rows = read_rows(path)
+    for name, accepted in where.items():
+        accepted = accepted if isinstance(accepted, (list, tuple, set)) else [accepted]
+        rows = [row for row in rows if row[name] in accepted]
+    return {name: np.array([row[name] for row in rows]) for name in (columns or COLUMNS)}
+
+
+def group_jobs(tasks, indices, workers=1):
+    # Jobs (lists of task indices) for run_grid. One process shares every build
+    # of tasks with the same world draws; a pool gets one job per CTR grid so
+    # tasks differing in any world, context or model parameter run in parallel,
+    # each job rebuilding only its (cheap) world and contexts.
+    names = DRAW_PARAMS if workers == 1 else CTR_PARAMS
+    groups = {}
+    for i in indices:
+        groups.setdefault(_key(tasks[i], names), []).append(i)
+    return list(groups.values())
+
+
+def run_grid(tasks, path, workers=1, resume=False):
+    # Tasks are grouped into jobs (see group_jobs) and the jobs spread over a
+    # process pool; rows are appended to the results file at path
+    # as jobs finish. With resume=True, tasks already in the file are skipped;
+    # otherwise they are rerun and their new rows supersede the old ones, so the
+    # file is never truncated. Returns the rows of tasks, in task order.
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    done = {_key(row): row for row in read_rows(path)} if resume else {}
+    rows = {i: done[_key(task)] for i, task in enumerate(tasks) if _key(task) in done}
+    jobs = group_jobs(tasks, [i for i in range(len(tasks)) if i not in rows], workers)
+
+    def finish(job, job_rows):
+        append_rows(path, job_rows)
+        rows.update(zip(job, job_rows))
+
+    # A failing job is reported and skipped on either path, so one bad task does
+    # not abort the sweep; its tasks stay pending for a later resume.
+    def report(job, exc):
+        print(f"grid job of {len(job)} tasks (seed={tasks[job[0]]['seed']}) failed: {exc!r}")
+
+    if workers > 1 and jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_grid_job, [tasks[i] for i in job]): job for job in jobs}
+            for fut in as_completed(futures):
+                job = futures[fut]
+                try:
+                    result = fut.result()
+                except Exception as exc:
+                    report(job, exc)
+                    continue
+                finish(job, result)
+    else:
+        for job in jobs:
+            try:
+                result = run_grid_job([tasks[i] for i in job])
+            except Exception as exc:
+                report(job, exc)
+                continue
+            finish(job, result)
+    return [rows[i] for i in sorted(rows)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--param",
+        action="append",
+        default=[],
+        metavar="NAME=V1,V2,...",
+        help=f"grid axis; one of {', '.join(PARAMS)}",
+    )
+    parser.add_argument("--seeds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--out", type=str, default="results/grid_sweep.csv")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        raise ValueError("workers must be >= 1")
+    grid = {}
+    for spec in args.param:
+        name, _, values = spec.partition("=")
+        if name not in DEFAULTS or not values:
+            raise ValueError(f"bad --param {spec!r}; expected NAME=V1,V2,... with NAME in {', '.join(PARAMS)}")
+        grid[name] = [_parse(name, v) for v in values.split(",")]
+    tasks = expand_grid(grid, seeds=range(args.seeds))
+    rows = run_grid(tasks, args.out, workers=args.workers, resume=args.resume)
+    print(f"Saved {len(rows)} of {len(tasks)} runs to {os.path.abspath(args.out)}")
+
+    # Seed-averaged click rates per grid point.
+    axes = [name for name in grid if name != "seed"]
+    points = {}
+    for row in rows:
+        points.setdefault(tuple(row[name] for name in axes), []).append(row)
+    policies = METRICS[2:]
+    print("| " + " | ".join(axes + list(policies)) + " |")
+    print("|" + "---|" * (len(axes) + len(policies)))
+    for point, point_rows in points.items():
+        means = [np.mean([row[p] for row in point_rows]) for p in policies]
+        print("| " + " | ".join([str(v) for v in point] + [f"{m:.4f}" for m in means]) + " |")
+
+
+if __name__ == "__main__":
+    main()
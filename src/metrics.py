@@ -0,0 +1,188 @@
+import csv
+import os
+
+import numpy as np
+
+from .policies import feasible_mask
+from .world import ACTION_EDIT
+
+
+def oracle_ctr(world, contexts, ctr=None):
+    # Expected CTR of the best feasible arm for each context (the constrained
+    # oracle); ctr may pass the contexts' precomputed CTR grid.
+    if ctr is None:
+        ctr = world.expected_ctr_grid(contexts.users, contexts.videos, contexts.brands)
+    ctr = np.where(feasible_mask(world, contexts.videos, contexts.brands), ctr, -np.inf)
+    return ctr.reshape(len(ctr), -1).max(axis=1)
+
+
+def lttb(x, y, num_points):
+    # Largest-Triangle-Three-Buckets downsampling of (x, y) to num_points points:
+    # the first and last points are kept and each bucket in between keeps the
+    # point spanning the largest triangle with its neighbours' picks. Series no
+    # longer than num_points are returned unchanged.
+    if num_points < 3:
+        raise ValueError("num_points must be >= 3")
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n <= num_points:
+        return x, y
+    edges = np.linspace(1, n - 1, num_points - 1).astype(int)
+    keep = np.empty(num_points, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(num_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[hi : edges[i + 2]].mean(), y[hi : edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def _read_rows(path):
+    with open(path, newline="") as f:
+        return [tuple(float(x) for x in row) for row in list(csv.reader(f))[1:]]
+
+
+def read_series(path):
+    # Snapshots streamed by StreamingMetrics(stream_path=path) as {field: array}.
+    cols = np.array(_read_rows(path), dtype=float).reshape(-1, len(StreamingMetrics.FIELDS))
+    return {name: cols[:, i] for i, name in enumerate(StreamingMetrics.FIELDS)}
+
+
+def seed_band(series_list, field="click_rate"):
+    # Mean and mean +/- one standard deviation of field across runs that share
+    # snapshot rounds (same length and checkpoint schedule), e.g. one per seed.
+    # Returns (rounds, mean, low, high).
+    rounds = series_list[0]["round"]
+    if any(not np.array_equal(s["round"], rounds) for s in series_list):
+        raise ValueError("series must share snapshot rounds")
+    values = np.stack([s[field] for s in series_list])
+    mean = values.mean(axis=0)
+    std = values.std(axis=0, ddof=1) if len(values) > 1 else np.zeros_like(mean)
+    return rounds, mean, mean - std, mean + std
+
+
+class StreamingMetrics:
+    # Online accumulator for one simulated policy: running click rate, expected
+    # regret against the constrained oracle (per round and cumulative, in
+    # impressions) and the share of rounds served with an edit. Totals are O(1);
+    # a snapshot of every metric is taken at checkpoint rounds, every
+    # checkpoint_every rounds or, by default, log-spaced with ratio growth.
+    # Snapshots are kept in memory or, with stream_path, appended to a CSV.
+    FIELDS = ("round", "click_rate", "regret", "cumulative_regret", "edit_share")
+
+    def __init__(self, impressions_per_pull=1, checkpoint_every=None, growth=1.05, stream_path=None):
+        if growth <= 1.0:
+            raise ValueError("growth must be > 1")
+        self.impressions_per_pull = impressions_per_pull
+        self.checkpoint_every = checkpoint_every
+        self.growth = growth
+        self.stream_path = stream_path
+        self.rounds = 0
+        self.clicks = 0.0
+        self.edits = 0
+        self.cumulative_regret = 0.0
+        self.regret = 0.0
+        self.next_checkpoint = checkpoint_every or 1
+        self.last_recorded = 0
+        self.history = []
+        if stream_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(stream_path)), exist_ok=True)
+
+    @property
+    def click_rate(self):
+        return self.clicks / max(self.rounds * self.impressions_per_pull, 1)
+
+    @property
+    def edit_share(self):
+        return self.edits / max(self.rounds, 1)
+
+    def _advance(self, point):
+        if self.checkpoint_every:
+            return point + self.checkpoint_every
+        return max(point + 1, int(np.ceil(point * self.growth)))
+
+    def _record(self, row):
+        if self.stream_path is None:
+            self.history.append(row)
+        else:
+            with open(self.stream_path, "a" if self.last_recorded else "w", newline="") as f:
+                writer = csv.writer(f)
+                if not self.last_recorded:
+                    writer.writerow(self.FIELDS)
+                writer.writerow(row)
+        self.last_recorded = row[0]
+
+    def update(self, successes, chosen_ctr, best_ctr, actions):
+        # One call per round (scalars) or per batch of consecutive rounds (arrays).
+        successes = np.atleast_1d(np.asarray(successes, dtype=float))
+        regret = self.impressions_per_pull * (np.atleast_1d(best_ctr) - np.atleast_1d(chosen_ctr))
+        edits = np.atleast_1d(actions) == ACTION_EDIT
+        n = len(successes)
+        if self.next_checkpoint <= self.rounds + n:
+            clicks = self.clicks + np.cumsum(successes)
+            cumulative = self.cumulative_regret + np.cumsum(regret)
+            edit_count = self.edits + np.cumsum(edits)
+            while self.next_checkpoint <= self.rounds + n:
+                i = self.next_checkpoint - self.rounds - 1
+                t = self.next_checkpoint
+                self._record(
+                    (
+                        t,
+                        float(clicks[i]) / (t * self.impressions_per_pull),
+                        float(regret[i]),
+                        float(cumulative[i]),
+                        float(edit_count[i]) / t,
+                    )
+                )
+                self.next_checkpoint = self._advance(self.next_checkpoint)
+        self.rounds += n
+        self.clicks += float(successes.sum())
+        self.edits += int(edits.sum())
+        self.cumulative_regret += float(regret.sum())
+        self.regret = float(regret[-1])
+
+    def finalize(self):
+        # Snapshot the last round so series always end at the run's length.
+        if self.rounds and self.last_recorded != self.rounds:
+            self._record(
+                (self.rounds, self.click_rate, self.regret, self.cumulative_regret, self.edit_share)
+            )
+
+    def _read_stream(self):
+        if not self.last_recorded:
+            return []
+        return _read_rows(self.stream_path)
+
+    def series(self):
+        # Recorded snapshots as {field: array}, read back from disk when streaming.
+        if self.stream_path is not None and self.last_recorded:
+            return read_series(self.stream_path)
+        cols = np.array(self.history, dtype=float).reshape(-1, len(self.FIELDS))
+        return {name: cols[:, i] for i, name in enumerate(self.FIELDS)}
+
+    def state_dict(self):
+        state = dict(vars(self))
+        state["history"] = [list(row) for row in self.history]
+        return state
+
+    def load_state_dict(self, state):
+        # A streamed file may hold snapshots past the restored round (written
+        # after the checkpoint); they are dropped so the run can append again.
+        stream_path = self.stream_path
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.history = [tuple(row) for row in state["history"]]
+        self.stream_path = stream_path
+        if stream_path is not None and self.last_recorded:
+            rows = [row for row in self._read_stream() if row[0] <= self.last_recorded]
+            with open(stream_path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(self.FIELDS)
+                writer.writerows((int(row[0]),) + row[1:] for row in rows)
@@ -0,0 +1,198 @@
+import argparse
+import os
+
+import numpy as np
+
+from .contexts import ContextBatch, as_context_batch
+from .run_sim import make_world, make_contexts, make_policies, policy_factories, simulate_policy
+
+ESTIMATORS = ("replay", "ips", "snips", "dr", "dm")
+
+
+class BanditLog:
+    # Columnar log of a simulated run: the contexts plus, per round, the chosen
+    # arm as candidate positions, the logging policy's propensity for it and the
+    # clicks out of impressions_per_pull. Filled by simulate_policy(..., log=log);
+    # propensities of sampling policies are Monte Carlo estimates from
+    # num_samples draws on the log's own rng.
+    COLUMNS = ("video_pos", "brand_pos", "action", "propensity", "successes")
+
+    def __init__(self, contexts, impressions_per_pull=1, num_samples=256, seed=0):
+        self.contexts = as_context_batch(contexts)
+        self.impressions_per_pull = impressions_per_pull
+        self.num_samples = num_samples
+        self.rng = np.random.default_rng(seed)
+        rounds = len(self.contexts)
+        self.video_pos = np.zeros(rounds, dtype=np.int32)
+        self.brand_pos = np.zeros(rounds, dtype=np.int32)
+        self.action = np.zeros(rounds, dtype=np.int8)
+        self.propensity = np.zeros(rounds)
+        self.successes = np.zeros(rounds, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.contexts)
+
+    def record(self, start, probs, videos, brands, actions, successes):
+        # probs are the logging policy's arm_probabilities for rounds
+        # [start, start + len(videos)), taken before it selected.
+        rows = slice(start, start + len(videos))
+        ctx = self.contexts[rows]
+        video_pos = np.argmax(ctx.videos == np.asarray(videos)[:, None], axis=1)
+        brand_pos = np.argmax(ctx.brands == np.asarray(brands)[:, None], axis=1)
+        self.video_pos[rows] = video_pos
+        self.brand_pos[rows] = brand_pos
+        self.action[rows] = actions
+        self.propensity[rows] = probs[np.arange(len(video_pos)), video_pos, brand_pos, actions]
+        self.successes[rows] = successes
+
+    @property
+    def arms(self):
+        # Chosen (video, brand, action) ids per round.
+        rows = np.arange(len(self))
+        return (
+            self.contexts.videos[rows, self.video_pos],
+            self.contexts.brands[rows, self.brand_pos],
+            self.action.astype(int),
+        )
+
+    @property
+    def rewards(self):
+        return self.successes / self.impressions_per_pull
+
+    @property
+    def nbytes(self):
+        return self.contexts.nbytes + sum(getattr(self, name).nbytes for name in self.COLUMNS)
+
+    def save(self, path):
+        # A directory of .npy columns plus the contexts, memory-mappable by load().
+        os.makedirs(path, exist_ok=True)
+        self.contexts.save(os.path.join(path, "contexts"))
+        for name in self.COLUMNS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        np.save(os.path.join(path, "impressions_per_pull.npy"), np.array(self.impressions_per_pull))
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        contexts = ContextBatch.load(os.path.join(path, "contexts"), mmap_mode=mmap_mode)
+        log = cls(contexts, int(np.load(os.path.join(path, "impressions_per_pull.npy"))))
+        for name in cls.COLUMNS:
+            setattr(log, name, np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode))
+        return log
+
+
+def _empty_totals():
+    return {"matches": 0, "replay": 0.0, "w": 0.0, "wr": 0.0, "dr": 0.0, "dm": 0.0}
+
+
+def evaluate(log, world, policies, num_samples=256, seed=0, chunk_size=4096, min_propensity=1e-3):
+    # Off-policy estimates of each (frozen) policy's per-impression click rate
+    # from one pass over the log; every chunk of contexts is scored for all
+    # policies at once. World.expected_ctr is the reward model for DR and DM.
+    # Logged propensities are floored at min_propensity (clipped IPS), which
+    # also guards Monte Carlo estimates that came out as zero. Replay keeps the
+    # rounds where an arm drawn from the target policy matches the logged one.
+    rng = np.random.default_rng(seed)
+    totals = {name: _empty_totals() for name in policies}
+    for start in range(0, len(log), chunk_size):
+        stop = min(start + chunk_size, len(log))
+        ctx = log.contexts[start:stop]
+        n = stop - start
+        arm = (np.arange(n), log.video_pos[start:stop], log.brand_pos[start:stop], log.action[start:stop])
+        reward = log.successes[start:stop] / log.impressions_per_pull
+        mu = np.maximum(log.propensity[start:stop], min_propensity)
+        q = world.expected_ctr_grid(ctx.users, ctx.videos, ctx.brands)
+        q_logged = q[arm]
+        logged_flat = np.ravel_multi_index(arm[1:], q.shape[1:])
+        for name, policy in policies.items():
+            pi = policy.arm_probabilities(world, ctx, rng=rng, num_samples=num_samples)
+            w = pi[arm] / mu
+            dm = (pi * q).sum(axis=(1, 2, 3))
+            cum = pi.reshape(n, -1).cumsum(axis=1)
+            drawn = (cum < rng.random(n)[:, None] * cum[:, -1:]).sum(axis=1)
+            match = drawn == logged_flat
+            t = totals[name]
+            t["matches"] += int(match.sum())
+            t["replay"] += float(reward[match].sum())
+            t["w"] += float(w.sum())
+            t["wr"] += float((w * reward).sum())
+            t["dr"] += float((dm + w * (reward - q_logged)).sum())
+            t["dm"] += float(dm.sum())
+
+    rounds = max(len(log), 1)
+    return {
+        name: {
+            "replay": t["replay"] / t["matches"] if t["matches"] else float("nan"),
+            "replay_matches": t["matches"],
+            "ips": t["wr"] / rounds,
+            "snips": t["wr"] / t["w"] if t["w"] > 0 else float("nan"),
+            "dr": t["dr"] / rounds,
+            "dm": t["dm"] / rounds,
+        }
+        for name, t in totals.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5000)
+    parser.add_argument("--train-rounds", type=int, default=2000)
+    parser.add_argument("--candidate-videos", type=int, default=12)
+    parser.add_argument("--candidate-brands", type=int, default=5)
+    parser.add_argument("--num-cohorts", type=int, default=1)
+    parser.add_argument("--impressions-per-pull", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--logging-policy", type=str, default="random")
+    parser.add_argument("--num-samples", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-dir", type=str, default=None)
+    args = parser.parse_args()
+
+    world, user_to_cohort = make_world(args.seed, args.num_cohorts)
+    contexts = make_contexts(
+        world,
+        args.rounds + args.train_rounds,
+        args.candidate_videos,
+        args.candidate_brands,
+        user_to_cohort,
+        seed=args.seed + 1,
+        vectorized=True,
+    )
+    train, logged = contexts[: args.train_rounds], contexts[args.train_rounds :]
+
+    logging_policy = policy_factories(world, args.num_cohorts, args.seed)[args.logging_policy]()
+    log = BanditLog(logged, args.impressions_per_pull, num_samples=args.num_samples, seed=args.seed + 20)
+    simulate_policy(
+        world,
+        logging_policy,
+        logged,
+        seed=args.seed + 10,
+        impressions_per_pull=args.impressions_per_pull,
+        batch_size=args.batch_size,
+        log=log,
+    )
+    if args.log_dir:
+        log.save(args.log_dir)
+    print(f"Logged {len(log)} rounds with {args.logging_policy} ({log.nbytes / 2**20:.2f} MiB)")
+
+    # Targets learn on separate contexts and are then evaluated frozen.
+    targets = make_policies(world, args.num_cohorts, args.seed + 100)
+    if args.train_rounds:
+        for policy in targets.values():
+            simulate_policy(
+                world,
+                policy,
+                train,
+                seed=args.seed + 11,
+                impressions_per_pull=args.impressions_per_pull,
+                batch_size=args.batch_size,
+            )
+    estimates = evaluate(log, world, targets, num_samples=args.num_samples, seed=args.seed + 21)
+
+    print("| Policy | Replay | IPS | SNIPS | DR | DM |")
+    print("|---|---|---|---|---|---|")
+    for name, est in estimates.items():
+        print(f"| {name} | " + " | ".join(f"{est[k]:.4f}" for k in ESTIMATORS) + " |")
+
+
+if __name__ == "__main__":
+    main()
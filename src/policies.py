@@ -1,16 +1,72 @@
+from collections import deque
+
 import numpy as np
 
+from .posteriors import SparseArmCounts
 from .world import ACTION_NO_EDIT, ACTION_EDIT
 
 
+def feasible_mask(world, candidate_videos, candidate_brands):
+    # (..., Kv, Kb, 2) mask of feasible arms; no-edit is always feasible.
+    vids = np.asarray(candidate_videos)
+    brands = np.asarray(candidate_brands)
+    accept = world.edit_acceptable_batch(vids[..., :, None], brands[..., None, :])
+    mask = np.ones(accept.shape + (2,), dtype=bool)
+    mask[..., ACTION_EDIT] = accept
+    return mask
+
+
+def feasible_arm_arrays(world, candidate_videos, candidate_brands):
+    # Feasible arms as (video, brand, action) int arrays, ordered video-major then
+    # brand then action, i.e. the same order as enumerate_feasible_arms.
+    vids = np.asarray(candidate_videos)
+    brands = np.asarray(candidate_brands)
+    iv, ib, a = np.nonzero(feasible_mask(world, vids, brands))
+    return vids[iv], brands[ib], a
+
+
+def _argmax_arms(scores, candidate_videos, candidate_brands):
+    # Row-wise argmax over (T, Kv, Kb, 2) scores -> (video, brand, action) arrays.
+    rows = np.arange(len(scores))
+    i, j, a = np.unravel_index(np.argmax(scores.reshape(len(scores), -1), axis=1), scores.shape[1:])
+    return candidate_videos[rows, i], candidate_brands[rows, j], a
+
+
 def enumerate_feasible_arms(world, candidate_videos, candidate_brands):
-    arms = []
-    for v in candidate_videos:
-        for b in candidate_brands:
-            arms.append((v, b, ACTION_NO_EDIT))
-            if world.is_edit_acceptable(v, b):
-                arms.append((v, b, ACTION_EDIT))
-    return arms
+    v, b, a = feasible_arm_arrays(world, candidate_videos, candidate_brands)
+    return list(zip(v.tolist(), b.tolist(), a.tolist()))
+
+
+# arm_probabilities(world, contexts, rng=None, num_samples=256) on every policy
+# returns the (T, Kv, Kb, 2) probability of selecting each arm in each context
+# under the policy's current state, without changing that state. Deterministic
+# policies give a one-hot argmax; sampling policies estimate the argmax
+# frequencies from num_samples draws on rng, never touching their own stream.
+def _argmax_probabilities(scores):
+    probs = np.zeros(scores.shape)
+    flat = probs.reshape(len(probs), -1)
+    flat[np.arange(len(flat)), np.argmax(scores.reshape(len(scores), -1), axis=1)] = 1.0
+    return probs
+
+
+def _sampled_probabilities(draw, mask, num_samples, block=16):
+    # draw(k) returns k score samples for the feasible arms, shape (k, mask.sum()).
+    rows, arms = len(mask), mask[0].size
+    offsets = np.arange(rows) * arms
+    counts = np.zeros(rows * arms)
+    scores = np.full((block,) + mask.shape, -np.inf)
+    done = 0
+    while done < num_samples:
+        k = min(block, num_samples - done)
+        scores[:k][:, mask] = draw(k)
+        best = np.argmax(scores[:k].reshape(k, rows, arms), axis=2)
+        counts += np.bincount((best + offsets).ravel(), minlength=rows * arms)
+        done += k
+    return counts.reshape(mask.shape) / num_samples
+
+
+def _evaluation_rng(rng):
+    return rng if rng is not None else np.random.default_rng(0)
 
 
 class RandomPolicy:
@@ -18,102 +74,557 @@ class RandomPolicy:
         self.rng = np.random.default_rng(seed)
 
     def select_arm(self, world, user_id, candidate_videos, candidate_brands, cohort_id=None):
-        arms = enumerate_feasible_arms(world, candidate_videos, candidate_brands)
-        return arms[self.rng.integers(len(arms))]
+        v, b, a = feasible_arm_arrays(world, candidate_videos, candidate_brands)
+        i = self.rng.integers(len(v))
+        return int(v[i]), int(b[i]), int(a[i])
+
+    def arm_probabilities(self, world, contexts, rng=None, num_samples=256):
+        mask = feasible_mask(world, contexts.videos, contexts.brands)
+        return mask / mask.sum(axis=(1, 2, 3), keepdims=True)
 
     def update(self, arm, successes, failures, cohort_id=None):
         return None
 
+    def update_batch(self, videos, brands, actions, successes, failures, cohort_ids=None):
+        return None
+
 
 class NoEditGreedyPolicy:
     def __init__(self, seed=0):
         self.rng = np.random.default_rng(seed)
 
     def select_arm(self, world, user_id, candidate_videos, candidate_brands, cohort_id=None):
-        best = None
-        best_ctr = -1.0
-        for v in candidate_videos:
-            for b in candidate_brands:
-                ctr = world.expected_ctr(user_id, v, b, ACTION_NO_EDIT)
-                if ctr > best_ctr:
-                    best_ctr = ctr
-                    best = (v, b, ACTION_NO_EDIT)
-        return best
+        vids = np.asarray(candidate_videos)
+        brands = np.asarray(candidate_brands)
+        ctr = world.expected_ctr_grid(user_id, vids, brands)[..., ACTION_NO_EDIT]
+        i, j = np.unravel_index(np.argmax(ctr), ctr.shape)
+        return int(vids[i]), int(brands[j]), ACTION_NO_EDIT
+
+    def select_arms(self, world, contexts):
+        return _argmax_arms(self._scores(world, contexts), contexts.videos, contexts.brands)
+
+    def _scores(self, world, contexts):
+        ctr = world.expected_ctr_grid(contexts.users, contexts.videos, contexts.brands)
+        scores = np.full(ctr.shape, -np.inf)
+        scores[..., ACTION_NO_EDIT] = ctr[..., ACTION_NO_EDIT]
+        return scores
+
+    def arm_probabilities(self, world, contexts, rng=None, num_samples=256):
+        return _argmax_probabilities(self._scores(world, contexts))
 
     def update(self, arm, successes, failures, cohort_id=None):
         return None
 
+    def update_batch(self, videos, brands, actions, successes, failures, cohort_ids=None):
+        return None
+
+
+# With backend="auto", Thompson policies whose dense posterior would exceed this
+# keep counts only for the arms they have touched (see SparseArmCounts).
+POSTERIOR_BUDGET_BYTES = 256 * 2**20
+
+
+def _resolve_backend(backend, dense_nbytes, budget_bytes):
+    if backend not in ("auto", "dense", "sparse"):
+        raise ValueError("backend must be 'auto', 'dense' or 'sparse'")
+    if backend == "auto":
+        return "dense" if dense_nbytes <= budget_bytes else "sparse"
+    return backend
+
+
+def _arm_keys(num_brands, videos, brands, cohorts=0, num_videos=0):
+    # Flat int64 arm ids ((c * V + v) * B + b) * 2 + a, with a trailing action axis.
+    base = (np.asarray(cohorts, dtype=np.int64) * num_videos + videos) * num_brands + brands
+    return (base * 2)[..., None] + np.arange(2)
+
 
 class ThompsonPolicy:
-    def __init__(self, num_videos, num_brands, seed=0, alpha0=1.0, beta0=1.0):
+    # RNG-stream contract: select_arm makes one rng.beta call per round, drawing one
+    # sample per feasible arm in feasible_arm_arrays order (video-major, then brand,
+    # then action). Since a vectorized Generator.beta call consumes the stream
+    # element by element, a seeded run draws exactly the samples of the scalar
+    # per-arm loop, and ties resolve to the first arm in that order.
+    #
+    # backend="dense" stores (V, B, 2) float alpha/beta arrays; backend="sparse"
+    # stores counts for touched arms only and adds the prior at lookup time. Both
+    # draw identical samples; "auto" picks dense while it fits budget_bytes.
+    def __init__(
+        self,
+        num_videos,
+        num_brands,
+        seed=0,
+        alpha0=1.0,
+        beta0=1.0,
+        backend="auto",
+        budget_bytes=POSTERIOR_BUDGET_BYTES,
+    ):
         self.rng = np.random.default_rng(seed)
-        self.alpha = np.full((num_videos, num_brands, 2), alpha0, dtype=float)
-        self.beta = np.full((num_videos, num_brands, 2), beta0, dtype=float)
+        self.num_videos = num_videos
+        self.num_brands = num_brands
+        self.alpha0 = alpha0
+        self.beta0 = beta0
+        self.backend = _resolve_backend(backend, 2 * num_videos * num_brands * 2 * 8, budget_bytes)
+        if self.backend == "dense":
+            self.alpha = np.full((num_videos, num_brands, 2), alpha0, dtype=float)
+            self.beta = np.full((num_videos, num_brands, 2), beta0, dtype=float)
+        else:
+            self.counts = SparseArmCounts()
+
+    def _posterior(self, videos, brands):
+        # alpha, beta for broadcastable video/brand index arrays, shape (..., 2).
+        if self.backend == "dense":
+            return self.alpha[videos, brands], self.beta[videos, brands]
+        succ, fail = self.counts.get(_arm_keys(self.num_brands, videos, brands))
+        return self.alpha0 + succ, self.beta0 + fail
 
     def select_arm(self, world, user_id, candidate_videos, candidate_brands, cohort_id=None):
-        best = None
-        best_sample = -1.0
-        for v in candidate_videos:
-            for b in candidate_brands:
-                a0 = self.alpha[v, b, ACTION_NO_EDIT]
-                b0 = self.beta[v, b, ACTION_NO_EDIT]
-                mu0 = self.rng.beta(a0, b0)
-                if mu0 > best_sample:
-                    best_sample = mu0
-                    best = (v, b, ACTION_NO_EDIT)
-                if world.is_edit_acceptable(v, b):
-                    a1 = self.alpha[v, b, ACTION_EDIT]
-                    b1 = self.beta[v, b, ACTION_EDIT]
-                    mu1 = self.rng.beta(a1, b1)
-                    if mu1 > best_sample:
-                        best_sample = mu1
-                        best = (v, b, ACTION_EDIT)
-        return best
+        vids = np.asarray(candidate_videos)
+        brands = np.asarray(candidate_brands)
+        mask = feasible_mask(world, vids, brands)
+        alpha, beta = self._posterior(vids[:, None], brands[None, :])
+        samples = np.full(mask.shape, -np.inf)
+        samples[mask] = self.rng.beta(alpha[mask], beta[mask])
+        i, j, a = np.unravel_index(np.argmax(samples), samples.shape)
+        return int(vids[i]), int(brands[j]), int(a)
+
+    def select_arms(self, world, contexts):
+        # One arm per context against the current posterior, drawing all rows'
+        # samples in a single rng.beta call; equals calling select_arm row by row.
+        vids = contexts.videos
+        brands = contexts.brands
+        mask = feasible_mask(world, vids, brands)
+        alpha, beta = self._posterior(vids[:, :, None], brands[:, None, :])
+        samples = np.full(mask.shape, -np.inf)
+        samples[mask] = self.rng.beta(alpha[mask], beta[mask])
+        return _argmax_arms(samples, vids, brands)
+
+    @property
+    def nbytes(self):
+        if self.backend == "dense":
+            return self.alpha.nbytes + self.beta.nbytes
+        return self.counts.nbytes
+
+    def arm_probabilities(self, world, contexts, rng=None, num_samples=256):
+        rng = _evaluation_rng(rng)
+        mask = feasible_mask(world, contexts.videos, contexts.brands)
+        alpha, beta = self._posterior(contexts.videos[:, :, None], contexts.brands[:, None, :])
+        alpha, beta = alpha[mask], beta[mask]
+        return _sampled_probabilities(lambda k: rng.beta(alpha, beta, size=(k, len(alpha))), mask, num_samples)
 
     def update(self, arm, successes, failures, cohort_id=None):
         v, b, a = arm
-        self.alpha[v, b, a] += successes
-        self.beta[v, b, a] += failures
+        if self.backend == "dense":
+            self.alpha[v, b, a] += successes
+            self.beta[v, b, a] += failures
+        else:
+            self.update_batch([v], [b], [a], [successes], [failures])
+
+    def update_batch(self, videos, brands, actions, successes, failures, cohort_ids=None):
+        if self.backend == "dense":
+            np.add.at(self.alpha, (videos, brands, actions), successes)
+            np.add.at(self.beta, (videos, brands, actions), failures)
+            return
+        keys = _arm_keys(self.num_brands, np.asarray(videos), np.asarray(brands))
+        keys = np.take_along_axis(keys, np.asarray(actions)[:, None], axis=-1)
+        self.counts.add(keys, successes, failures)
 
 
 class CohortThompsonPolicy:
-    def __init__(self, num_cohorts, num_videos, num_brands, seed=0, alpha0=1.0, beta0=1.0):
+    # One Beta-Bernoulli bandit per cohort in a single (C, V, B, 2) store of uint32
+    # success/failure counts; the Beta(alpha0, beta0) prior is added at sample
+    # time. Each cohort keeps its own Generator (seeded as before), so draws match
+    # a per-cohort ThompsonPolicy exactly. nbytes reports the store's footprint.
+    # backend="sparse" (or "auto" over budget_bytes) keys the counts by
+    # (cohort, video, brand, action) and keeps only touched arms.
+    def __init__(
+        self,
+        num_cohorts,
+        num_videos,
+        num_brands,
+        seed=0,
+        alpha0=1.0,
+        beta0=1.0,
+        backend="auto",
+        budget_bytes=POSTERIOR_BUDGET_BYTES,
+    ):
         rng = np.random.default_rng(seed)
         seeds = rng.integers(0, 2**31 - 1, size=num_cohorts)
-        self.policies = [
-            ThompsonPolicy(num_videos, num_brands, seed=int(s), alpha0=alpha0, beta0=beta0)
-            for s in seeds
-        ]
+        self.rngs = [np.random.default_rng(int(s)) for s in seeds]
+        self.num_videos = num_videos
+        self.num_brands = num_brands
+        self.alpha0 = alpha0
+        self.beta0 = beta0
+        shape = (num_cohorts, num_videos, num_brands, 2)
+        self.backend = _resolve_backend(backend, 2 * int(np.prod(shape)) * 4, budget_bytes)
+        if self.backend == "dense":
+            self.successes = np.zeros(shape, dtype=np.uint32)
+            self.failures = np.zeros(shape, dtype=np.uint32)
+        else:
+            self.counts = SparseArmCounts()
+
+    @property
+    def alpha(self):
+        return self.alpha0 + self.successes
+
+    @property
+    def beta(self):
+        return self.beta0 + self.failures
+
+    @property
+    def nbytes(self):
+        if self.backend == "dense":
+            return self.successes.nbytes + self.failures.nbytes
+        return self.counts.nbytes
+
+    def _posterior(self, cohorts, videos, brands):
+        if self.backend == "dense":
+            idx = (cohorts, videos, brands)
+            return self.alpha0 + self.successes[idx], self.beta0 + self.failures[idx]
+        keys = _arm_keys(self.num_brands, videos, brands, cohorts, self.num_videos)
+        succ, fail = self.counts.get(keys)
+        return self.alpha0 + succ, self.beta0 + fail
 
     def select_arm(self, world, user_id, candidate_videos, candidate_brands, cohort_id=None):
         if cohort_id is None:
             raise ValueError("cohort_id required for CohortThompsonPolicy")
-        return self.policies[cohort_id].select_arm(
-            world, user_id, candidate_videos, candidate_brands, cohort_id=cohort_id
+        vids = np.asarray(candidate_videos)
+        brands = np.asarray(candidate_brands)
+        mask = feasible_mask(world, vids, brands)
+        alpha, beta = self._posterior(cohort_id, vids[:, None], brands[None, :])
+        samples = np.full(mask.shape, -np.inf)
+        samples[mask] = self.rngs[cohort_id].beta(alpha[mask], beta[mask])
+        i, j, a = np.unravel_index(np.argmax(samples), samples.shape)
+        return int(vids[i]), int(brands[j]), int(a)
+
+    def select_arms(self, world, contexts):
+        # Batched select_arm: counts for every row are gathered at once and each
+        # cohort present draws its rows' samples in one call on its own stream.
+        vids = contexts.videos
+        brands = contexts.brands
+        cohorts = np.asarray(contexts.cohorts)
+        mask = feasible_mask(world, vids, brands)
+        alpha, beta = self._posterior(cohorts[:, None, None], vids[:, :, None], brands[:, None, :])
+        samples = np.full(mask.shape, -np.inf)
+        for c in np.unique(cohorts).tolist():
+            rows = cohorts == c
+            draws = np.full(mask[rows].shape, -np.inf)
+            draws[mask[rows]] = self.rngs[c].beta(alpha[rows][mask[rows]], beta[rows][mask[rows]])
+            samples[rows] = draws
+        return _argmax_arms(samples, vids, brands)
+
+    def arm_probabilities(self, world, contexts, rng=None, num_samples=256):
+        rng = _evaluation_rng(rng)
+        mask = feasible_mask(world, contexts.videos, contexts.brands)
+        alpha, beta = self._posterior(
+            np.asarray(contexts.cohorts)[:, None, None], contexts.videos[:, :, None], contexts.brands[:, None, :]
         )
+        alpha, beta = alpha[mask], beta[mask]
+        return _sampled_probabilities(lambda k: rng.beta(alpha, beta, size=(k, len(alpha))), mask, num_samples)
 
     def update(self, arm, successes, failures, cohort_id=None):
         if cohort_id is None:
             raise ValueError("cohort_id required for CohortThompsonPolicy")
-        self.policies[cohort_id].update(arm, successes, failures, cohort_id=cohort_id)
+        v, b, a = arm
+        if self.backend == "dense":
+            self.successes[cohort_id, v, b, a] += successes
+            self.failures[cohort_id, v, b, a] += failures
+        else:
+            self.update_batch([v], [b], [a], [successes], [failures], cohort_ids=[cohort_id])
+
+    def update_batch(self, videos, brands, actions, successes, failures, cohort_ids=None):
+        if cohort_ids is None:
+            raise ValueError("cohort_ids required for CohortThompsonPolicy")
+        if self.backend == "dense":
+            idx = (cohort_ids, videos, brands, actions)
+            np.add.at(self.successes, idx, successes)
+            np.add.at(self.failures, idx, failures)
+            return
+        keys = _arm_keys(
+            self.num_brands, np.asarray(videos), np.asarray(brands), np.asarray(cohort_ids), self.num_videos
+        )
+        keys = np.take_along_axis(keys, np.asarray(actions)[:, None], axis=-1)
+        self.counts.add(keys, successes, failures)
+
+
+def _ucb_scores(counts, means, log_t, c):
+    # UCB1 index mean + sqrt(c * log t / n); unpulled arms score +inf so every
+    # feasible arm is tried once, first in feasible-arm order.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bonus = np.sqrt(c * log_t / counts)
+    return np.where(counts > 0, means + bonus, np.inf)
+
+
+def _ucb_select(world, counts, means, log_t, c, candidate_videos, candidate_brands):
+    vids = np.asarray(candidate_videos)
+    brands = np.asarray(candidate_brands)
+    idx = (vids[:, None], brands[None, :])
+    scores = _ucb_scores(counts[idx], means[idx], log_t, c)
+    scores[~feasible_mask(world, vids, brands)] = -np.inf
+    i, j, a = np.unravel_index(np.argmax(scores), scores.shape)
+    return int(vids[i]), int(brands[j]), int(a)
+
+
+def _ucb_probabilities(world, counts, means, log_t, c, contexts, cohorts):
+    # counts/means are (C, V, B, 2) and log_t (C,), indexed by each row's cohort.
+    cohorts = np.asarray(cohorts)[:, None, None]
+    idx = (cohorts, contexts.videos[:, :, None], contexts.brands[:, None, :])
+    scores = _ucb_scores(counts[idx], means[idx], log_t[cohorts][..., None], c)
+    scores[~feasible_mask(world, contexts.videos, contexts.brands)] = -np.inf
+    return _argmax_probabilities(scores)
+
+
+def _ucb_apply(counts, means, flat_idx, successes, failures):
+    successes = np.asarray(successes)
+    failures = np.asarray(failures)
+    uniq, inv = np.unique(flat_idx, return_inverse=True)
+    pulls = np.bincount(inv, weights=successes + failures)
+    wins = np.bincount(inv, weights=successes)
+    n = counts.flat[uniq]
+    # Zero-pull entries of unpulled arms would divide 0 / 0; they are no-ops.
+    pulled = n + pulls > 0
+    means.flat[uniq[pulled]] = (means.flat[uniq[pulled]] * n[pulled] + wins[pulled]) / (n + pulls)[pulled]
+    counts.flat[uniq] = n + pulls
+
+
+class UCBPolicy:
+    # Counts are impressions, so t in log t is the total impressions served.
+    def __init__(self, num_videos, num_brands, c=2.0):
+        self.c = c
+        self.counts = np.zeros((num_videos, num_brands, 2))
+        self.means = np.zeros((num_videos, num_brands, 2))
+        self.total = 0
+        self._log_t = 0.0
+
+    def select_arm(self, world, user_id, candidate_videos, candidate_brands, cohort_id=None):
+        return _ucb_select(
+            world, self.counts, self.means, self._log_t, self.c, candidate_videos, candidate_brands
+        )
+
+    def arm_probabilities(self, world, contexts, rng=None, num_samples=256):
+        return _ucb_probabilities(
+            world,
+            self.counts[None],
+            self.means[None],
+            np.array([self._log_t]),
+            self.c,
+            contexts,
+            np.zeros(len(contexts), dtype=int),
+        )
+
+    def update(self, arm, successes, failures, cohort_id=None):
+        v, b, a = arm
+        pulls = successes + failures
+        if pulls == 0:
+            return
+        n = self.counts[v, b, a] + pulls
+        self.means[v, b, a] += (successes - pulls * self.means[v, b, a]) / n
+        self.counts[v, b, a] = n
+        self.total += pulls
+        self._log_t = np.log(self.total)
+
+    def update_batch(self, videos, brands, actions, successes, failures, cohort_ids=None):
+        if np.size(videos) == 0:
+            return
+        flat = np.ravel_multi_index((videos, brands, actions), self.counts.shape)
+        _ucb_apply(self.counts, self.means, flat, successes, failures)
+        self.total += int(np.sum(successes) + np.sum(failures))
+        if self.total > 0:
+            self._log_t = np.log(self.total)
+
+
+class CohortUCBPolicy:
+    # One UCB bandit per cohort, stored as (C, V, B, 2) arrays with per-cohort t.
+    def __init__(self, num_cohorts, num_videos, num_brands, c=2.0):
+        self.c = c
+        self.counts = np.zeros((num_cohorts, num_videos, num_brands, 2))
+        self.means = np.zeros((num_cohorts, num_videos, num_brands, 2))
+        self.totals = np.zeros(num_cohorts, dtype=np.int64)
+        self._log_t = np.zeros(num_cohorts)
+
+    def select_arm(self, world, user_id, candidate_videos, candidate_brands, cohort_id=None):
+        if cohort_id is None:
+            raise ValueError("cohort_id required for CohortUCBPolicy")
+        return _ucb_select(
+            world,
+            self.counts[cohort_id],
+            self.means[cohort_id],
+            self._log_t[cohort_id],
+            self.c,
+            candidate_videos,
+            candidate_brands,
+        )
+
+    def arm_probabilities(self, world, contexts, rng=None, num_samples=256):
+        return _ucb_probabilities(
+            world, self.counts, self.means, self._log_t, self.c, contexts, contexts.cohorts
+        )
+
+    def update(self, arm, successes, failures, cohort_id=None):
+        if cohort_id is None:
+            raise ValueError("cohort_id required for CohortUCBPolicy")
+        v, b, a = arm
+        pulls = successes + failures
+        if pulls == 0:
+            return
+        n = self.counts[cohort_id, v, b, a] + pulls
+        self.means[cohort_id, v, b, a] += (successes - pulls * self.means[cohort_id, v, b, a]) / n
+        self.counts[cohort_id, v, b, a] = n
+        self.totals[cohort_id] += pulls
+        self._log_t[cohort_id] = np.log(self.totals[cohort_id])
+
+    def update_batch(self, videos, brands, actions, successes, failures, cohort_ids=None):
+        if cohort_ids is None:
+            raise ValueError("cohort_ids required for CohortUCBPolicy")
+        if np.size(videos) == 0:
+            return
+        flat = np.ravel_multi_index((cohort_ids, videos, brands, actions), self.counts.shape)
+        _ucb_apply(self.counts, self.means, flat, successes, failures)
+        np.add.at(self.totals, cohort_ids, np.asarray(successes) + np.asarray(failures))
+        touched = np.unique(cohort_ids)
+        touched = touched[self.totals[touched] > 0]
+        self._log_t[touched] = np.log(self.totals[touched])
+
+
+def _normalize(x):
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-12)
+
+
+def arm_features(world, user_id, candidate_videos, candidate_brands):
+    # (Kv, Kb, 2, 3d + 1) features [p_u * x', p_u * q_b, q_b * x', 1] with x' the
+    # normalized (edited) video, so the true CTR logit is linear in them. For a
+    # batch of N users with (N, Kv) videos and (N, Kb) brands: (N, Kv, Kb, 2, 3d + 1).
+    vids = np.asarray(candidate_videos)
+    brands = np.asarray(candidate_brands)
+    if getattr(world, "use_tables", False):
+        p_u = world.p_u[user_id]
+        x_norm = world.video_norm[vids]
+        edited_norm = world.edited_norm[vids[..., :, None], brands[..., None, :]]
+    else:
+        p_u = world.user_embeddings(user_id) if hasattr(world, "user_embeddings") else world.p_u[user_id]
+        x_v = world.video_embeddings(vids) if hasattr(world, "video_embeddings") else world.x_v[vids]
+        x_norm = _normalize(x_v)
+        edited_norm = _normalize(x_v[..., :, None, :] + world.eta * world.q_hat[brands][..., None, :, :])
+    p_u = p_u[..., None, None, None, :]
+    q_b = world.q_b[brands][..., None, :, None, :]
+    x_vp = np.stack([np.broadcast_to(x_norm[..., :, None, :], edited_norm.shape), edited_norm], axis=-2)
+    shape = x_vp.shape[:-1]
+    return np.concatenate(
+        [
+            p_u * x_vp,
+            np.broadcast_to(p_u * q_b, x_vp.shape),
+            q_b * x_vp,
+            np.ones(shape + (1,)),
+        ],
+        axis=-1,
+    )
+
+
+class LinearThompsonPolicy:
+    # Gaussian linear Thompson sampling on arm_features: state is the D x D inverse
+    # design matrix and the D-vector of reward-weighted features (D = 3d + 1),
+    # independent of catalog size. Updates are rank-one Sherman-Morrison steps
+    # (O(D^2)), weighted by impressions. Each round draws one theta ~ N(theta_hat,
+    # v^2 B^-1) and scores every candidate arm with a single matmul.
+    # chol is a square root of B^-1 (chol @ chol.T == B_inv) kept current by the
+    # matching rank-one update, so sampling needs no per-round factorization.
+    # Selected arms and their features are queued so update/update_batch
+    # consume them in selection order.
+    def __init__(self, dim, seed=0, reg=1.0, v=0.5):
+        self.rng = np.random.default_rng(seed)
+        self.v = v
+        num_features = 3 * dim + 1
+        self.B_inv = np.eye(num_features) / reg
+        self.chol = np.eye(num_features) / np.sqrt(reg)
+        self.f = np.zeros(num_features)
+        self._pending = deque()
+        self._pending_arms = deque()
+
+    @property
+    def theta_hat(self):
+        return self.B_inv @ self.f
+
+    def select_arm(self, world, user_id, candidate_videos, candidate_brands, cohort_id=None):
+        vids = np.asarray(candidate_videos)
+        brands = np.asarray(candidate_brands)
+        phi = arm_features(world, user_id, vids, brands)
+        theta = self.theta_hat + self.v * self.chol @ self.rng.standard_normal(len(self.f))
+        scores = np.where(feasible_mask(world, vids, brands), phi @ theta, -np.inf)
+        i, j, a = np.unravel_index(np.argmax(scores), scores.shape)
+        arm = int(vids[i]), int(brands[j]), int(a)
+        self._pending.append(phi[i, j, a])
+        self._pending_arms.append(arm)
+        return arm
+
+    def arm_probabilities(self, world, contexts, rng=None, num_samples=256):
+        rng = _evaluation_rng(rng)
+        mask = feasible_mask(world, contexts.videos, contexts.brands)
+        phi = arm_features(world, contexts.users, contexts.videos, contexts.brands)[mask]
+        theta_hat = self.theta_hat
+
+        def draw(k):
+            theta = theta_hat[:, None] + self.v * self.chol @ rng.standard_normal((len(self.f), k))
+            return (phi @ theta).T
+
+        return _sampled_probabilities(draw, mask, num_samples)
+
+    def _observe(self, phi, successes, failures):
+        pulls = successes + failures
+        b_phi = self.B_inv @ phi
+        q = phi @ b_phi
+        self.B_inv -= np.outer(b_phi, b_phi) * (pulls / (1.0 + pulls * q))
+        self.B_inv = 0.5 * (self.B_inv + self.B_inv.T)
+        # chol (I - s w w^T) with w = chol.T @ phi squares to the updated B_inv
+        # for this s, and chol @ w == b_phi.
+        r = np.sqrt(1.0 + pulls * q)
+        self.chol -= np.outer(b_phi, self.chol.T @ phi) * (pulls / (r * (r + 1.0)))
+        self.f += successes * phi
+
+    def _check_pending(self, arms):
+        # Validates arms against the head of the queue without consuming it, so a
+        # rejected update leaves the queue aligned with later selections.
+        if len(arms) > len(self._pending):
+            raise ValueError(f"update for {len(arms)} arms with {len(self._pending)} pending select_arm calls")
+        for arm, expected in zip(arms, self._pending_arms):
+            expected = tuple(int(x) for x in expected)
+            if expected != arm:
+                raise ValueError(f"update for arm {arm}, but the next selected arm is {expected}")
+
+    def _pop_pending(self):
+        self._pending_arms.popleft()
+        return self._pending.popleft()
+
+    def update(self, arm, successes, failures, cohort_id=None):
+        self._check_pending([tuple(int(x) for x in arm)])
+        self._observe(self._pop_pending(), successes, failures)
+
+    def update_batch(self, videos, brands, actions, successes, failures, cohort_ids=None):
+        arms = list(zip(np.asarray(videos).tolist(), np.asarray(brands).tolist(), np.asarray(actions).tolist()))
+        self._check_pending(arms)
+        for succ, fail in zip(np.asarray(successes).tolist(), np.asarray(failures).tolist()):
+            self._observe(self._pop_pending(), succ, fail)
 
 
 class OraclePolicy:
     def select_arm(self, world, user_id, candidate_videos, candidate_brands, cohort_id=None):
-        best = None
-        best_ctr = -1.0
-        for v in candidate_videos:
-            for b in candidate_brands:
-                ctr0 = world.expected_ctr(user_id, v, b, ACTION_NO_EDIT)
-                if ctr0 > best_ctr:
-                    best_ctr = ctr0
-                    best = (v, b, ACTION_NO_EDIT)
-                if world.is_edit_acceptable(v, b):
-                    ctr1 = world.expected_ctr(user_id, v, b, ACTION_EDIT)
-                    if ctr1 > best_ctr:
-                        best_ctr = ctr1
-                        best = (v, b, ACTION_EDIT)
-        return best
+        vids = np.asarray(candidate_videos)
+        brands = np.asarray(candidate_brands)
+        ctr = world.expected_ctr_grid(user_id, vids, brands)
+        ctr = np.where(feasible_mask(world, vids, brands), ctr, -np.inf)
+        i, j, a = np.unravel_index(np.argmax(ctr), ctr.shape)
+        return int(vids[i]), int(brands[j]), int(a)
+
+    def select_arms(self, world, contexts):
+        return _argmax_arms(self._scores(world, contexts), contexts.videos, contexts.brands)
+
+    def arm_probabilities(self, world, contexts, rng=None, num_samples=256):
+        return _argmax_probabilities(self._scores(world, contexts))
+
+    def _scores(self, world, contexts):
+        ctr = world.expected_ctr_grid(contexts.users, contexts.videos, contexts.brands)
+        return np.where(feasible_mask(world, contexts.videos, contexts.brands), ctr, -np.inf)
 
     def update(self, arm, successes, failures, cohort_id=None):
         return None
+
+    def update_batch(self, videos, brands, actions, successes, failures, cohort_ids=None):
+        return None
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class SparseArmCounts:
+    # Success/failure counts for the arms actually touched, keyed by a flat int64
+    # arm id; untouched arms read as zero. Keys live in two sorted arrays: a large
+    # main run and a small delta run that new keys are inserted into, merged into
+    # main once it exceeds delta_capacity. Lookups are two vectorized
+    # searchsorted calls; memory is 16 bytes per touched arm.
+    def __init__(self, delta_capacity=4096):
+        self.delta_capacity = delta_capacity
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.successes = np.zeros(0, dtype=np.uint32)
+        self.failures = np.zeros(0, dtype=np.uint32)
+        self.delta_keys = np.zeros(0, dtype=np.int64)
+        self.delta_successes = np.zeros(0, dtype=np.uint32)
+        self.delta_failures = np.zeros(0, dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.keys) + len(self.delta_keys)
+
+    @property
+    def nbytes(self):
+        return sum(
+            arr.nbytes
+            for arr in (
+                self.keys, self.successes, self.failures,
+                self.delta_keys, self.delta_successes, self.delta_failures,
+            )
+        )
+
+    @staticmethod
+    def _find(sorted_keys, keys):
+        pos = np.searchsorted(sorted_keys, keys)
+        found = pos < len(sorted_keys)
+        found[found] = sorted_keys[pos[found]] == keys[found]
+        return pos, found
+
+    def get(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        succ = np.zeros(keys.shape, dtype=np.uint32)
+        fail = np.zeros(keys.shape, dtype=np.uint32)
+        for sorted_keys, s, f in (
+            (self.keys, self.successes, self.failures),
+            (self.delta_keys, self.delta_successes, self.delta_failures),
+        ):
+            pos, found = self._find(sorted_keys, keys)
+            succ[found] = s[pos[found]]
+            fail[found] = f[pos[found]]
+        return succ, fail
+
+    def add(self, keys, successes, failures):
+        keys, inv = np.unique(np.asarray(keys, dtype=np.int64).ravel(), return_inverse=True)
+        succ = np.bincount(inv, weights=np.ravel(successes), minlength=len(keys)).astype(np.uint32)
+        fail = np.bincount(inv, weights=np.ravel(failures), minlength=len(keys)).astype(np.uint32)
+
+        pos, in_main = self._find(self.keys, keys)
+        self.successes[pos[in_main]] += succ[in_main]
+        self.failures[pos[in_main]] += fail[in_main]
+        rest = ~in_main
+        keys, succ, fail = keys[rest], succ[rest], fail[rest]
+
+        pos, in_delta = self._find(self.delta_keys, keys)
+        self.delta_successes[pos[in_delta]] += succ[in_delta]
+        self.delta_failures[pos[in_delta]] += fail[in_delta]
+        new = ~in_delta
+        if new.any():
+            at = pos[new]
+            self.delta_keys = np.insert(self.delta_keys, at, keys[new])
+            self.delta_successes = np.insert(self.delta_successes, at, succ[new])
+            self.delta_failures = np.insert(self.delta_failures, at, fail[new])
+            if len(self.delta_keys) > self.delta_capacity:
+                self._merge()
+
+    def _merge(self):
+        # Both runs are sorted and disjoint, so one searchsorted gives every delta
+        # key's slot in main and np.insert merges in linear time.
+        at = np.searchsorted(self.keys, self.delta_keys)
+        self.keys = np.insert(self.keys, at, self.delta_keys)
+        self.successes = np.insert(self.successes, at, self.delta_successes)
+        self.failures = np.insert(self.failures, at, self.delta_failures)
+        self.delta_keys = self.delta_keys[:0]
+        self.delta_successes = self.delta_successes[:0]
+        self.delta_failures = self.delta_failures[:0]
@@ -0,0 +1,132 @@
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# Opt-in per-phase timing for simulations. simulate_policy(..., profiler=p) swaps
+# timing proxies around the world, policy and reward RNG once per run, so the
+# unprofiled path carries no timing code. Time is exclusive: a phase nested in
+# another (e.g. the acceptability lookup inside select_arm) is subtracted from
+# its parent, so phase totals add up to the instrumented wall time.
+PHASES = ("enumerate", "sample", "ctr", "binomial", "update")
+
+# Method -> phase for each instrumented object.
+WORLD_PHASES = {
+    "edit_acceptable_batch": "enumerate",
+    "expected_ctr": "ctr",
+    "expected_ctr_batch": "ctr",
+    "expected_ctr_grid": "ctr",
+}
+POLICY_PHASES = {
+    "select_arm": "sample",
+    "select_arms": "sample",
+    "update": "update",
+    "update_batch": "update",
+}
+RNG_PHASES = {"binomial": "binomial"}
+
+
+def maybe_timed(profiler, phase, scope=None):
+    # profiler.timed(phase) under scope, or a no-op context when profiler is None.
+    if profiler is None:
+        return nullcontext()
+    if scope is None:
+        return profiler.timed(phase)
+    return _scoped_timed(profiler, phase, scope)
+
+
+@contextmanager
+def _scoped_timed(profiler, phase, scope):
+    with profiler.scope(scope), profiler.timed(phase):
+        yield
+
+
+class _Timed:
+    # Attribute proxy timing the mapped methods of the wrapped object; everything
+    # else is delegated. __wrapped__ exposes the original (used by checkpoints).
+    def __init__(self, profiler, target, phases):
+        self.__dict__.update(_profiler=profiler, _phases=phases, __wrapped__=target)
+
+    def __getattr__(self, name):
+        attr = getattr(self.__wrapped__, name)
+        phase = self._phases.get(name)
+        if phase is None:
+            return attr
+        profiler = self._profiler
+        return lambda *args, **kwargs: profiler.call(phase, attr, *args, **kwargs)
+
+    def __setattr__(self, name, value):
+        setattr(self.__wrapped__, name, value)
+
+
+class PhaseProfiler:
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.current_scope = "run"
+        self._children = []
+
+    @contextmanager
+    def scope(self, name):
+        # Attribute phases recorded inside the block to name (e.g. a policy).
+        previous, self.current_scope = self.current_scope, name
+        try:
+            yield self
+        finally:
+            self.current_scope = previous
+
+    def call(self, phase, fn, *args, **kwargs):
+        with self.timed(phase):
+            return fn(*args, **kwargs)
+
+    @contextmanager
+    def timed(self, phase):
+        self._children.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.add(phase, elapsed - self._children.pop())
+            if self._children:
+                self._children[-1] += elapsed
+
+    def add(self, phase, seconds, calls=1, scope=None):
+        key = (self.current_scope if scope is None else scope, phase)
+        self.seconds[key] = self.seconds.get(key, 0.0) + seconds
+        self.calls[key] = self.calls.get(key, 0) + calls
+
+    def wrap(self, target, phases):
+        return _Timed(self, target, phases)
+
+    def records(self):
+        return [
+            {"scope": scope, "phase": phase, "calls": self.calls[(scope, phase)], "seconds": seconds}
+            for (scope, phase), seconds in self.seconds.items()
+        ]
+
+    def merge(self, records):
+        # Fold in records() from another profiler, e.g. one run in a worker process.
+        for r in records:
+            self.add(r["phase"], r["seconds"], calls=r["calls"], scope=r["scope"])
+
+    def table(self):
+        total = sum(self.seconds.values()) or 1.0
+        order = {phase: i for i, phase in enumerate(PHASES)}
+        lines = [
+            "| Scope | Phase | Calls | Total (s) | Mean (us) | Share |",
+            "|---|---|---|---|---|---|",
+        ]
+        for scope, phase in sorted(self.seconds, key=lambda k: (k[0], order.get(k[1], len(order)), k[1])):
+            seconds = self.seconds[(scope, phase)]
+            calls = self.calls[(scope, phase)]
+            lines.append(
+                f"| {scope} | {phase} | {calls} | {seconds:.3f} | {1e6 * seconds / max(calls, 1):.1f} "
+                f"| {seconds / total:.1%} |"
+            )
+        return "\n".join(lines)
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"records": self.records()}, f, indent=2)
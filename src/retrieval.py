@@ -0,0 +1,339 @@
+import argparse
+import time
+
+import numpy as np
+
+from .world import ACTION_NO_EDIT, ACTION_EDIT, sigmoid
+
+
+def _normalize(x):
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-12)
+
+
+def _user_vectors(world, user_ids):
+    if hasattr(world, "user_embeddings"):
+        return world.user_embeddings(user_ids)
+    return world.p_u[user_ids]
+
+
+def video_norm_block(world, start, stop):
+    # Normalized (n, d) videos [start, stop) alone, for callers that need no
+    # edited embeddings or acceptability.
+    if getattr(world, "use_tables", False):
+        return world.video_norm[start:stop]
+    ids = np.arange(start, stop)
+    return _normalize(world.video_embeddings(ids) if hasattr(world, "video_embeddings") else world.x_v[start:stop])
+
+
+def video_block(world, start, stop):
+    # Normalized (n, d) videos, normalized (n, B, d) edited videos and the (n, B)
+    # acceptability slice for videos [start, stop), read from World's tables when
+    # it has them and computed on the fly otherwise (e.g. for LazyWorld).
+    ids = np.arange(start, stop)
+    accept = world.edit_acceptable_batch(ids[:, None], np.arange(world.num_brands)[None, :])
+    if getattr(world, "use_tables", False):
+        return world.video_norm[start:stop], world.edited_norm[start:stop], accept
+    x_v = world.video_embeddings(ids) if hasattr(world, "video_embeddings") else world.x_v[start:stop]
+    edited = x_v[:, None, :] + world.eta * world.q_hat[None, :, :]
+    return _normalize(x_v), _normalize(edited), accept
+
+
+def video_block_rows(world, ids):
+    # Normalized embeddings of arbitrary video ids (any shape), as video_block
+    # computes them for contiguous ranges. Without tables each distinct id is
+    # fetched and normalized once.
+    if getattr(world, "use_tables", False):
+        return np.take(world.video_norm, ids, axis=0)
+    flat = np.ravel(ids)
+    order = np.argsort(flat, kind="stable")
+    first = np.ones(len(flat), dtype=bool)
+    first[1:] = flat[order[1:]] != flat[order[:-1]]
+    inverse = np.empty(len(flat), dtype=np.intp)
+    inverse[order] = np.cumsum(first) - 1
+    distinct = flat[order[first]]
+    x_v = world.video_embeddings(distinct) if hasattr(world, "video_embeddings") else world.x_v[distinct]
+    return np.take(_normalize(x_v), inverse, axis=0).reshape(np.shape(ids) + (world.dim,))
+
+
+def _merge_top_k(best_scores, best_ids, scores, ids, k):
+    scores = np.concatenate([best_scores, scores], axis=1)
+    ids = np.concatenate([best_ids, ids], axis=1)
+    if scores.shape[1] > k:
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        ids = np.take_along_axis(ids, keep, axis=1)
+    return scores, ids
+
+
+def _sorted(scores, ids):
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class ExactIndex:
+    # Exact top-k by blocked matrix multiply over the catalog; memory is
+    # O(block_size * B * d) for the scan plus O(queries * k) for the results.
+    def __init__(self, world, block_size=65536):
+        self.world = world
+        self.block_size = block_size
+
+    def top_k_videos(self, user_ids, k):
+        # Videos ranked by no-edit relevance p_u . x_v / |x_v|; returns (ids, scores).
+        user_ids = np.atleast_1d(np.asarray(user_ids))
+        p_u = _user_vectors(self.world, user_ids)
+        best_scores = np.empty((len(user_ids), 0))
+        best_ids = np.empty((len(user_ids), 0), dtype=int)
+        for start in range(0, self.world.num_videos, self.block_size):
+            stop = min(start + self.block_size, self.world.num_videos)
+            x_norm = video_norm_block(self.world, start, stop)
+            scores = p_u @ x_norm.T
+            ids = np.broadcast_to(np.arange(start, stop), scores.shape)
+            best_scores, best_ids = _merge_top_k(best_scores, best_ids, scores, ids, k)
+        return _sorted(best_scores, best_ids)
+
+    def top_k_arms(self, user_id, k):
+        # Best feasible (video, brand, action) arms over the whole catalog by
+        # expected CTR; returns (videos, brands, actions, ctrs), best first.
+        world = self.world
+        p_u = _user_vectors(world, np.array([user_id]))[0]
+        affinity = world.q_b @ p_u
+        num_arms = world.num_brands * 2
+        best_scores = np.empty((1, 0))
+        best_ids = np.empty((1, 0), dtype=int)
+        for start in range(0, world.num_videos, self.block_size):
+            stop = min(start + self.block_size, world.num_videos)
+            x_norm, edited_norm, accept = video_block(world, start, stop)
+            logit = np.empty((stop - start, world.num_brands, 2))
+            logit[..., ACTION_NO_EDIT] = (x_norm @ p_u)[:, None] + world.delta * (x_norm @ world.q_b.T)
+            logit[..., ACTION_EDIT] = edited_norm @ p_u + world.delta * np.einsum(
+                "vbd,bd->vb", edited_norm, world.q_b
+            )
+            logit += world.beta0 + world.gamma * affinity[None, :, None]
+            logit[..., ACTION_EDIT][~accept] = -np.inf
+            ids = start * num_arms + np.arange(logit.size)
+            best_scores, best_ids = _merge_top_k(best_scores, best_ids, logit.reshape(1, -1), ids[None, :], k)
+        ids, scores = _sorted(best_scores, best_ids)
+        v, rest = np.divmod(ids[0], num_arms)
+        b, a = np.divmod(rest, 2)
+        return v, b, a, sigmoid(scores[0])
+
+
+class RandomProjectionIndex:
+    # Approximate top-k videos: num_tables sign-random-projection hashes of
+    # num_bits each bucket the normalized videos; a query scores only the videos
+    # in buckets within Hamming distance 1 of its own (0 without
+    # probe_neighbors) in some table and re-ranks them exactly. The defaults
+    # keep the candidates to a few percent of a 200k-video catalog; fewer bits
+    # or more tables trade speed for recall. Queries with fewer than k
+    # candidates are re-probed one Hamming radius wider at a time up to
+    # max_radius, so their cost stays bounded by the number of probed buckets;
+    # only queries still short after that (catalogs with few videos per
+    # bucket relative to k) use ExactIndex's full blocked scan. recall_report
+    # gives the share of each. Queries are processed query_block at a time: one
+    # hash call, one gather of every probed bucket and one padded re-rank of
+    # the candidates' vectors, pulled on demand so memory beyond the hash
+    # tables stays bounded by the query block. With cache_vectors, a float32
+    # (V, d) copy of the normalized videos is kept for a faster first pass
+    # instead (the final top k are rescored exactly); this gives up
+    # block-bounded memory. Only the unedited videos are indexed, matching
+    # ExactIndex.top_k_videos' no-edit relevance; edited arms are ranked by the
+    # exact ExactIndex.top_k_arms scan alone.
+    def __init__(
+        self,
+        world,
+        num_bits=16,
+        num_tables=8,
+        probe_neighbors=True,
+        max_radius=2,
+        seed=0,
+        block_size=65536,
+        query_block=64,
+        cache_vectors=False,
+    ):
+        if not 1 <= num_bits <= 16:
+            raise ValueError("num_bits must be between 1 and 16")
+        self.world = world
+        self.num_bits = num_bits
+        self.probe_neighbors = probe_neighbors
+        self.radius = int(probe_neighbors)
+        self.max_radius = max(max_radius, self.radius)
+        self.block_size = block_size
+        self.query_block = query_block
+        rng = np.random.default_rng(seed)
+        self.planes = rng.normal(size=(num_tables, world.dim, num_bits))
+        self.weights = 1 << np.arange(num_bits)
+        self.probe_masks = self._masks(self.radius)
+        codes = np.empty((num_tables, world.num_videos), dtype=np.uint16)
+        self.vectors = np.empty((world.num_videos, world.dim), dtype=np.float32) if cache_vectors else None
+        for start in range(0, world.num_videos, block_size):
+            stop = min(start + block_size, world.num_videos)
+            x_norm = video_norm_block(world, start, stop)
+            codes[:, start:stop] = self._hash(x_norm)
+            if cache_vectors:
+                self.vectors[start:stop] = x_norm
+        # Per table: video ids sorted by bucket code and each bucket's offset.
+        self.order = np.argsort(codes, axis=1, kind="stable")
+        sorted_codes = np.take_along_axis(codes, self.order, axis=1)
+        self.offsets = np.stack(
+            [np.searchsorted(row, np.arange((1 << num_bits) + 1)) for row in sorted_codes]
+        )
+
+    def _hash(self, x):
+        bits = np.einsum("nd,tdk->tnk", x, self.planes) > 0
+        return bits @ self.weights
+
+    def _masks(self, radius):
+        # XOR masks of every bucket within Hamming distance radius.
+        codes = np.arange(1 << self.num_bits)
+        popcount = np.zeros(len(codes), dtype=int)
+        for bit in range(self.num_bits):
+            popcount += (codes >> bit) & 1
+        return codes[popcount <= radius]
+
+    def _candidate_pairs(self, p_u, masks=None):
+        # Distinct (query, video) pairs over every probed bucket of every table,
+        # sorted by query then video id.
+        masks = self.probe_masks if masks is None else masks
+        num_tables, num_videos = self.order.shape
+        probes = self._hash(_normalize(p_u))[:, :, None] ^ masks  # (T, Q, P)
+        tables = np.broadcast_to(np.arange(num_tables)[:, None, None], probes.shape)
+        queries = np.broadcast_to(np.arange(len(p_u))[None, :, None], probes.shape)
+        starts = self.offsets[tables, probes].ravel()
+        lengths = self.offsets[tables, probes + 1].ravel() - starts
+        range_starts = np.cumsum(lengths) - lengths
+        pos = np.arange(lengths.sum()) - np.repeat(range_starts - starts, lengths)
+        videos = np.take(self.order, np.repeat(tables.ravel() * num_videos, lengths) + pos)
+        pairs = np.sort(np.repeat(queries.ravel(), lengths).astype(np.int64) * num_videos + videos)
+        first = np.ones(len(pairs), dtype=bool)
+        first[1:] = pairs[1:] != pairs[:-1]
+        return np.divmod(pairs[first], num_videos)
+
+    def candidates(self, user_id):
+        _queries, videos = self._candidate_pairs(_user_vectors(self.world, np.array([user_id])))
+        return videos
+
+    def candidate_counts(self, user_ids, radius=None):
+        # Number of distinct candidate videos of each query when probing buckets
+        # within radius (default: the index's own).
+        masks = None if radius is None else self._masks(radius)
+        user_ids = np.atleast_1d(np.asarray(user_ids))
+        counts = np.empty(len(user_ids), dtype=int)
+        for start in range(0, len(user_ids), self.query_block):
+            block = user_ids[start : start + self.query_block]
+            queries, _videos = self._candidate_pairs(_user_vectors(self.world, block), masks)
+            counts[start : start + len(block)] = np.bincount(queries, minlength=len(block))
+        return counts
+
+    def _rerank(self, p_u, masks, k):
+        # Top-k of each query among its candidates, with its candidate count;
+        # rows of queries with fewer than k candidates are not meaningful.
+        queries, videos = self._candidate_pairs(p_u, masks)
+        counts = np.bincount(queries, minlength=len(p_u))
+        if not len(videos):
+            return np.zeros((len(p_u), k), dtype=int), np.full((len(p_u), k), -np.inf), counts
+        firsts = np.cumsum(counts) - counts
+        if self.vectors is None:
+            x_norm, query = video_block_rows(self.world, videos), p_u
+        else:
+            x_norm, query = np.take(self.vectors, videos, axis=0), p_u.astype(np.float32)
+        scores = np.einsum("nd,nd->n", x_norm, np.repeat(query, counts, axis=0))
+        # Padded (Q, max count) re-rank; pads score -inf and sort last.
+        width = max(int(counts.max()), k)
+        padded = np.full((len(p_u), width), -np.inf, dtype=scores.dtype)
+        padded[queries, np.arange(len(queries)) - np.repeat(firsts, counts)] = scores
+        keep = np.argpartition(-padded, k - 1, axis=1)[:, :k]
+        ids = videos[np.minimum(firsts[:, None] + keep, len(videos) - 1)]
+        if self.vectors is None:
+            top_scores = np.take_along_axis(padded, keep, axis=1)
+        else:
+            top_scores = np.einsum("qkd,qd->qk", video_block_rows(self.world, ids), p_u)
+        ids, top_scores = _sorted(top_scores, ids)
+        return ids, top_scores, counts
+
+    def _top_k_block(self, user_ids, k):
+        p_u = _user_vectors(self.world, user_ids)
+        ids, top_scores, counts = self._rerank(p_u, self.probe_masks, k)
+        short = counts < k
+        radius = self.radius
+        while short.any() and radius < self.max_radius:
+            radius += 1
+            wide_ids, wide_scores, wide_counts = self._rerank(p_u[short], self._masks(radius), k)
+            ids[short], top_scores[short] = wide_ids, wide_scores
+            short[short] = wide_counts < k
+        if short.any():
+            ids[short], top_scores[short] = ExactIndex(self.world, self.block_size).top_k_videos(user_ids[short], k)
+        return ids, top_scores
+
+    def top_k_videos(self, user_ids, k):
+        user_ids = np.atleast_1d(np.asarray(user_ids))
+        out_ids = np.empty((len(user_ids), k), dtype=int)
+        out_scores = np.empty((len(user_ids), k))
+        for start in range(0, len(user_ids), self.query_block):
+            stop = start + self.query_block
+            out_ids[start:stop], out_scores[start:stop] = self._top_k_block(user_ids[start:stop], k)
+        return out_ids, out_scores
+
+
+def recall_report(exact_index, approx_index, user_ids, k):
+    start = time.perf_counter()
+    exact_ids, _ = exact_index.top_k_videos(user_ids, k)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    approx_ids, _ = approx_index.top_k_videos(user_ids, k)
+    approx_seconds = time.perf_counter() - start
+    hits = [len(np.intersect1d(e, a)) for e, a in zip(exact_ids, approx_ids)]
+    counts = approx_index.candidate_counts(user_ids)
+    widest = approx_index.candidate_counts(user_ids, approx_index.max_radius)
+    return {
+        "recall_at_k": float(np.mean(hits) / k),
+        "candidate_fraction": float(np.mean(counts) / approx_index.world.num_videos),
+        "widened_fraction": float(np.mean(counts < k)),
+        "fallback_fraction": float(np.mean(widest < k)),
+        "exact_seconds": exact_seconds,
+        "approx_seconds": approx_seconds,
+    }
+
+
+def retrieve_candidates(index, user_ids, k, chunk_size=4096):
+    # Top-k candidate videos per round; each distinct user is queried once.
+    uniq, inverse = np.unique(np.asarray(user_ids), return_inverse=True)
+    videos = np.empty((len(uniq), k), dtype=int)
+    for start in range(0, len(uniq), chunk_size):
+        ids, _scores = index.top_k_videos(uniq[start : start + chunk_size], k)
+        videos[start : start + chunk_size] = ids
+    return videos[inverse]
+
+
+def main():
+    from .run_sim import make_world
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-users", type=int, default=10000)
+    parser.add_argument("--num-videos", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--num-bits", type=int, default=16)
+    parser.add_argument("--num-tables", type=int, default=8)
+    parser.add_argument("--lazy-world", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    world, _user_to_cohort = make_world(
+        args.seed, 1, num_users=args.num_users, num_videos=args.num_videos, lazy=args.lazy_world
+    )
+    start = time.perf_counter()
+    approx = RandomProjectionIndex(world, num_bits=args.num_bits, num_tables=args.num_tables, seed=args.seed)
+    build_seconds = time.perf_counter() - start
+    users = np.random.default_rng(args.seed).integers(world.num_users, size=args.queries)
+    report = recall_report(ExactIndex(world), approx, users, args.k)
+    print(f"index build: {build_seconds:.2f}s")
+    print(f"recall@{args.k}: {report['recall_at_k']:.3f}")
+    print(f"candidates: {report['candidate_fraction']:.2%} of videos per query")
+    print(f"widened probes: {report['widened_fraction']:.2%} of queries")
+    print(f"exact fallbacks: {report['fallback_fraction']:.2%} of queries")
+    print(f"exact query time: {report['exact_seconds'] / args.queries * 1e3:.2f} ms/query")
+    print(f"approx query time: {report['approx_seconds'] / args.queries * 1e3:.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,81 @@
 import argparse
 import os
+from contextlib import nullcontext
 
 import numpy as np
 
-from .world import World, ACTION_EDIT, ACTION_NO_EDIT
+from .world import World, LazyWorld, ACTION_EDIT, ACTION_NO_EDIT
+from .checkpoint import has_checkpoint, load_checkpoint, restore_policy, save_checkpoint
+from .metrics import StreamingMetrics, lttb, oracle_ctr
+from .profiling import PhaseProfiler, POLICY_PHASES, RNG_PHASES, WORLD_PHASES
+from .ctr_cache import CTRCache, CachedWorld
+from .contexts import ContextBatch, as_context_batch, sample_contexts
+from .retrieval import ExactIndex, RandomProjectionIndex, retrieve_candidates
 from .policies import (
     RandomPolicy,
     NoEditGreedyPolicy,
     ThompsonPolicy,
     CohortThompsonPolicy,
+    UCBPolicy,
+    CohortUCBPolicy,
+    LinearThompsonPolicy,
     OraclePolicy,
 )
 
+# Contexts scored per oracle_ctr call when the serial loop tracks metrics.
+METRICS_CHUNK = 1024
+
+
+def make_world(seed, num_cohorts, num_users=200, num_videos=200, lazy=False, **model_params):
+    # model_params (eta, gamma, delta, beta0, ...) go to the World constructor;
+    # they do not change its random draws.
+    rng = np.random.default_rng(seed + 99)
+    if lazy:
+        user_to_cohort = rng.integers(0, num_cohorts, size=num_users, dtype=np.int32)
+        world = LazyWorld(
+            seed=seed,
+            num_users=num_users,
+            num_videos=num_videos,
+            user_to_cohort=user_to_cohort,
+            num_cohorts=num_cohorts,
+            **model_params,
+        )
+        return world, user_to_cohort
+    user_to_cohort = rng.integers(0, num_cohorts, size=num_users)
+    world = World(
+        seed=seed,
+        num_users=num_users,
+        num_videos=num_videos,
+        user_to_cohort=user_to_cohort,
+        num_cohorts=num_cohorts,
+        **model_params,
+    )
+    return world, user_to_cohort
+
+
+def policy_factories(world, num_cohorts, seed):
+    # A constructor per policy compared by run_sim, each on its own seed offset,
+    # so callers can build just the policies they need.
+    if num_cohorts > 1:
+        make_ts = lambda: CohortThompsonPolicy(num_cohorts, world.num_videos, world.num_brands, seed=seed + 4)
+        make_ucb = lambda: CohortUCBPolicy(num_cohorts, world.num_videos, world.num_brands)
+    else:
+        make_ts = lambda: ThompsonPolicy(world.num_videos, world.num_brands, seed=seed + 4)
+        make_ucb = lambda: UCBPolicy(world.num_videos, world.num_brands)
+    return {
+        "random": lambda: RandomPolicy(seed=seed + 2),
+        "no_edit_greedy": lambda: NoEditGreedyPolicy(seed=seed + 3),
+        "thompson": make_ts,
+        "ucb": make_ucb,
+        "linear_thompson": lambda: LinearThompsonPolicy(world.dim, seed=seed + 6),
+        "oracle_constrained": OraclePolicy,
+    }
+
+
+def make_policies(world, num_cohorts, seed):
+    # Every policy compared by run_sim, each on its own seed offset.
+    return {name: make() for name, make in policy_factories(world, num_cohorts, seed).items()}
+
 
 def make_contexts(
     world,
@@ -21,71 +85,290 @@ def make_contexts(
     user_to_cohort,
     segment_len=1,
     seed=0,
+    vectorized=False,
+    candidate_index=None,
 ):
+    if vectorized:
+        contexts = sample_contexts(
+            world,
+            num_rounds,
+            candidate_videos,
+            candidate_brands,
+            user_to_cohort,
+            segment_len=segment_len,
+            seed=seed,
+        )
+    else:
+        contexts = _sample_contexts_loop(
+            world, num_rounds, candidate_videos, candidate_brands, user_to_cohort, segment_len, seed
+        )
+    if candidate_index is not None:
+        # Retrieval stage: the user's top candidate_videos videos from the index
+        # replace the uniformly sampled ones; brand draws are unchanged.
+        videos = retrieve_candidates(candidate_index, contexts.users, candidate_videos)
+        contexts = ContextBatch(contexts.users, contexts.cohorts, videos, contexts.brands)
+    return contexts
+
+
+def _sample_contexts_loop(world, num_rounds, candidate_videos, candidate_brands, user_to_cohort, segment_len, seed):
     rng = np.random.default_rng(seed)
-    contexts = []
+    users = np.empty(num_rounds, dtype=int)
+    videos = np.empty((num_rounds, candidate_videos), dtype=int)
+    brands = np.empty((num_rounds, min(candidate_brands, world.num_brands)), dtype=int)
     current_user = None
-    for _ in range(num_rounds):
-        if current_user is None or (segment_len > 1 and len(contexts) % segment_len == 0):
+    for t in range(num_rounds):
+        if current_user is None or (segment_len > 1 and t % segment_len == 0):
             current_user = int(rng.integers(world.num_users))
-        u = current_user
-        vids = rng.choice(world.num_videos, size=candidate_videos, replace=False)
+        users[t] = current_user
+        videos[t] = rng.choice(world.num_videos, size=candidate_videos, replace=False)
         if candidate_brands >= world.num_brands:
-            brands = np.arange(world.num_brands, dtype=int)
+            brands[t] = np.arange(world.num_brands, dtype=int)
         else:
-            brands = rng.choice(world.num_brands, size=candidate_brands, replace=False)
-        cohort_id = int(user_to_cohort[u])
-        contexts.append((u, cohort_id, vids, brands))
-    return contexts
+            brands[t] = rng.choice(world.num_brands, size=candidate_brands, replace=False)
+    cohorts = np.asarray(user_to_cohort)[users].astype(int)
+    return ContextBatch(users, cohorts, videos, brands)
 
 
-def compute_acceptability_stats(world, contexts):
-    total = 0
-    rejected = 0
-    better_total = 0
-    better = 0
-    for u, _cohort, vids, brands in contexts:
-        for v in vids:
-            for b in brands:
-                total += 1
-                if not world.is_edit_acceptable(v, b):
-                    rejected += 1
-                    continue
-                better_total += 1
-                ctr_edit = world.expected_ctr(u, v, b, ACTION_EDIT)
-                ctr_no = world.expected_ctr(u, v, b, ACTION_NO_EDIT)
-                if ctr_edit > ctr_no:
-                    better += 1
-    rejected_frac = rejected / total if total else 0.0
-    better_frac = better / better_total if better_total else 0.0
-    return rejected_frac, better_frac
-
-
-def simulate_policy(world, policy, contexts, seed=0, impressions_per_pull=1):
-    rng = np.random.default_rng(seed)
-    successes = np.zeros(len(contexts), dtype=float)
-    for t, (u, cohort_id, vids, brands) in enumerate(contexts):
-        arm = policy.select_arm(world, u, vids, brands, cohort_id=cohort_id)
-        v, b, a = arm
-        p = world.expected_ctr(u, v, b, a)
-        succ = rng.binomial(impressions_per_pull, p)
-        fail = impressions_per_pull - succ
-        policy.update(arm, succ, fail, cohort_id=cohort_id)
-        successes[t] = succ
-    return successes
+def _safe_frac(num, den):
+    num = np.asarray(num, dtype=float)
+    return np.divide(num, den, out=np.zeros_like(num), where=np.asarray(den) > 0)
+
+
+def compute_acceptability_stats(world, contexts, breakdown=False, chunk_size=4096, ctr_cache=None):
+    contexts = as_context_batch(contexts)
+    num_brands = world.num_brands
+    num_cohorts = int(contexts.cohorts.max()) + 1 if len(contexts) else 0
+    counts = {
+        key: (np.zeros(num_brands), np.zeros(num_cohorts))
+        for key in ("total", "rejected", "better_total", "better")
+    }
+    for start in range(0, len(contexts), chunk_size):
+        chunk = contexts[start : start + chunk_size]
+        accept = world.edit_acceptable_batch(chunk.videos[:, :, None], chunk.brands[:, None, :])
+        if ctr_cache is not None:
+            ctr = ctr_cache.grid(start, start + len(chunk))
+        else:
+            ctr = world.expected_ctr_grid(chunk.users, chunk.videos, chunk.brands)
+        better = accept & (ctr[..., ACTION_EDIT] > ctr[..., ACTION_NO_EDIT])
+        brands = np.broadcast_to(chunk.brands[:, None, :], accept.shape).ravel()
+        cohorts = np.broadcast_to(chunk.cohorts[:, None, None], accept.shape).ravel()
+        for key, flags in (
+            ("total", np.ones(accept.size)),
+            ("rejected", ~accept.ravel()),
+            ("better_total", accept.ravel()),
+            ("better", better.ravel()),
+        ):
+            by_brand, by_cohort = counts[key]
+            by_brand += np.bincount(brands, weights=flags, minlength=num_brands)
+            by_cohort += np.bincount(cohorts, weights=flags, minlength=num_cohorts)
+
+    total, rejected, better_total, better = (
+        counts[key][0].sum() for key in ("total", "rejected", "better_total", "better")
+    )
+    rejected_frac = float(rejected / total) if total else 0.0
+    better_frac = float(better / better_total) if better_total else 0.0
+    if not breakdown:
+        return rejected_frac, better_frac
+    details = {
+        group: {
+            "rejected_frac": _safe_frac(counts["rejected"][i], counts["total"][i]),
+            "better_frac": _safe_frac(counts["better"][i], counts["better_total"][i]),
+            "pairs": counts["total"][i].astype(int),
+        }
+        for i, group in enumerate(("by_brand", "by_cohort"))
+    }
+    return rejected_frac, better_frac, details
+
+
+class RoundKeyedRewards:
+    # Click draws keyed by global round: round t's clicks count how many of
+    # impressions_per_pull uniforms, read from the Philox stream at counter
+    # t * blocks (blocks = ceil(impressions_per_pull / 4) counters of four draws
+    # each) under seed, fall below its CTR. A round thus gets the same draw
+    # whichever run, shard or epoch serves it, and rows of nearby rounds are
+    # drawn together: one seek and one uniform block per run of rows whose
+    # rounds are at most max_gap apart, so a shard owning every S-th round
+    # (S <= max_gap) costs one call per batch. The price is O(impressions_per_pull)
+    # uniforms per round, plus the skipped rounds inside each span. rounds maps
+    # a run's context rows to global rounds (default: row t is round t).
+    def __init__(self, seed, impressions_per_pull, rounds=None, max_gap=64, max_draws=2**20):
+        key = np.random.SeedSequence(seed).generate_state(2, dtype=np.uint64)
+        self.impressions_per_pull = impressions_per_pull
+        self.rounds = None if rounds is None else np.asarray(rounds)
+        self.max_gap = max_gap
+        self.max_draws = max_draws
+        self._blocks = -(-impressions_per_pull // 4)
+        self._bit_generator = np.random.Philox(key=key)
+        self._rng = np.random.Generator(self._bit_generator)
+        self._state = self._bit_generator.state
+
+    def _uniforms(self, first, span):
+        # (span, 4 * blocks) uniforms of rounds [first, first + span).
+        # Resetting one generator's counter is much cheaper than building one.
+        self._state["state"]["counter"] = np.array([first * self._blocks, 0, 0, 0], dtype=np.uint64)
+        self._bit_generator.state = self._state
+        return self._rng.random((span, 4 * self._blocks))
+
+    def clicks(self, start, stop, ctr):
+        # Clicks of context rows [start, stop) served at CTR ctr (a scalar for
+        # one row).
+        rounds = np.arange(start, stop) if self.rounds is None else self.rounds[start:stop]
+        ctr_rows = np.broadcast_to(np.asarray(ctr, dtype=float), rounds.shape)
+        out = np.empty(len(rounds), dtype=np.int64)
+        # Rows start a new draw after a gap (or step back) in rounds, or when
+        # the current span would exceed max_draws uniforms.
+        max_span = max(1, self.max_draws // (4 * self._blocks))
+        lo = 0
+        while lo < len(rounds):
+            first = rounds[lo]
+            steps = np.diff(rounds[lo:])
+            bad = np.flatnonzero((steps < 1) | (steps > self.max_gap) | (rounds[lo + 1 :] - first >= max_span))
+            hi = lo + 1 + (int(bad[0]) if len(bad) else len(steps))
+            u = self._uniforms(first, int(rounds[hi - 1] - first) + 1)
+            u = u[rounds[lo:hi] - first, : self.impressions_per_pull]
+            out[lo:hi] = (u < ctr_rows[lo:hi, None]).sum(axis=1)
+            lo = hi
+        return int(out[0]) if np.ndim(ctr) == 0 else out
+
 
+def simulate_policy(
+    world,
+    policy,
+    contexts,
+    seed=0,
+    impressions_per_pull=1,
+    batch_size=1,
+    checkpoint_path=None,
+    checkpoint_every=0,
+    resume=False,
+    metrics=None,
+    store_successes=True,
+    profiler=None,
+    log=None,
+    ctr_cache=None,
+    rewards=None,
+):
+    # With checkpoint_path set, the policy, reward RNG, round index and successes
+    # are saved every checkpoint_every rounds (at batch boundaries) and at the
+    # end; resume=True continues from that checkpoint if one exists. A
+    # StreamingMetrics passed as metrics is fed every round (and checkpointed);
+    # with store_successes=False no per-round buffer is kept and None is returned.
+    # A PhaseProfiler times the run by phase (see src/profiling.py). A BanditLog
+    # (src/ope.py) passed as log records each round's arm, propensity and clicks.
+    # A CTRCache over these contexts serves every true-CTR lookup of the run.
+    # rewards (a RoundKeyedRewards) replaces the seeded reward stream.
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    contexts = as_context_batch(contexts)
+    if resume and has_checkpoint(checkpoint_path):
+        rng, begin, successes = load_checkpoint(checkpoint_path, policy, metrics=metrics)
+        if len(successes) != (len(contexts) if store_successes else 0):
+            raise ValueError("checkpoint was written for a different run length")
+    else:
+        rng = np.random.default_rng(seed)
+        begin = 0
+        successes = np.zeros(len(contexts) if store_successes else 0, dtype=float)
+    cached = None
+    if ctr_cache is not None:
+        world = cached = CachedWorld(world, ctr_cache)
+    if profiler is not None:
+        world = profiler.wrap(world, WORLD_PHASES)
+        policy = profiler.wrap(policy, POLICY_PHASES)
+        rng = profiler.wrap(rng, RNG_PHASES)
 
-def cumulative_rate(successes, impressions_per_pull):
-    denom = (np.arange(len(successes)) + 1) * impressions_per_pull
-    return np.cumsum(successes) / denom
+    def maybe_checkpoint(prev, done):
+        if checkpoint_path is None:
+            return
+        if done == len(contexts) or (checkpoint_every and done // checkpoint_every > prev // checkpoint_every):
+            save_checkpoint(checkpoint_path, policy, rng, done, successes, metrics=metrics)
 
+    if batch_size == 1:
+        best = None
+        for t, (u, cohort_id, vids, brands) in enumerate(contexts[begin:], begin):
+            if cached is not None:
+                cached.seek(t, t + 1)
+            if log is not None:
+                probs = policy.arm_probabilities(
+                    world, contexts[t : t + 1], rng=log.rng, num_samples=log.num_samples
+                )
+            arm = policy.select_arm(world, u, vids, brands, cohort_id=cohort_id)
+            v, b, a = arm
+            p = world.expected_ctr(u, v, b, a)
+            succ = rng.binomial(impressions_per_pull, p) if rewards is None else rewards.clicks(t, t + 1, p)
+            fail = impressions_per_pull - succ
+            policy.update(arm, succ, fail, cohort_id=cohort_id)
+            if store_successes:
+                successes[t] = succ
+            if log is not None:
+                log.record(t, probs, [v], [b], [a], [succ])
+            if metrics is not None:
+                # Oracle CTRs are scored a chunk of contexts at a time.
+                if (t - begin) % METRICS_CHUNK == 0:
+                    stop = min(t + METRICS_CHUNK, len(contexts))
+                    grid = ctr_cache.grid(t, stop) if ctr_cache is not None else None
+                    best = oracle_ctr(world, contexts[t:stop], ctr=grid)
+                metrics.update(succ, p, best[(t - begin) % METRICS_CHUNK], a)
+            maybe_checkpoint(t, t + 1)
+        if metrics is not None:
+            metrics.finalize()
+        return successes if store_successes else None
+
+    # Mini-batch mode: every context in a batch is served against the posterior
+    # frozen at the start of the batch, rewards are drawn in one call and the
+    # accumulated feedback is applied afterwards, as with delayed serving logs.
+    for start in range(begin, len(contexts), batch_size):
+        batch = contexts[start : start + batch_size]
+        if cached is not None:
+            cached.seek(start, start + len(batch))
+        if log is not None:
+            probs = policy.arm_probabilities(world, batch, rng=log.rng, num_samples=log.num_samples)
+        if hasattr(policy, "select_arms"):
+            v, b, a = policy.select_arms(world, batch)
+        else:
+            arms = np.array(
+                [
+                    policy.select_arm(world, u, vids, brands, cohort_id=cohort_id)
+                    for u, cohort_id, vids, brands in batch
+                ]
+            )
+            v, b, a = arms[:, 0], arms[:, 1], arms[:, 2]
+        p = world.expected_ctr_batch(batch.users, v, b, a)
+        if rewards is None:
+            succ = rng.binomial(impressions_per_pull, p)
+        else:
+            succ = rewards.clicks(start, start + len(batch), p)
+        policy.update_batch(v, b, a, succ, impressions_per_pull - succ, cohort_ids=batch.cohorts)
+        if store_successes:
+            successes[start : start + len(batch)] = succ
+        if log is not None:
+            log.record(start, probs, v, b, a, succ)
+        if metrics is not None:
+            grid = ctr_cache.grid(start, start + len(batch)) if ctr_cache is not None else None
+            metrics.update(succ, p, oracle_ctr(world, batch, ctr=grid), a)
+        maybe_checkpoint(start, start + len(batch))
+    if metrics is not None:
+        metrics.finalize()
+    return successes if store_successes else None
 
-def save_plot(out_path, series_dict):
+
+def save_plot(out_path, series_dict, bands=None, max_points=2000):
+    # series_dict maps a label to a per-round array or to (rounds, values), e.g.
+    # StreamingMetrics snapshots; anything longer than max_points is LTTB
+    # downsampled first. bands optionally maps labels to (rounds, low, high),
+    # shaded in the label's colour (see metrics.seed_band).
     import matplotlib.pyplot as plt
 
+    bands = bands or {}
     plt.figure(figsize=(8, 5))
     for name, series in series_dict.items():
-        plt.plot(series, label=name)
+        if isinstance(series, tuple):
+            x, y = series
+        else:
+            x, y = np.arange(1, len(series) + 1), series
+        (line,) = plt.plot(*lttb(x, y, max_points), label=name)
+        if name in bands:
+            rounds, low, high = bands[name]
+            plt.fill_between(rounds, low, high, color=line.get_color(), alpha=0.2, linewidth=0)
     plt.xlabel("Round")
     plt.ylabel("Average click rate")
     plt.legend()
@@ -100,8 +383,23 @@ def main():
     parser.add_argument("--candidate-videos", type=int, default=12)
     parser.add_argument("--candidate-brands", type=int, default=5)
     parser.add_argument("--num-cohorts", type=int, default=1)
+    parser.add_argument("--num-users", type=int, default=200)
+    parser.add_argument("--num-videos", type=int, default=200)
+    parser.add_argument("--lazy-world", action="store_true")
     parser.add_argument("--segment-len", type=int, default=1)
     parser.add_argument("--impressions-per-pull", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--vectorized-contexts", action="store_true")
+    parser.add_argument(
+        "--candidate-source", choices=["random", "retrieval", "retrieval-approx"], default="random"
+    )
+    parser.add_argument("--checkpoint-every", type=int, default=0)
+    parser.add_argument("--checkpoint-dir", type=str, default="checkpoints")
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--warm-start", type=str, default=None)
+    parser.add_argument("--metrics-dir", type=str, default=None)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--profile-out", type=str, default=None)
     parser.add_argument("--seed", type=int, default=0)
     parser.add_argument("--plot", type=str, default="click_rate.png")
     args = parser.parse_args()
@@ -112,17 +410,25 @@ def main():
         raise ValueError("segment_len must be >= 1")
     if args.impressions_per_pull < 1:
         raise ValueError("impressions_per_pull must be >= 1")
+    if args.batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    if args.checkpoint_every < 0:
+        raise ValueError("checkpoint_every must be >= 0")
 
-    num_users = 200
-    rng = np.random.default_rng(args.seed + 99)
-    user_to_cohort = rng.integers(0, args.num_cohorts, size=num_users)
-    world = World(
-        seed=args.seed,
-        num_users=num_users,
-        user_to_cohort=user_to_cohort,
-        num_cohorts=args.num_cohorts,
+    world, user_to_cohort = make_world(
+        args.seed,
+        args.num_cohorts,
+        num_users=args.num_users,
+        num_videos=args.num_videos,
+        lazy=args.lazy_world,
     )
 
+    candidate_index = None
+    if args.candidate_source == "retrieval":
+        candidate_index = ExactIndex(world)
+    elif args.candidate_source == "retrieval-approx":
+        candidate_index = RandomProjectionIndex(world, seed=args.seed + 5)
+
     contexts = make_contexts(
         world,
         args.rounds,
@@ -131,47 +437,84 @@ def main():
         user_to_cohort,
         segment_len=args.segment_len,
         seed=args.seed + 1,
+        vectorized=args.vectorized_contexts,
+        candidate_index=candidate_index,
     )
 
-    rejected_frac, better_frac = compute_acceptability_stats(world, contexts)
+    ctr_cache = CTRCache(world, contexts)
+    rejected_frac, better_frac = compute_acceptability_stats(world, contexts, ctr_cache=ctr_cache)
     print(f"Rejected edited-arm fraction: {rejected_frac:.3f}")
     print(f"Edited-better-than-no-edit fraction (feasible edits): {better_frac:.3f}")
 
-    if args.num_cohorts > 1:
-        ts_policy = CohortThompsonPolicy(
-            args.num_cohorts, world.num_videos, world.num_brands, seed=args.seed + 4
-        )
-    else:
-        ts_policy = ThompsonPolicy(world.num_videos, world.num_brands, seed=args.seed + 4)
+    policies = make_policies(world, args.num_cohorts, args.seed)
+    ts_policy = policies["thompson"]
 
-    policies = {
-        "random": RandomPolicy(seed=args.seed + 2),
-        "no_edit_greedy": NoEditGreedyPolicy(seed=args.seed + 3),
-        "thompson": ts_policy,
-        "oracle_constrained": OraclePolicy(),
-    }
+    # --warm-start seeds each policy from another run's final checkpoint; the
+    # checkpoint directory (one subdirectory per policy) serves --resume.
+    if args.warm_start:
+        for name, policy in policies.items():
+            if has_checkpoint(os.path.join(args.warm_start, name)):
+                restore_policy(os.path.join(args.warm_start, name), policy)
+    checkpointing = args.checkpoint_every > 0 or args.resume
 
-    results = {}
+    # Rates and regret come from each policy's StreamingMetrics; no per-round
+    # successes buffer is kept, so memory does not grow with --rounds.
+    profiler = PhaseProfiler() if args.profile else None
+    metrics = {}
     for name, policy in policies.items():
-        succ = simulate_policy(
-            world, policy, contexts, seed=args.seed + 10, impressions_per_pull=args.impressions_per_pull
+        metrics[name] = StreamingMetrics(
+            args.impressions_per_pull,
+            stream_path=os.path.join(args.metrics_dir, f"{name}.csv") if args.metrics_dir else None,
         )
-        results[name] = succ
-
-    denom = args.rounds * args.impressions_per_pull
-    print(f"random policy average click rate: {results['random'].sum() / denom:.3f}")
-    print(f"no-edit greedy policy average click rate: {results['no_edit_greedy'].sum() / denom:.3f}")
-    print(f"Thompson sampling policy average click rate: {results['thompson'].sum() / denom:.3f}")
-    print(f"constrained oracle average click rate: {results['oracle_constrained'].sum() / denom:.3f}")
-
-    series = {
-        "random": cumulative_rate(results["random"], args.impressions_per_pull),
-        "no-edit greedy": cumulative_rate(results["no_edit_greedy"], args.impressions_per_pull),
-        "Thompson": cumulative_rate(results["thompson"], args.impressions_per_pull),
-        "Oracle (constrained)": cumulative_rate(
-            results["oracle_constrained"], args.impressions_per_pull
-        ),
+        with profiler.scope(name) if profiler is not None else nullcontext():
+            simulate_policy(
+                world,
+                policy,
+                contexts,
+                seed=args.seed + 10,
+                impressions_per_pull=args.impressions_per_pull,
+                batch_size=args.batch_size,
+                checkpoint_path=os.path.join(args.checkpoint_dir, name) if checkpointing else None,
+                checkpoint_every=args.checkpoint_every,
+                resume=args.resume,
+                metrics=metrics[name],
+                store_successes=False,
+                profiler=profiler,
+                ctr_cache=ctr_cache,
+            )
+    ctr_cache.close()
+
+    print(f"random policy average click rate: {metrics['random'].click_rate:.3f}")
+    print(f"no-edit greedy policy average click rate: {metrics['no_edit_greedy'].click_rate:.3f}")
+    print(f"Thompson sampling policy average click rate: {metrics['thompson'].click_rate:.3f}")
+    print(f"Thompson posterior memory: {ts_policy.nbytes / 2**20:.2f} MiB")
+    print(f"UCB policy average click rate: {metrics['ucb'].click_rate:.3f}")
+    print(f"Linear Thompson policy average click rate: {metrics['linear_thompson'].click_rate:.3f}")
+    print(f"constrained oracle average click rate: {metrics['oracle_constrained'].click_rate:.3f}")
+    for name, m in metrics.items():
+        print(
+            f"{name}: cumulative regret vs oracle {m.cumulative_regret:.1f}, "
+            f"edit share {m.edit_share:.3f}"
+        )
+    if profiler is not None:
+        print(profiler.table())
+        if args.profile_out:
+            profiler.dump(args.profile_out)
+
+    # The plot reads each policy's log-spaced metric snapshots, so its cost does
+    # not grow with the number of rounds.
+    labels = {
+        "random": "random",
+        "no_edit_greedy": "no-edit greedy",
+        "thompson": "Thompson",
+        "ucb": "UCB",
+        "linear_thompson": "Linear Thompson",
+        "oracle_constrained": "Oracle (constrained)",
     }
+    series = {}
+    for name, label in labels.items():
+        snapshots = metrics[name].series()
+        series[label] = (snapshots["round"], snapshots["click_rate"])
     out_path = os.path.abspath(args.plot)
     save_plot(out_path, series)
     print(f"Saved plot to {out_path}")
@@ -1,37 +1,42 @@
 import argparse
 import csv
+import json
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
 
 import numpy as np
 
-from .world import World
-from .run_sim import make_contexts, compute_acceptability_stats, simulate_policy
+from .run_sim import make_world, make_contexts, compute_acceptability_stats, simulate_policy, save_plot
+from .ctr_cache import CTRCache
+from .metrics import StreamingMetrics, read_series, seed_band
+from .profiling import PhaseProfiler, maybe_timed
+from .stacked import StackedWorld, simulate_stacked, supports_stacked
 from .policies import (
     RandomPolicy,
     NoEditGreedyPolicy,
     ThompsonPolicy,
     CohortThompsonPolicy,
+    UCBPolicy,
+    CohortUCBPolicy,
     OraclePolicy,
 )
 
 
-def run_once(
+def build_world_and_contexts(
     seed,
     rounds,
     candidate_videos,
     candidate_brands,
     num_cohorts,
     segment_len,
-    impressions_per_pull,
+    vectorized_contexts=False,
+    num_users=200,
+    num_videos=200,
+    lazy_world=False,
 ):
-    num_users = 200
-    rng = np.random.default_rng(seed + 99)
-    user_to_cohort = rng.integers(0, num_cohorts, size=num_users)
-    world = World(
-        seed=seed,
-        num_users=num_users,
-        user_to_cohort=user_to_cohort,
-        num_cohorts=num_cohorts,
+    world, user_to_cohort = make_world(
+        seed, num_cohorts, num_users=num_users, num_videos=num_videos, lazy=lazy_world
     )
     contexts = make_contexts(
         world,
@@ -41,34 +46,135 @@ def run_once(
         user_to_cohort,
         segment_len=segment_len,
         seed=seed + 1,
+        vectorized=vectorized_contexts,
     )
+    return world, contexts
+
+
+def make_thompson(world, num_cohorts, seed):
+    if num_cohorts > 1:
+        return CohortThompsonPolicy(num_cohorts, world.num_videos, world.num_brands, seed=seed + 4)
+    return ThompsonPolicy(world.num_videos, world.num_brands, seed=seed + 4)
 
-    rejected_frac, better_frac = compute_acceptability_stats(world, contexts)
 
+def make_ucb(world, num_cohorts):
     if num_cohorts > 1:
-        ts_policy = CohortThompsonPolicy(
-            num_cohorts, world.num_videos, world.num_brands, seed=seed + 4
+        return CohortUCBPolicy(num_cohorts, world.num_videos, world.num_brands)
+    return UCBPolicy(world.num_videos, world.num_brands)
+
+
+POLICY_NAMES = ("random", "no_edit_greedy", "thompson", "ucb", "oracle_constrained")
+
+
+def run_once(
+    seed,
+    rounds,
+    candidate_videos,
+    candidate_brands,
+    num_cohorts,
+    segment_len,
+    impressions_per_pull,
+    batch_size=1,
+    vectorized_contexts=False,
+    num_users=200,
+    num_videos=200,
+    lazy_world=False,
+    checkpoint_dir=None,
+    checkpoint_every=0,
+    resume=False,
+    profiler=None,
+    series_dir=None,
+):
+    # checkpoint_dir gets one checkpoint subdirectory per policy (see
+    # simulate_policy); with resume=True interrupted policies continue from it.
+    # A PhaseProfiler records setup phases under "setup" and each policy's
+    # simulation phases under the policy name. series_dir gets each policy's
+    # log-spaced StreamingMetrics snapshots as <policy>.csv.
+    with maybe_timed(profiler, "build", scope="setup"):
+        world, contexts = build_world_and_contexts(
+            seed,
+            rounds,
+            candidate_videos,
+            candidate_brands,
+            num_cohorts,
+            segment_len,
+            vectorized_contexts,
+            num_users=num_users,
+            num_videos=num_videos,
+            lazy_world=lazy_world,
         )
-    else:
-        ts_policy = ThompsonPolicy(world.num_videos, world.num_brands, seed=seed + 4)
+
+    return run_policies(
+        world,
+        contexts,
+        seed,
+        num_cohorts,
+        impressions_per_pull,
+        batch_size=batch_size,
+        checkpoint_dir=checkpoint_dir,
+        checkpoint_every=checkpoint_every,
+        resume=resume,
+        profiler=profiler,
+        series_dir=series_dir,
+    )
+
+
+def run_policies(
+    world,
+    contexts,
+    seed,
+    num_cohorts,
+    impressions_per_pull,
+    batch_size=1,
+    ctr_cache=None,
+    checkpoint_dir=None,
+    checkpoint_every=0,
+    resume=False,
+    profiler=None,
+    series_dir=None,
+):
+    # The metrics of run_once on an already built world and contexts. One
+    # true-CTR grid over the contexts serves the stats and every policy; pass
+    # ctr_cache to share it with other runs on the same world and contexts; a
+    # grid built here is released when the run ends.
+    owned = ctr_cache is None
+    if owned:
+        ctr_cache = CTRCache(world, contexts)
+    with maybe_timed(profiler, "acceptability", scope="setup"):
+        rejected_frac, better_frac = compute_acceptability_stats(world, contexts, ctr_cache=ctr_cache)
 
     policies = {
         "random": RandomPolicy(seed=seed + 2),
         "no_edit_greedy": NoEditGreedyPolicy(seed=seed + 3),
-        "thompson": ts_policy,
+        "thompson": make_thompson(world, num_cohorts, seed),
+        "ucb": make_ucb(world, num_cohorts),
         "oracle_constrained": OraclePolicy(),
     }
 
     results = {}
     for name, policy in policies.items():
-        succ = simulate_policy(
-            world,
-            policy,
-            contexts,
-            seed=seed + 10,
-            impressions_per_pull=impressions_per_pull,
-        )
-        results[name] = succ.sum() / (rounds * impressions_per_pull)
+        with profiler.scope(name) if profiler is not None else nullcontext():
+            succ = simulate_policy(
+                world,
+                policy,
+                contexts,
+                seed=seed + 10,
+                impressions_per_pull=impressions_per_pull,
+                batch_size=batch_size,
+                checkpoint_path=os.path.join(checkpoint_dir, name) if checkpoint_dir else None,
+                checkpoint_every=checkpoint_every,
+                resume=resume,
+                metrics=StreamingMetrics(
+                    impressions_per_pull, stream_path=os.path.join(series_dir, f"{name}.csv")
+                )
+                if series_dir
+                else None,
+                profiler=profiler,
+                ctr_cache=ctr_cache,
+            )
+        results[name] = succ.sum() / (len(contexts) * impressions_per_pull)
+    if owned:
+        ctr_cache.close()
 
     return {
         "rejected_frac": rejected_frac,
@@ -77,9 +183,251 @@ def run_once(
     }
 
 
+def run_stacked(
+    seeds,
+    rounds,
+    candidate_videos,
+    candidate_brands,
+    num_cohorts,
+    segment_len,
+    impressions_per_pull,
+    batch_size=1,
+    vectorized_contexts=False,
+    num_users=200,
+    num_videos=200,
+    lazy_world=False,
+):
+    # Same metrics as run_once for every seed, advancing all seeds in lockstep.
+    if batch_size != 1:
+        raise ValueError("stacked runs support batch_size=1 only")
+    built = [
+        build_world_and_contexts(
+            seed,
+            rounds,
+            candidate_videos,
+            candidate_brands,
+            num_cohorts,
+            segment_len,
+            vectorized_contexts,
+            num_users=num_users,
+            num_videos=num_videos,
+            lazy_world=lazy_world,
+        )
+        for seed in seeds
+    ]
+    worlds = [world for world, _ in built]
+    contexts_list = [contexts for _, contexts in built]
+    stacked_world = StackedWorld(worlds)
+    stats = [compute_acceptability_stats(world, contexts) for world, contexts in built]
+
+    makers = {
+        "random": lambda world, seed: RandomPolicy(seed=seed + 2),
+        "no_edit_greedy": lambda world, seed: NoEditGreedyPolicy(seed=seed + 3),
+        "thompson": lambda world, seed: make_thompson(world, num_cohorts, seed),
+        "ucb": lambda world, seed: make_ucb(world, num_cohorts),
+        "oracle_constrained": lambda world, seed: OraclePolicy(),
+    }
+    results = {}
+    for name, make in makers.items():
+        policies = [make(world, seed) for world, seed in zip(worlds, seeds)]
+        if supports_stacked(policies[0]):
+            succ = simulate_stacked(
+                stacked_world,
+                policies,
+                contexts_list,
+                [seed + 10 for seed in seeds],
+                impressions_per_pull=impressions_per_pull,
+            )
+        else:
+            succ = np.stack(
+                [
+                    simulate_policy(
+                        world, policy, contexts, seed=seed + 10, impressions_per_pull=impressions_per_pull
+                    )
+                    for world, policy, contexts, seed in zip(worlds, policies, contexts_list, seeds)
+                ]
+            )
+        results[name] = succ.sum(axis=1) / (rounds * impressions_per_pull)
+
+    return [
+        {
+            "rejected_frac": rejected_frac,
+            "better_frac": better_frac,
+            **{name: rates[i] for name, rates in results.items()},
+        }
+        for i, (rejected_frac, better_frac) in enumerate(stats)
+    ]
+
+
 def summarize(rows, key):
     vals = np.array([r[key] for r in rows], dtype=float)
-    return vals.mean(), vals.std(ddof=1)
+    return vals.mean(), (vals.std(ddof=1) if len(vals) > 1 else 0.0)
+
+
+def run_task(task, checkpoint=None, profile=False, series_dir=None):
+    # With profile=True the row carries the run's PhaseProfiler records; with
+    # series_dir the run's metric snapshots go under series_path(series_dir, task).
+    params = {k: v for k, v in task.items() if k != "variant"}
+    if checkpoint:
+        params.update(checkpoint, checkpoint_dir=checkpoint_path(checkpoint["checkpoint_dir"], task))
+    if series_dir:
+        params["series_dir"] = series_path(series_dir, task)
+    profiler = PhaseProfiler() if profile else None
+    metrics = run_once(**params, profiler=profiler)
+    row = {**task, **{k: float(v) for k, v in metrics.items()}}
+    if profiler is not None:
+        row["profile"] = profiler.records()
+    return row
+
+
+def run_task_group(tasks):
+    # Tasks that differ only in seed, run in lockstep by the stacked engine.
+    params = {k: v for k, v in tasks[0].items() if k not in ("variant", "seed")}
+    metrics = run_stacked([task["seed"] for task in tasks], **params)
+    return [{**task, **{k: float(v) for k, v in m.items()}} for task, m in zip(tasks, metrics)]
+
+
+def run_job(tasks, stacked=False, checkpoint=None, profile=False, series_dir=None):
+    if stacked:
+        return run_task_group(tasks)
+    return [run_task(task, checkpoint, profile, series_dir) for task in tasks]
+
+
+def checkpoint_path(checkpoints_dir, task):
+    return os.path.join(checkpoints_dir, f"{task['variant']}_seed{task['seed']}")
+
+
+def series_path(series_dir, task):
+    return os.path.join(series_dir, f"{task['variant']}_seed{task['seed']}")
+
+
+def has_series(series_dir, task, names=POLICY_NAMES):
+    run_dir = series_path(series_dir, task)
+    return all(os.path.exists(os.path.join(run_dir, f"{name}.csv")) for name in names)
+
+
+def run_path(runs_dir, task):
+    return os.path.join(runs_dir, f"{task['variant']}_seed{task['seed']}.json")
+
+
+def load_run(runs_dir, task):
+    path = run_path(runs_dir, task)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        row = json.load(f)
+    if any(row.get(k) != v for k, v in task.items()):
+        return None
+    return row
+
+
+def save_run(runs_dir, row):
+    path = run_path(runs_dir, row)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(row, f)
+    os.replace(tmp, path)
+
+
+def run_tasks(
+    tasks, runs_dir, workers=1, resume=False, stacked=False, checkpoint_every=0, profile=False, series=False
+):
+    # Each run derives all of its RNG streams from its own seed, so rows do not
+    # depend on worker count, stacking or completion order. Rows are persisted as
+    # they finish; with resume=True matching rows on disk are reused. With
+    # checkpoint_every, unfinished runs also checkpoint under runs_dir/checkpoints
+    # and resume=True continues them mid-run. profile=True attaches per-phase
+    # timings to each freshly computed row (see run_task). series=True streams
+    # each run's metric snapshots under runs_dir/series (see plot_seed_bands);
+    # on resume, a finished run without its series is run again.
+    if stacked and checkpoint_every:
+        raise ValueError("checkpointing is not supported for stacked runs")
+    if stacked and profile:
+        raise ValueError("profiling is not supported for stacked runs")
+    if stacked and series:
+        raise ValueError("metric series are not supported for stacked runs")
+    os.makedirs(runs_dir, exist_ok=True)
+    series_dir = os.path.join(runs_dir, "series") if series else None
+    checkpoint = None
+    if checkpoint_every:
+        checkpoint = {
+            "checkpoint_dir": os.path.join(runs_dir, "checkpoints"),
+            "checkpoint_every": checkpoint_every,
+            "resume": resume,
+        }
+    rows = {}
+    pending = []
+    for i, task in enumerate(tasks):
+        row = load_run(runs_dir, task) if resume else None
+        if row is None or (series and not has_series(series_dir, task)):
+            pending.append(i)
+        else:
+            rows[i] = row
+
+    if stacked:
+        groups = {}
+        for i in pending:
+            key = tuple(sorted((k, v) for k, v in tasks[i].items() if k != "seed"))
+            groups.setdefault(key, []).append(i)
+        jobs = list(groups.values())
+    else:
+        jobs = [[i] for i in pending]
+
+    def finish(job, job_rows):
+        for i, row in zip(job, job_rows):
+            rows[i] = row
+            save_run(runs_dir, row)
+
+    # A failing job is reported and skipped on either path, so one bad run does
+    # not abort the sweep; its rows stay pending for a later resume.
+    def report(job, exc):
+        names = ", ".join(f"{tasks[i]['variant']} seed={tasks[i]['seed']}" for i in job)
+        print(f"run {names} failed: {exc!r}")
+
+    if workers > 1 and jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_job, [tasks[i] for i in job], stacked, checkpoint, profile, series_dir): job for job in jobs}
+            for fut in as_completed(futures):
+                job = futures[fut]
+                try:
+                    result = fut.result()
+                except Exception as exc:
+                    report(job, exc)
+                    continue
+                finish(job, result)
+    else:
+        for job in jobs:
+            try:
+                result = run_job([tasks[i] for i in job], stacked, checkpoint, profile, series_dir)
+            except Exception as exc:
+                report(job, exc)
+                continue
+            finish(job, result)
+    return [rows[i] for i in sorted(rows)]
+
+
+def plot_seed_bands(rows, runs_dir, out_path, field="click_rate", labels=None):
+    # Plot each policy's seed-mean field over rounds with a +/- one std band,
+    # from the series that run_tasks(..., series=True) wrote for rows (runs of
+    # one variant, so they share snapshot rounds). Runs without series (e.g.
+    # made without series=True) are skipped with a warning.
+    labels = labels or {name: name for name in POLICY_NAMES}
+    series_dir = os.path.join(runs_dir, "series")
+    run_dirs = []
+    for row in rows:
+        if has_series(series_dir, row, names=list(labels)):
+            run_dirs.append(series_path(series_dir, row))
+        else:
+            print(f"skipping {row['variant']} seed={row['seed']}: no metric series under {series_dir}")
+    if not run_dirs:
+        raise ValueError(f"no metric series under {series_dir}; run with series=True")
+    series, bands = {}, {}
+    for name, label in labels.items():
+        runs = [read_series(os.path.join(run_dir, f"{name}.csv")) for run_dir in run_dirs]
+        rounds, mean, low, high = seed_band(runs, field)
+        series[label] = (rounds, mean)
+        bands[label] = (rounds, low, high)
+    save_plot(out_path, series, bands=bands)
 
 
 def main():
@@ -89,12 +437,28 @@ def main():
     parser.add_argument("--candidate-videos", type=int, default=12)
     parser.add_argument("--candidate-brands", type=int, default=5)
     parser.add_argument("--num-cohorts", type=int, default=8)
+    parser.add_argument("--num-users", type=int, default=200)
+    parser.add_argument("--num-videos", type=int, default=200)
+    parser.add_argument("--lazy-world", action="store_true")
     parser.add_argument("--segment-len", type=int, default=1)
     parser.add_argument("--impressions-per-pull", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--vectorized-contexts", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--stacked", action="store_true")
+    parser.add_argument("--checkpoint-every", type=int, default=0)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--profile-out", type=str, default=None)
+    parser.add_argument("--series", action="store_true")
+    parser.add_argument("--plot", type=str, default=None)
+    parser.add_argument("--runs-dir", type=str, default="results/runs")
     parser.add_argument("--out-csv", type=str, default="results/seed_sweep.csv")
     parser.add_argument("--out-summary", type=str, default="results/summary_table.md")
     args = parser.parse_args()
 
+    if args.workers < 1:
+        raise ValueError("workers must be >= 1")
     os.makedirs(os.path.dirname(args.out_csv), exist_ok=True)
 
     seed_list = list(range(args.seeds))
@@ -103,73 +467,98 @@ def main():
         ("ablation_no_cohorts", 1, args.segment_len),
     ]
 
-    all_rows = []
-    for variant, num_cohorts, segment_len in variants:
-        for seed in seed_list:
-            metrics = run_once(
-                seed=seed,
-                rounds=args.rounds,
-                candidate_videos=args.candidate_videos,
-                candidate_brands=args.candidate_brands,
-                num_cohorts=num_cohorts,
-                segment_len=segment_len,
-                impressions_per_pull=args.impressions_per_pull,
-            )
-            row = {
-                "variant": variant,
-                "seed": seed,
-                "rounds": args.rounds,
-                "candidate_videos": args.candidate_videos,
-                "candidate_brands": args.candidate_brands,
-                "num_cohorts": num_cohorts,
-                "segment_len": segment_len,
-                "impressions_per_pull": args.impressions_per_pull,
-                **metrics,
-            }
-            all_rows.append(row)
+    tasks = [
+        {
+            "variant": variant,
+            "seed": seed,
+            "rounds": args.rounds,
+            "candidate_videos": args.candidate_videos,
+            "candidate_brands": args.candidate_brands,
+            "num_cohorts": num_cohorts,
+            "segment_len": segment_len,
+            "impressions_per_pull": args.impressions_per_pull,
+            "batch_size": args.batch_size,
+            "vectorized_contexts": args.vectorized_contexts,
+            "num_users": args.num_users,
+            "num_videos": args.num_videos,
+            "lazy_world": args.lazy_world,
+        }
+        for variant, num_cohorts, segment_len in variants
+        for seed in seed_list
+    ]
+    all_rows = run_tasks(
+        tasks,
+        args.runs_dir,
+        workers=args.workers,
+        resume=args.resume,
+        stacked=args.stacked,
+        checkpoint_every=args.checkpoint_every,
+        profile=args.profile,
+        series=args.series or bool(args.plot),
+    )
 
     fieldnames = [
         "variant",
         "seed",
         "rounds",
+        "num_users",
+        "num_videos",
         "candidate_videos",
         "candidate_brands",
         "num_cohorts",
         "segment_len",
         "impressions_per_pull",
+        "batch_size",
         "rejected_frac",
         "better_frac",
         "random",
         "no_edit_greedy",
         "thompson",
+        "ucb",
         "oracle_constrained",
     ]
     with open(args.out_csv, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
         writer.writeheader()
         writer.writerows(all_rows)
 
     summary_lines = []
-    summary_lines.append("| Variant | Random (mean±std) | No-edit (mean±std) | Thompson (mean±std) | Oracle (mean±std) | TS - Random | TS - No-edit |")
-    summary_lines.append("|---|---|---|---|---|---|---|")
+    summary_lines.append("| Variant | Random (mean±std) | No-edit (mean±std) | Thompson (mean±std) | UCB (mean±std) | Oracle (mean±std) | TS - Random | TS - No-edit |")
+    summary_lines.append("|---|---|---|---|---|---|---|---|")
 
     for variant, _num_cohorts, _segment_len in variants:
         rows = [r for r in all_rows if r["variant"] == variant]
+        if not rows:
+            continue
         rand_mean, rand_std = summarize(rows, "random")
         ne_mean, ne_std = summarize(rows, "no_edit_greedy")
         ts_mean, ts_std = summarize(rows, "thompson")
+        ucb_mean, ucb_std = summarize(rows, "ucb")
         or_mean, or_std = summarize(rows, "oracle_constrained")
         uplift_rand = ts_mean - rand_mean
         uplift_ne = ts_mean - ne_mean
         summary_lines.append(
             f"| {variant} | {rand_mean:.3f}±{rand_std:.3f} | {ne_mean:.3f}±{ne_std:.3f} | "
-            f"{ts_mean:.3f}±{ts_std:.3f} | {or_mean:.3f}±{or_std:.3f} | "
+            f"{ts_mean:.3f}±{ts_std:.3f} | {ucb_mean:.3f}±{ucb_std:.3f} | {or_mean:.3f}±{or_std:.3f} | "
             f"{uplift_rand:.3f} | {uplift_ne:.3f} |"
         )
 
     with open(args.out_summary, "w") as f:
         f.write("\n".join(summary_lines) + "\n")
 
+    if args.profile:
+        profiler = PhaseProfiler()
+        for row in all_rows:
+            profiler.merge(row.get("profile", []))
+        print(profiler.table())
+        if args.profile_out:
+            profiler.dump(args.profile_out)
+
+    if args.plot:
+        out_path = os.path.abspath(args.plot)
+        plot_seed_bands([r for r in all_rows if r["variant"] == "main"], args.runs_dir, out_path)
+        print(f"Saved seed-band plot of the main variant to {out_path}")
+
 
 if __name__ == "__main__":
     main()
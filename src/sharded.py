@@ -0,0 +1,301 @@
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+
+from .contexts import as_context_batch
+from .metrics import StreamingMetrics
+from .policies import ThompsonPolicy, CohortThompsonPolicy
+from .run_sim import RoundKeyedRewards, make_world, make_contexts, simulate_policy
+from .seed_sweep import make_thompson
+
+# Sharded single-run simulation: rounds are split over shards that each serve
+# their share against a replica of one shared posterior, learning into it
+# locally. Every sync_every rounds the replicas' deltas are summed into the
+# shared posterior and handed back out, as a serving fleet would sync. Beta
+# counts are additive and rewards are drawn per global round, so with one
+# shard this is an ordinary run (simulate_policy with RoundKeyedRewards) for
+# any sync_every.
+
+# Additive count arrays of each mergeable policy (dense backend only).
+MERGEABLE_COUNTS = {
+    ThompsonPolicy: ("alpha", "beta"),
+    CohortThompsonPolicy: ("successes", "failures"),
+}
+PARTITIONS = ("rounds", "users")
+
+
+def mergeable(policy):
+    return type(policy) in MERGEABLE_COUNTS and getattr(policy, "backend", "dense") == "dense"
+
+
+def shard_assignment(contexts, num_shards, partition="rounds"):
+    # Shard of every round: round-robin over rounds, or by user id so each
+    # user is always served by the same shard.
+    if partition == "rounds":
+        return np.arange(len(contexts)) % num_shards
+    if partition == "users":
+        return np.asarray(contexts.users) % num_shards
+    raise ValueError(f"partition must be one of {', '.join(PARTITIONS)}")
+
+
+class _Shard:
+    # A shard's policy replica and the rounds it owns. The replica and base (the
+    # shared posterior as of the last sync) start from the shared counts; only
+    # sparse updates cross the process boundary after that. run() applies the
+    # merged update of the last sync, serves the owned rounds in [start, stop)
+    # and returns its own update as (flat index, increment) per count array,
+    # with the rounds' clicks, regret and edit count. The replica is then reset
+    # to base until the merged update arrives. Rewards are keyed by (seed,
+    # global round), so results do not depend on whether shards run in
+    # processes or on how rounds are cut into epochs.
+    def __init__(self, index, world, contexts, rows, policy, shared, seed, impressions_per_pull, batch_size):
+        self.index = index
+        self.world = world
+        self.contexts = contexts
+        self.rows = rows
+        self.policy = policy
+        self.names = MERGEABLE_COUNTS[type(policy)]
+        self.base = [counts.copy() for counts in shared]
+        for name, counts in zip(self.names, shared):
+            setattr(policy, name, counts.copy())
+        self.seed = seed
+        self.impressions_per_pull = impressions_per_pull
+        self.batch_size = batch_size
+
+    def run(self, merged, start, stop):
+        for name, base, (index, increment) in zip(self.names, self.base, merged or ()):
+            np.add.at(base.reshape(-1), index, increment)
+            np.add.at(getattr(self.policy, name).reshape(-1), index, increment)
+        rows = self.rows[np.searchsorted(self.rows, start) : np.searchsorted(self.rows, stop)]
+        metrics = StreamingMetrics(self.impressions_per_pull, checkpoint_every=max(len(rows), 1))
+        successes = simulate_policy(
+            self.world,
+            self.policy,
+            self.contexts[rows],
+            impressions_per_pull=self.impressions_per_pull,
+            batch_size=self.batch_size,
+            metrics=metrics,
+            rewards=RoundKeyedRewards(self.seed, self.impressions_per_pull, rounds=rows),
+        )
+        update = []
+        for name, base in zip(self.names, self.base):
+            counts = getattr(self.policy, name).reshape(-1)
+            index = np.flatnonzero(counts != base.reshape(-1))
+            update.append((index, counts[index] - base.reshape(-1)[index]))
+            counts[index] = base.reshape(-1)[index]
+        return rows, successes, update, metrics.cumulative_regret, metrics.edits
+
+
+class _LocalShard:
+    def __init__(self, shard):
+        self.shard = shard
+
+    def submit(self, *args):
+        self._result = self.shard.run(*args)
+
+    def result(self):
+        return self._result
+
+    def close(self, abort=False):
+        pass
+
+
+def _serve(conn, shard):
+    while True:
+        args = conn.recv()
+        if args is None:
+            break
+        try:
+            conn.send(shard.run(*args))
+        except Exception as exc:
+            conn.send(exc)
+
+
+class _ShardProcess:
+    # A shard living in its own worker process; submit() returns immediately so
+    # every shard serves its epoch concurrently.
+    def __init__(self, shard, mp_context):
+        self.conn, child = mp_context.Pipe()
+        self.process = mp_context.Process(target=_serve, args=(child, shard), daemon=True)
+        self.process.start()
+
+    def submit(self, *args):
+        self.conn.send(args)
+
+    def result(self):
+        result = self.conn.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self, abort=False):
+        # After a failure a worker may still be blocked sending a result nobody
+        # will read, so it is terminated rather than asked to stop.
+        if abort:
+            self.process.terminate()
+        else:
+            self.conn.send(None)
+        self.process.join()
+
+
+def simulate_sharded(
+    world,
+    make_policy,
+    contexts,
+    num_shards,
+    sync_every,
+    seed=0,
+    impressions_per_pull=1,
+    batch_size=1,
+    partition="rounds",
+    processes=True,
+):
+    # make_policy(shard) builds each shard's replica (its own sampling stream);
+    # replicas start from shard 0's prior. Epochs of sync_every rounds are served
+    # by all shards in parallel (one worker process each unless processes=False)
+    # and merged at the end of every epoch. Returns per-round successes, the
+    # merged posterior counts and run totals; throughput counts the epoch loop
+    # only, not worker start-up.
+    if num_shards < 1:
+        raise ValueError("num_shards must be >= 1")
+    if sync_every < 1:
+        raise ValueError("sync_every must be >= 1")
+    contexts = as_context_batch(contexts)
+    policies = [make_policy(shard) for shard in range(num_shards)]
+    if not all(mergeable(policy) for policy in policies):
+        raise ValueError("sharded runs need a dense ThompsonPolicy or CohortThompsonPolicy")
+    assignment = shard_assignment(contexts, num_shards, partition)
+    shared = [getattr(policies[0], name).copy() for name in MERGEABLE_COUNTS[type(policies[0])]]
+
+    shards = [
+        _Shard(
+            i,
+            world,
+            contexts,
+            np.flatnonzero(assignment == i),
+            policy,
+            shared,
+            seed,
+            impressions_per_pull,
+            batch_size,
+        )
+        for i, policy in enumerate(policies)
+    ]
+    if processes and num_shards > 1:
+        mp_context = multiprocessing.get_context()
+        handles = [_ShardProcess(shard, mp_context) for shard in shards]
+    else:
+        handles = [_LocalShard(shard) for shard in shards]
+
+    successes = np.zeros(len(contexts))
+    merged = None
+    regret = 0.0
+    edits = 0
+    syncs = 0
+    failed = True
+    started = time.perf_counter()
+    try:
+        for start in range(0, len(contexts), sync_every):
+            stop = min(start + sync_every, len(contexts))
+            for handle in handles:
+                handle.submit(merged, start, stop)
+            # Read every shard's result before raising, so no worker is left
+            # blocked on a full pipe.
+            results, errors = [], []
+            for handle in handles:
+                try:
+                    results.append(handle.result())
+                except Exception as exc:
+                    errors.append(exc)
+            if errors:
+                raise errors[0]
+            for rows, succ, _update, shard_regret, shard_edits in results:
+                successes[rows] = succ
+                regret += shard_regret
+                edits += shard_edits
+            # Shards serve disjoint rounds but may touch the same arms, so the
+            # merged update keeps every shard's entries (applied with add.at).
+            merged = []
+            for counts, updates in zip(shared, zip(*[result[2] for result in results])):
+                index = np.concatenate([index for index, _ in updates])
+                increment = np.concatenate([increment for _, increment in updates])
+                np.add.at(counts.reshape(-1), index, increment)
+                merged.append((index, increment))
+            syncs += 1
+        failed = False
+    finally:
+        for handle in handles:
+            handle.close(abort=failed)
+    seconds = time.perf_counter() - started
+
+    rounds = max(len(contexts), 1)
+    return {
+        "successes": successes,
+        "posterior": shared,
+        "click_rate": float(successes.sum()) / (rounds * impressions_per_pull),
+        "cumulative_regret": regret,
+        "edit_share": edits / rounds,
+        "syncs": syncs,
+        "seconds": seconds,
+        "rounds_per_sec": len(contexts) / seconds if seconds > 0 else float("inf"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20000)
+    parser.add_argument("--candidate-videos", type=int, default=12)
+    parser.add_argument("--candidate-brands", type=int, default=5)
+    parser.add_argument("--num-cohorts", type=int, default=1)
+    parser.add_argument("--num-users", type=int, default=200)
+    parser.add_argument("--num-videos", type=int, default=200)
+    parser.add_argument("--impressions-per-pull", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sync-every", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--partition", choices=PARTITIONS, default="rounds")
+    parser.add_argument("--in-process", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    world, user_to_cohort = make_world(
+        args.seed, args.num_cohorts, num_users=args.num_users, num_videos=args.num_videos
+    )
+    contexts = make_contexts(
+        world,
+        args.rounds,
+        args.candidate_videos,
+        args.candidate_brands,
+        user_to_cohort,
+        seed=args.seed + 1,
+        vectorized=True,
+    )
+
+    print("| Shards | Sync every | Click rate | Cumulative regret | Syncs | Rounds/sec |")
+    print("|---|---|---|---|---|---|")
+    for num_shards in args.shards:
+        for sync_every in args.sync_every:
+            report = simulate_sharded(
+                world,
+                lambda shard: make_thompson(world, args.num_cohorts, args.seed + 1000 * shard),
+                contexts,
+                num_shards,
+                sync_every,
+                seed=args.seed + 10,
+                impressions_per_pull=args.impressions_per_pull,
+                batch_size=args.batch_size,
+                partition=args.partition,
+                processes=not args.in_process,
+            )
+            print(
+                f"| {num_shards} | {sync_every} | {report['click_rate']:.4f} "
+                f"| {report['cumulative_regret']:.1f} | {report['syncs']} "
+                f"| {report['rounds_per_sec']:.0f} |",
+                flush=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
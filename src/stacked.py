@@ -0,0 +1,186 @@
+import numpy as np
+
+from .world import ACTION_NO_EDIT, ACTION_EDIT, sigmoid
+from .contexts import as_context_batch
+from .policies import (
+    RandomPolicy,
+    NoEditGreedyPolicy,
+    ThompsonPolicy,
+    CohortThompsonPolicy,
+    OraclePolicy,
+)
+
+# Lockstep simulation of one policy over S seeds ("lanes"). Scoring, argmax,
+# CTR lookups and posterior updates are single stacked operations per round,
+# but every lane keeps its own Generators so it reproduces its per-seed run
+# bit for bit. The Beta and binomial draws (and RandomPolicy's integer draws)
+# therefore remain one call per lane per round: that part of the cost still
+# grows linearly with the seed count, and with one or two lanes stacking is
+# no faster than per-seed runs. On this repo's default world (2000 rounds,
+# 12 x 5 candidates), 16 lanes ran Thompson at about 40 us per lane-round
+# against about 60-90 us per seed, and RandomPolicy at about 13 against 25-35.
+
+
+class StackedWorld:
+    # S worlds of identical shape with their CTR tables stacked on a leading lane
+    # axis, so one expression scores the current round of every lane.
+    def __init__(self, worlds):
+        shapes = {(w.num_users, w.num_videos, w.num_brands, w.dim) for w in worlds}
+        if len(shapes) != 1:
+            raise ValueError("stacked worlds must share num_users, num_videos, num_brands and dim")
+        if not all(w.use_tables for w in worlds):
+            raise ValueError("stacked worlds need precomputed CTR tables")
+        self.worlds = list(worlds)
+        self.num_lanes = len(worlds)
+        self.num_users, self.num_videos, self.num_brands, self.dim = shapes.pop()
+        self.beta0 = np.array([w.beta0 for w in worlds])
+        self.gamma = np.array([w.gamma for w in worlds])
+        self.delta = np.array([w.delta for w in worlds])
+        self.p_u = np.stack([w.p_u for w in worlds])
+        self.video_norm = np.stack([w.video_norm for w in worlds])
+        self.edited_norm = np.stack([w.edited_norm for w in worlds])
+        self.brand_video_fit = np.stack([w.brand_video_fit for w in worlds])
+        self.user_brand_affinity = np.stack([w.user_brand_affinity for w in worlds])
+        self.acceptable = np.stack([w.acceptable for w in worlds])
+
+    def expected_ctr_batch(self, lanes, user_ids, video_ids, brand_ids, action_ids):
+        s, u, v, b, a = np.broadcast_arrays(lanes, user_ids, video_ids, brand_ids, action_ids)
+        x_vp_norm = np.where(
+            (a == ACTION_EDIT)[..., None], self.edited_norm[s, v, b], self.video_norm[s, v]
+        )
+        logit = (
+            self.beta0[s]
+            + np.einsum("...d,...d->...", self.p_u[s, u], x_vp_norm)
+            + self.gamma[s] * self.user_brand_affinity[s, u, b]
+            + self.delta[s] * self.brand_video_fit[s, v, b, a]
+        )
+        return sigmoid(logit)
+
+    def expected_ctr_grid(self, user_ids, candidate_videos, candidate_brands):
+        # (S, Kv, Kb, 2) grid for one context per lane.
+        lanes = np.arange(self.num_lanes)[:, None, None, None]
+        return self.expected_ctr_batch(
+            lanes,
+            np.asarray(user_ids)[:, None, None, None],
+            np.asarray(candidate_videos)[:, :, None, None],
+            np.asarray(candidate_brands)[:, None, :, None],
+            np.array([ACTION_NO_EDIT, ACTION_EDIT]),
+        )
+
+    def feasible_mask(self, candidate_videos, candidate_brands):
+        lanes = np.arange(self.num_lanes)[:, None, None]
+        accept = self.acceptable[lanes, candidate_videos[:, :, None], candidate_brands[:, None, :]]
+        mask = np.ones(accept.shape + (2,), dtype=bool)
+        mask[..., ACTION_EDIT] = accept
+        return mask
+
+
+STACKED_POLICIES = (RandomPolicy, NoEditGreedyPolicy, ThompsonPolicy, CohortThompsonPolicy, OraclePolicy)
+
+
+def supports_stacked(policy):
+    # The stacked engine walks dense (V, B, 2) posteriors; sparse ones run per seed.
+    return type(policy) in STACKED_POLICIES and getattr(policy, "backend", "dense") == "dense"
+
+
+def stack_contexts(contexts_list):
+    batches = [as_context_batch(c) for c in contexts_list]
+    if len({(len(c), c.num_candidate_videos, c.num_candidate_brands) for c in batches}) != 1:
+        raise ValueError("stacked contexts must share rounds and candidate counts")
+    return (
+        np.stack([c.users for c in batches]),
+        np.stack([c.cohorts for c in batches]),
+        np.stack([c.videos for c in batches]),
+        np.stack([c.brands for c in batches]),
+    )
+
+
+def _thompson_state(policies):
+    # Posteriors as (S, C, V, B, 2) float stacks plus each lane's per-cohort Generators.
+    if all(isinstance(p, CohortThompsonPolicy) for p in policies):
+        alpha = np.stack([p.alpha for p in policies])
+        beta = np.stack([p.beta for p in policies])
+        return alpha, beta, [p.rngs for p in policies], True
+    alpha = np.stack([p.alpha for p in policies])[:, None]
+    beta = np.stack([p.beta for p in policies])[:, None]
+    return alpha, beta, [[p.rng] for p in policies], False
+
+
+def _write_back(policies, alpha, beta, per_cohort):
+    for s, policy in enumerate(policies):
+        if per_cohort:
+            policy.successes[...] = alpha[s] - policy.alpha0
+            policy.failures[...] = beta[s] - policy.beta0
+        else:
+            policy.alpha[...] = alpha[s, 0]
+            policy.beta[...] = beta[s, 0]
+
+
+def simulate_stacked(stacked_world, policies, contexts_list, seeds, impressions_per_pull=1):
+    # Lockstep equivalent of running simulate_policy(world_s, policies[s],
+    # contexts_list[s], seed=seeds[s]) for every lane s. Gathers, argmaxes, CTRs and
+    # posterior updates are single stacked operations per round; Beta, integer and
+    # binomial draws stay on each lane's own Generator so every lane reproduces its
+    # reference run exactly. Learned posteriors are written back into `policies`.
+    num_lanes = stacked_world.num_lanes
+    if not (len(policies) == len(contexts_list) == len(seeds) == num_lanes):
+        raise ValueError("need one policy, context set and seed per stacked world")
+    kinds = {type(p) for p in policies}
+    if len(kinds) != 1:
+        raise ValueError("stacked lanes must run the same policy type")
+    kind = kinds.pop()
+    if kind not in STACKED_POLICIES:
+        raise TypeError(f"no stacked implementation for {kind.__name__}")
+
+    users, cohorts, videos, brands = stack_contexts(contexts_list)
+    click_rngs = [np.random.default_rng(s) for s in seeds]
+    lanes = np.arange(num_lanes)
+    num_rounds = users.shape[1]
+    successes = np.zeros((num_lanes, num_rounds), dtype=float)
+
+    if kind in (ThompsonPolicy, CohortThompsonPolicy):
+        alpha, beta, ts_rngs, per_cohort = _thompson_state(policies)
+
+    for t in range(num_rounds):
+        u, vids, bs = users[:, t], videos[:, t], brands[:, t]
+        mask = stacked_world.feasible_mask(vids, bs)
+        if kind is OraclePolicy:
+            scores = np.where(mask, stacked_world.expected_ctr_grid(u, vids, bs), -np.inf)
+        elif kind is NoEditGreedyPolicy:
+            scores = np.full(mask.shape, -np.inf)
+            scores[..., ACTION_NO_EDIT] = stacked_world.expected_ctr_batch(
+                lanes[:, None, None], u[:, None, None], vids[:, :, None], bs[:, None, :], ACTION_NO_EDIT
+            )
+        elif kind is RandomPolicy:
+            scores = np.full(mask.shape, -np.inf)
+            flat = mask.reshape(num_lanes, -1)
+            for s in range(num_lanes):
+                feasible = np.flatnonzero(flat[s])
+                scores.reshape(num_lanes, -1)[s, feasible[policies[s].rng.integers(len(feasible))]] = 0.0
+        else:
+            c = cohorts[:, t] if per_cohort else np.zeros(num_lanes, dtype=int)
+            idx = (lanes[:, None, None], c[:, None, None], vids[:, :, None], bs[:, None, :])
+            # Feasible arms of all lanes are gathered once; each lane then makes
+            # a single beta call on its own slice.
+            a_flat, b_flat = alpha[idx][mask], beta[idx][mask]
+            bounds = np.cumsum(mask.reshape(num_lanes, -1).sum(axis=1)).tolist()
+            draws = np.empty(len(a_flat))
+            lo = 0
+            for s, (hi, cohort) in enumerate(zip(bounds, c.tolist())):
+                draws[lo:hi] = ts_rngs[s][cohort].beta(a_flat[lo:hi], b_flat[lo:hi])
+                lo = hi
+            scores = np.full(mask.shape, -np.inf)
+            scores[mask] = draws
+
+        iv, ib, a = np.unravel_index(np.argmax(scores.reshape(num_lanes, -1), axis=1), mask.shape[1:])
+        v, b = vids[lanes, iv], bs[lanes, ib]
+        p = stacked_world.expected_ctr_batch(lanes, u, v, b, a)
+        succ = np.array([rng.binomial(impressions_per_pull, p_s) for rng, p_s in zip(click_rngs, p.tolist())])
+        if kind in (ThompsonPolicy, CohortThompsonPolicy):
+            alpha[lanes, c, v, b, a] += succ
+            beta[lanes, c, v, b, a] += impressions_per_pull - succ
+        successes[:, t] = succ
+
+    if kind in (ThompsonPolicy, CohortThompsonPolicy):
+        _write_back(policies, alpha, beta, per_cohort)
+    return successes
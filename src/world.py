@@ -1,9 +1,16 @@
+from collections import OrderedDict
+
 import numpy as np
 
 
 ACTION_NO_EDIT = 0
 ACTION_EDIT = 1
 
+# Budget for World's precomputed CTR tables (float64): edited embeddings V*B*d
+# dominate, plus V*d normalized videos, V*B*2 brand-video fit and U*B affinity.
+# With precompute_tables="auto", worlds over budget score CTRs on the fly.
+TABLE_BUDGET_BYTES = 256 * 2**20
+
 
 def sigmoid(z):
     return 1.0 / (1.0 + np.exp(-z))
@@ -28,7 +35,11 @@ class World:
         num_cohorts=1,
         cohort_noise=0.1,
         seed=0,
+        precompute_tables="auto",
+        table_budget_bytes=TABLE_BUDGET_BYTES,
     ):
+        if precompute_tables not in ("auto", True, False):
+            raise ValueError("precompute_tables must be 'auto', True or False")
         self.rng = np.random.default_rng(seed)
         self.num_users = num_users
         self.num_videos = num_videos
@@ -57,33 +68,274 @@ class World:
         self.s_v = self.rng.beta(editability_alpha, editability_beta, size=num_videos)
         self.kappa_b = self.rng.uniform(kappa_low, kappa_high, size=num_brands)
 
+        self.precompute_tables = precompute_tables
+        self.table_budget_bytes = table_budget_bytes
+        self._tables = None
+        self._acceptable = None
+
     def _sample_unit_vectors(self, n, d):
         x = self.rng.normal(size=(n, d))
         norms = np.linalg.norm(x, axis=1, keepdims=True) + 1e-12
         return x / norms
 
+    def table_nbytes(self):
+        V, B, U, d = self.num_videos, self.num_brands, self.num_users, self.dim
+        return 8 * (V * B * d + V * d + V * B * 2 + U * B)
+
+    @property
+    def use_tables(self):
+        if self.precompute_tables == "auto":
+            return self.table_nbytes() <= self.table_budget_bytes
+        return self.precompute_tables
+
+    def _get_tables(self):
+        if self._tables is None:
+            x_norm = self.x_v / (np.linalg.norm(self.x_v, axis=1, keepdims=True) + 1e-12)
+            edited = self.x_v[:, None, :] + self.eta * self.q_hat[None, :, :]
+            edited_norm = edited / (np.linalg.norm(edited, axis=-1, keepdims=True) + 1e-12)
+            fit = np.empty((self.num_videos, self.num_brands, 2))
+            fit[..., ACTION_NO_EDIT] = x_norm @ self.q_b.T
+            fit[..., ACTION_EDIT] = np.einsum("vbd,bd->vb", edited_norm, self.q_b)
+            self._tables = {
+                "video_norm": x_norm,
+                "edited_norm": edited_norm,
+                "brand_video_fit": fit,
+                "user_brand_affinity": self.p_u @ self.q_b.T,
+            }
+        return self._tables
+
+    @property
+    def video_norm(self):
+        return self._get_tables()["video_norm"]
+
+    @property
+    def edited_norm(self):
+        return self._get_tables()["edited_norm"]
+
+    @property
+    def brand_video_fit(self):
+        return self._get_tables()["brand_video_fit"]
+
+    @property
+    def user_brand_affinity(self):
+        return self._get_tables()["user_brand_affinity"]
+
     def apply_edit(self, video_id, brand_id):
         return self.x_v[video_id] + self.eta * self.q_hat[brand_id]
 
+    @property
+    def acceptable(self):
+        # V x B boolean matrix of feasible edits: eta <= kappa_b * s_v.
+        if self._acceptable is None:
+            self._acceptable = self.eta <= self.s_v[:, None] * self.kappa_b[None, :]
+        return self._acceptable
+
+    def edit_acceptable_batch(self, video_ids, brand_ids):
+        return self.acceptable[video_ids, brand_ids]
+
     def is_edit_acceptable(self, video_id, brand_id):
-        return self.eta <= self.kappa_b[brand_id] * self.s_v[video_id]
+        return self.edit_acceptable_batch(video_id, brand_id)
 
-    def expected_ctr(self, user_id, video_id, brand_id, action_id):
-        p_u = self.p_u[user_id]
-        q_b = self.q_b[brand_id]
-        if action_id == ACTION_EDIT:
-            x_vp = self.apply_edit(video_id, brand_id)
-        else:
-            x_vp = self.x_v[video_id]
-        x_vp_norm = x_vp / (np.linalg.norm(x_vp) + 1e-12)
+    def expected_ctr_batch(self, user_ids, video_ids, brand_ids, action_ids):
+        u, v, b, a = np.broadcast_arrays(
+            np.asarray(user_ids), np.asarray(video_ids), np.asarray(brand_ids), np.asarray(action_ids)
+        )
+        if self.use_tables:
+            x_vp_norm = np.where(
+                (a == ACTION_EDIT)[..., None], self.edited_norm[v, b], self.video_norm[v]
+            )
+            logit = (
+                self.beta0
+                + np.einsum("...d,...d->...", self.p_u[u], x_vp_norm)
+                + self.gamma * self.user_brand_affinity[u, b]
+                + self.delta * self.brand_video_fit[v, b, a]
+            )
+            return sigmoid(logit)
+
+        p_u = self.p_u[u]
+        q_b = self.q_b[b]
+        edit = (a == ACTION_EDIT)[..., None]
+        x_vp = np.where(edit, self.x_v[v] + self.eta * self.q_hat[b], self.x_v[v])
+        x_vp_norm = x_vp / (np.linalg.norm(x_vp, axis=-1, keepdims=True) + 1e-12)
         logit = (
             self.beta0
-            + np.dot(p_u, x_vp_norm)
-            + self.gamma * np.dot(p_u, q_b)
-            + self.delta * np.dot(q_b, x_vp_norm)
+            + np.einsum("...d,...d->...", p_u, x_vp_norm)
+            + self.gamma * np.einsum("...d,...d->...", p_u, q_b)
+            + self.delta * np.einsum("...d,...d->...", q_b, x_vp_norm)
         )
-        return float(sigmoid(logit))
+        return sigmoid(logit)
+
+    def expected_ctr_grid(self, user_ids, candidate_videos, candidate_brands):
+        # (..., Kv, Kb, 2) grid over every (video, brand, action) of each context;
+        # leading dims come from user_ids, with per-context candidates as (..., Kv) / (..., Kb).
+        u = np.asarray(user_ids)[..., None, None, None]
+        v = np.asarray(candidate_videos)[..., :, None, None]
+        b = np.asarray(candidate_brands)[..., None, :, None]
+        a = np.array([ACTION_NO_EDIT, ACTION_EDIT])
+        return self.expected_ctr_batch(u, v, b, a)
+
+    def expected_ctr(self, user_id, video_id, brand_id, action_id):
+        return float(self.expected_ctr_batch(user_id, video_id, brand_id, action_id))
 
     def sample_click(self, user_id, video_id, brand_id, action_id, rng):
         p = self.expected_ctr(user_id, video_id, brand_id, action_id)
         return 1 if rng.random() < p else 0
+
+
+class LazyWorld:
+    # World whose users and videos are never materialized: rows of p_u, x_v and s_v
+    # are derived from (seed, entity id) with a counter-based Philox stream per
+    # block of block_size ids, and the most recently touched blocks are kept in
+    # an LRU cache of cache_blocks entries. Brands and cohort centres are small
+    # and drawn eagerly. Memory is O(cache_blocks * block_size * dim) regardless
+    # of catalog size; only user_to_cohort (if given) is held in full.
+    def __init__(
+        self,
+        num_users=200,
+        num_videos=200,
+        num_brands=5,
+        dim=12,
+        beta0=0.0,
+        gamma=0.5,
+        delta=0.01,
+        eta=0.35,
+        kappa_low=0.8,
+        kappa_high=1.2,
+        editability_alpha=2.0,
+        editability_beta=2.0,
+        user_to_cohort=None,
+        num_cohorts=1,
+        cohort_noise=0.1,
+        seed=0,
+        block_size=64,
+        cache_blocks=4096,
+    ):
+        if user_to_cohort is not None:
+            if len(user_to_cohort) != num_users:
+                raise ValueError("user_to_cohort length must match num_users")
+            if num_cohorts < 1:
+                raise ValueError("num_cohorts must be >= 1")
+        if block_size < 1 or cache_blocks < 1:
+            raise ValueError("block_size and cache_blocks must be >= 1")
+        self.num_users = num_users
+        self.num_videos = num_videos
+        self.num_brands = num_brands
+        self.dim = dim
+        self.beta0 = beta0
+        self.gamma = gamma
+        self.delta = delta
+        self.eta = eta
+        self.editability_alpha = editability_alpha
+        self.editability_beta = editability_beta
+        self.user_to_cohort = None if user_to_cohort is None else np.asarray(user_to_cohort)
+        self.cohort_noise = cohort_noise
+        self.block_size = block_size
+        self.cache_blocks = cache_blocks
+        self.use_tables = False
+
+        self._key = np.random.SeedSequence(seed).generate_state(2, dtype=np.uint64)
+        rng = self._block_rng(0, 0)
+        self.q_b = _unit_vectors(rng, num_brands, dim)
+        self.q_hat = self.q_b
+        self.kappa_b = rng.uniform(kappa_low, kappa_high, size=num_brands)
+        self.cohort_centered = None
+        if self.user_to_cohort is not None:
+            cohort_vecs = _unit_vectors(rng, num_cohorts, dim)
+            self.cohort_centered = cohort_vecs - cohort_vecs.mean(axis=0, keepdims=True)
+        self._cache = OrderedDict()
+
+    def _block_rng(self, kind, block):
+        # Philox increments the lowest counter word as it draws, so (kind, block)
+        # go in the high words; each block's stream starts 2**128 draws apart.
+        return np.random.Generator(np.random.Philox(key=self._key, counter=[0, 0, block, kind]))
+
+    def _make_block(self, kind, block):
+        rng = self._block_rng(kind, block)
+        start = block * self.block_size
+        stop = min(start + self.block_size, self.num_users if kind == 1 else self.num_videos)
+        n = stop - start
+        if kind == 1:
+            if self.cohort_centered is None:
+                return {"p_u": _unit_vectors(rng, n, self.dim)}
+            cohorts = self.user_to_cohort[start:stop]
+            noise = rng.normal(size=(n, self.dim))
+            return {"p_u": self.cohort_centered[cohorts] + self.cohort_noise * noise}
+        return {
+            "x_v": _unit_vectors(rng, n, self.dim),
+            "s_v": rng.beta(self.editability_alpha, self.editability_beta, size=n),
+        }
+
+    def _block(self, kind, block):
+        key = (kind, block)
+        rows = self._cache.get(key)
+        if rows is None:
+            rows = self._make_block(kind, block)
+            self._cache[key] = rows
+            if len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return rows
+
+    def _rows(self, kind, name, ids):
+        ids = np.asarray(ids)
+        flat = ids.ravel()
+        order = np.argsort(flat, kind="stable")
+        blocks = flat[order] // self.block_size
+        uniq, starts = np.unique(blocks, return_index=True)
+        bounds = np.append(starts, len(flat))
+        width = (self.dim,) if name in ("p_u", "x_v") else ()
+        out = np.empty((len(flat),) + width)
+        for block, lo, hi in zip(uniq.tolist(), bounds[:-1], bounds[1:]):
+            sel = order[lo:hi]
+            out[sel] = self._block(kind, block)[name][flat[sel] - block * self.block_size]
+        return out.reshape(ids.shape + width)
+
+    def user_embeddings(self, user_ids):
+        return self._rows(1, "p_u", user_ids)
+
+    def video_embeddings(self, video_ids):
+        return self._rows(2, "x_v", video_ids)
+
+    def video_editability(self, video_ids):
+        return self._rows(2, "s_v", video_ids)
+
+    @property
+    def cached_nbytes(self):
+        return sum(arr.nbytes for rows in self._cache.values() for arr in rows.values())
+
+    def apply_edit(self, video_id, brand_id):
+        return self.video_embeddings(video_id) + self.eta * self.q_hat[brand_id]
+
+    def edit_acceptable_batch(self, video_ids, brand_ids):
+        v, b = np.broadcast_arrays(np.asarray(video_ids), np.asarray(brand_ids))
+        return self.eta <= self.kappa_b[b] * self.video_editability(v)
+
+    def is_edit_acceptable(self, video_id, brand_id):
+        return self.edit_acceptable_batch(video_id, brand_id)
+
+    def expected_ctr_batch(self, user_ids, video_ids, brand_ids, action_ids):
+        u, v, b, a = np.broadcast_arrays(
+            np.asarray(user_ids), np.asarray(video_ids), np.asarray(brand_ids), np.asarray(action_ids)
+        )
+        p_u = self.user_embeddings(u)
+        x_v = self.video_embeddings(v)
+        q_b = self.q_b[b]
+        x_vp = np.where((a == ACTION_EDIT)[..., None], x_v + self.eta * self.q_hat[b], x_v)
+        x_vp_norm = x_vp / (np.linalg.norm(x_vp, axis=-1, keepdims=True) + 1e-12)
+        logit = (
+            self.beta0
+            + np.einsum("...d,...d->...", p_u, x_vp_norm)
+            + self.gamma * np.einsum("...d,...d->...", p_u, q_b)
+            + self.delta * np.einsum("...d,...d->...", q_b, x_vp_norm)
+        )
+        return sigmoid(logit)
+
+    expected_ctr_grid = World.expected_ctr_grid
+    expected_ctr = World.expected_ctr
+    sample_click = World.sample_click
+
+
+def _unit_vectors(rng, n, d):
+    x = rng.normal(size=(n, d))
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)
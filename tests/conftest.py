@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from src.world import World
+from src.run_sim import make_contexts
+
+
+@pytest.fixture
+def small_world():
+    # Builds a 40-user, 30-video, 4-brand World and its contexts (5 videos and
+    # 3 brands per round, users assigned round-robin to num_cohorts cohorts);
+    # contexts are drawn with seed + 1. Extra keywords go to make_contexts.
+    def build(seed, rounds, num_cohorts=1, **context_kwargs):
+        world = World(seed=seed, num_users=40, num_videos=30, num_brands=4)
+        user_to_cohort = np.arange(40) % num_cohorts
+        contexts = make_contexts(world, rounds, 5, 3, user_to_cohort, seed=seed + 1, **context_kwargs)
+        return world, contexts
+
+    return build
@@ -0,0 +1,15 @@
+from src.bench import run_benchmarks, compare
+
+
+def test_benchmark_records_and_regression_check():
+    config = {"num_videos": 50, "candidate_videos": 4, "num_cohorts": 2, "rounds": 40, "batch_size": 1}
+    results = run_benchmarks([config], policies=["thompson", "random"], repeat=1)
+    assert [r["policy"] for r in results] == ["thompson", "random"]
+    for record in results:
+        assert record["rounds_per_sec"] > 0 and record["peak_mib"] > 0
+        assert record["select_p50_us"] <= record["select_p99_us"]
+
+    assert compare(results, results) == []
+    slower = [{**results[0], "rounds_per_sec": results[0]["rounds_per_sec"] * 2}]
+    regressions = compare(results, slower, tolerance=0.25)
+    assert len(regressions) == 1 and "policy=thompson: rounds_per_sec" in regressions[0]
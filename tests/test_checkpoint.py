@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from src.world import World
+from src.run_sim import make_contexts, simulate_policy
+from src.checkpoint import load_checkpoint, read_manifest
+from src.policies import (
+    RandomPolicy,
+    ThompsonPolicy,
+    CohortThompsonPolicy,
+    CohortUCBPolicy,
+    LinearThompsonPolicy,
+)
+
+
+class _Interrupt(Exception):
+    pass
+
+
+class _InterruptingWorld:
+    # Delegates to a World but aborts the run after a fixed number of reward draws.
+    def __init__(self, world, calls):
+        self.world = world
+        self.calls = calls
+
+    def __getattr__(self, name):
+        return getattr(self.world, name)
+
+    def _tick(self):
+        self.calls -= 1
+        if self.calls < 0:
+            raise _Interrupt
+
+    def expected_ctr(self, *args):
+        self._tick()
+        return self.world.expected_ctr(*args)
+
+    def expected_ctr_batch(self, *args):
+        self._tick()
+        return self.world.expected_ctr_batch(*args)
+
+
+@pytest.mark.parametrize("batch_size", [1, 16])
+def test_interrupted_run_resumes_bit_identically(tmp_path, batch_size):
+    user_to_cohort = np.arange(40) % 3
+    world = World(seed=3, num_users=40, num_videos=30, num_brands=4, user_to_cohort=user_to_cohort, num_cohorts=3)
+    contexts = make_contexts(world, 300, 5, 3, user_to_cohort, segment_len=2, seed=4)
+    makers = {
+        "random": lambda: RandomPolicy(seed=1),
+        "thompson": lambda: ThompsonPolicy(30, 4, seed=2),
+        "sparse_thompson": lambda: ThompsonPolicy(30, 4, seed=2, backend="sparse"),
+        "cohort_thompson": lambda: CohortThompsonPolicy(3, 30, 4, seed=2),
+        "cohort_ucb": lambda: CohortUCBPolicy(3, 30, 4),
+        "linear_thompson": lambda: LinearThompsonPolicy(world.dim, seed=2),
+    }
+    for name, make in makers.items():
+        path = str(tmp_path / f"{name}_{batch_size}")
+        reference = make()
+        expected = simulate_policy(world, reference, contexts, seed=5, impressions_per_pull=3, batch_size=batch_size)
+
+        with pytest.raises(_Interrupt):
+            simulate_policy(
+                _InterruptingWorld(world, 190 // batch_size),
+                make(),
+                contexts,
+                seed=5,
+                impressions_per_pull=3,
+                batch_size=batch_size,
+                checkpoint_path=path,
+                checkpoint_every=64,
+            )
+        assert read_manifest(path)["round"] in (128, 144)
+
+        resumed = make()
+        succ = simulate_policy(
+            world,
+            resumed,
+            contexts,
+            seed=5,
+            impressions_per_pull=3,
+            batch_size=batch_size,
+            checkpoint_path=path,
+            checkpoint_every=64,
+            resume=True,
+        )
+        np.testing.assert_array_equal(succ, expected)
+        for attr, value in vars(reference).items():
+            if isinstance(value, np.ndarray):
+                np.testing.assert_array_equal(getattr(resumed, attr), value)
+
+        restored = make()
+        _, round_index, saved = load_checkpoint(path, restored)
+        assert round_index == len(contexts)
+        assert isinstance(saved, np.memmap)
+        np.testing.assert_array_equal(saved, expected)
@@ -0,0 +1,44 @@
+import numpy as np
+
+from src.world import World
+from src.contexts import ContextBatch, as_context_batch, iter_contexts
+from src.run_sim import make_contexts
+
+
+def test_context_batch_roundtrip(tmp_path):
+    world = World(seed=0, num_users=30, num_videos=25, num_brands=4)
+    user_to_cohort = np.arange(30) % 3
+    contexts = make_contexts(world, 50, 5, 2, user_to_cohort, segment_len=5, seed=1)
+    assert isinstance(contexts, ContextBatch)
+    assert contexts.videos.shape == (50, 5) and contexts.brands.shape == (50, 2)
+
+    tuples = contexts.to_tuples()
+    u, c, vids, brands = tuples[7]
+    assert (u, c) == (contexts.users[7], user_to_cohort[contexts.users[7]])
+    assert as_context_batch(tuples)[10:20].users.tolist() == contexts.users[10:20].tolist()
+
+    contexts.save(str(tmp_path / "ctx.npz"))
+    contexts.save(str(tmp_path / "ctx"))
+    for loaded in (
+        ContextBatch.load(str(tmp_path / "ctx.npz")),
+        ContextBatch.load(str(tmp_path / "ctx"), mmap_mode="r"),
+    ):
+        np.testing.assert_array_equal(loaded.videos, contexts.videos)
+        np.testing.assert_array_equal(loaded.cohorts, contexts.cohorts)
+    assert isinstance(ContextBatch.load(str(tmp_path / "ctx"), mmap_mode="r").videos, np.memmap)
+
+
+def test_vectorized_contexts_keep_segments_and_stream_in_chunks():
+    world = World(seed=0, num_users=40, num_videos=30, num_brands=5)
+    user_to_cohort = np.arange(40) % 4
+    contexts = make_contexts(world, 200, 12, 3, user_to_cohort, segment_len=6, seed=2, vectorized=True)
+    assert contexts.videos.shape == (200, 12) and contexts.brands.shape == (200, 3)
+    assert all(len(set(row)) == 12 for row in contexts.videos.tolist())
+    assert all(len(set(row)) == 3 for row in contexts.brands.tolist())
+    for start in range(0, 200, 6):
+        assert len(set(contexts.users[start : start + 6].tolist())) == 1
+    np.testing.assert_array_equal(contexts.cohorts, user_to_cohort[contexts.users])
+
+    chunks = list(iter_contexts(world, 200, 12, 3, user_to_cohort, segment_len=6, seed=2, chunk_size=25))
+    assert [len(c) for c in chunks] == [25] * 8
+    np.testing.assert_array_equal(np.concatenate([c.users for c in chunks]), contexts.users)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from src.contexts import ContextBatch
+from src.ctr_cache import CTRCache, MAX_RESIDENT_BYTES
+from src.run_sim import simulate_policy, compute_acceptability_stats
+from src.policies import NoEditGreedyPolicy, OraclePolicy, ThompsonPolicy
+
+
+def test_cached_runs_match_uncached(tmp_path, small_world):
+    world, contexts = small_world(6, 300, segment_len=3)
+    cache = CTRCache(world, contexts, chunk_size=64, path=str(tmp_path / "ctr.npy"))
+    assert compute_acceptability_stats(world, contexts, ctr_cache=cache) == compute_acceptability_stats(
+        world, contexts
+    )
+    np.testing.assert_array_equal(
+        cache.grid(0, len(contexts)),
+        world.expected_ctr_grid(contexts.users, contexts.videos, contexts.brands),
+    )
+    assert cache.filled.all()
+
+    for make in (NoEditGreedyPolicy, OraclePolicy, lambda: ThompsonPolicy(30, 4, seed=8)):
+        for batch_size in (1, 16):
+            plain = simulate_policy(world, make(), contexts, seed=9, batch_size=batch_size)
+            cached = simulate_policy(world, make(), contexts, seed=9, batch_size=batch_size, ctr_cache=cache)
+            np.testing.assert_array_equal(plain, cached)
+
+
+def test_oversized_grid_spills_to_memmap_and_closes(small_world):
+    world, contexts = small_world(6, 300, segment_len=3)
+    assert CTRCache(world, contexts).in_memory
+    cache = CTRCache(world, contexts, chunk_size=64, max_bytes=1024)
+    assert not cache.in_memory
+    plain = simulate_policy(world, ThompsonPolicy(30, 4, seed=8), contexts, seed=9)
+    cached = simulate_policy(world, ThompsonPolicy(30, 4, seed=8), contexts, seed=9, ctr_cache=cache)
+    np.testing.assert_array_equal(plain, cached)
+    cache.close()
+    assert cache.ctr is None
+
+
+def test_long_run_grid_is_never_resident(small_world):
+    world, contexts = small_world(6, 1, segment_len=3)
+    rounds = 2_000_000
+    long_run = ContextBatch(
+        np.broadcast_to(contexts.users, (rounds,)),
+        np.broadcast_to(contexts.cohorts, (rounds,)),
+        np.broadcast_to(contexts.videos, (rounds, 5)),
+        np.broadcast_to(contexts.brands, (rounds, 3)),
+    )
+    cache = CTRCache(world, long_run, chunk_size=64)
+    assert cache.nbytes > MAX_RESIDENT_BYTES and not cache.in_memory
+    np.testing.assert_array_equal(cache.row(rounds - 1), cache.grid(0, 1)[0])
+    assert cache.filled.sum() == 2
+    cache.close()
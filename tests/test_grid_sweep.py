@@ -0,0 +1,61 @@
+from src.grid_sweep import BuildCache, expand_grid, group_jobs, load_results, run_grid, run_grid_task
+from src.seed_sweep import run_once
+
+
+def _tasks():
+    grid = {"rounds": [120], "candidate_videos": [5], "eta": [0.2, 0.5], "impressions_per_pull": [1, 3]}
+    return expand_grid(grid, seeds=range(2))
+
+
+def test_grid_reuses_contexts_and_matches_run_once():
+    tasks = _tasks()
+    cache = BuildCache()
+    rows = [run_grid_task(task, cache) for task in tasks if task["seed"] == 0]
+    assert cache.builds == {"world": 2, "contexts": 1}
+    run_grid_task({**tasks[0], "rounds": 60, "candidate_brands": 3}, cache)
+    assert cache.builds == {"world": 2, "contexts": 2}
+
+    task = tasks[0]
+    params = ("seed", "rounds", "candidate_videos", "candidate_brands", "num_cohorts", "segment_len")
+    expected = run_once(
+        **{k: task[k] for k in params}, impressions_per_pull=task["impressions_per_pull"]
+    )
+    assert task["eta"] == 0.2 and rows[0]["eta"] == 0.2
+    assert rows[-1]["eta"] == 0.5 and rows[-1]["thompson"] != rows[0]["thompson"]
+    fresh = run_grid_task({**task, "eta": 0.35})
+    assert {k: fresh[k] for k in expected} == expected
+
+
+def test_grid_appends_resumes_and_queries(tmp_path):
+    tasks = _tasks()
+    path = str(tmp_path / "grid.csv")
+    serial = run_grid(tasks[:5], path)
+    parallel = run_grid(tasks, str(tmp_path / "parallel.csv"), workers=2)
+    resumed = run_grid(tasks, path, resume=True)
+    assert resumed == parallel and resumed[:5] == serial
+
+    cols = load_results(path, columns=("seed", "eta", "thompson"), eta=0.5, impressions_per_pull=[3])
+    assert len(cols["seed"]) == 2 and set(cols["eta"]) == {0.5}
+    assert len(load_results(path)["oracle_constrained"]) == len(tasks)
+
+    # Without resume, tasks rerun and supersede their rows; nothing is dropped.
+    assert run_grid(tasks[:2], path) == resumed[:2]
+    assert len(load_results(path)["oracle_constrained"]) == len(tasks)
+    with open(path) as f:
+        assert len(f.readlines()) == len(tasks) + 3
+
+
+def test_pool_jobs_split_on_ctr_grids():
+    tasks = expand_grid({"eta": [0.3, 0.4, 0.5], "impressions_per_pull": [1, 3]}, seeds=[0])
+    indices = list(range(len(tasks)))
+    assert group_jobs(tasks, indices) == [indices]
+    jobs = group_jobs(tasks, indices, workers=8)
+    assert len(jobs) == 3 and all(len({tasks[i]["eta"] for i in job}) == 1 for job in jobs)
+
+
+def test_failing_job_is_reported_and_skipped_serially_and_in_parallel(tmp_path, capsys):
+    tasks = [{**task, "batch_size": 0} if task["seed"] == 1 else task for task in _tasks()]
+    for workers in (1, 2):
+        rows = run_grid(tasks, str(tmp_path / f"workers{workers}.csv"), workers=workers)
+        assert len(rows) == 4 and {row["seed"] for row in rows} == {0}
+        assert "(seed=1) failed" in capsys.readouterr().out
@@ -0,0 +1,68 @@
+import numpy as np
+
+from src.run_sim import simulate_policy
+from src.metrics import StreamingMetrics, lttb
+from src.policies import OraclePolicy, ThompsonPolicy
+
+
+def test_streaming_metrics_match_stored_successes(small_world):
+    world, contexts = small_world(2, 500, segment_len=3)
+    oracle = StreamingMetrics(2)
+    simulate_policy(world, OraclePolicy(), contexts, seed=4, impressions_per_pull=2, metrics=oracle)
+    assert abs(oracle.cumulative_regret) < 1e-9
+
+    clicks = []
+    for batch_size in (1, 32):
+        metrics = StreamingMetrics(2, checkpoint_every=50)
+        succ = simulate_policy(
+            world, ThompsonPolicy(30, 4, seed=5), contexts, seed=4, impressions_per_pull=2,
+            batch_size=batch_size, metrics=metrics,
+        )
+        series = metrics.series()
+        np.testing.assert_array_equal(series["round"], np.arange(50, 501, 50))
+        np.testing.assert_allclose(series["click_rate"], (np.cumsum(succ) / (2 * np.arange(1, len(succ) + 1)))[49::50])
+        assert metrics.clicks == succ.sum() and metrics.cumulative_regret > 0
+        clicks.append(metrics.clicks)
+        assert 0.0 < metrics.edit_share < 1.0
+
+    log_spaced = StreamingMetrics(2)
+    assert simulate_policy(
+        world, ThompsonPolicy(30, 4, seed=5), contexts, seed=4, impressions_per_pull=2,
+        metrics=log_spaced, store_successes=False,
+    ) is None
+    rounds = log_spaced.series()["round"]
+    assert rounds[0] == 1 and rounds[-1] == 500 and len(rounds) < 100
+    assert log_spaced.clicks == clicks[0]
+
+
+def test_streamed_metrics_survive_checkpoint_resume(tmp_path, small_world):
+    world, contexts = small_world(2, 500, segment_len=3)
+    reference = StreamingMetrics(checkpoint_every=40)
+    simulate_policy(world, ThompsonPolicy(30, 4, seed=5), contexts, seed=4, metrics=reference)
+
+    streamed = StreamingMetrics(checkpoint_every=40, stream_path=str(tmp_path / "m.csv"))
+    ckpt = str(tmp_path / "ckpt")
+    simulate_policy(
+        world, ThompsonPolicy(30, 4, seed=5), contexts[:300], seed=4, metrics=streamed,
+        checkpoint_path=ckpt, checkpoint_every=100, store_successes=False,
+    )
+    # Extra snapshots past the checkpoint, as if the run died before the next save.
+    streamed.update([1.0] * 40, [0.1] * 40, [0.2] * 40, [0] * 40)
+
+    resumed = StreamingMetrics(checkpoint_every=40, stream_path=str(tmp_path / "m.csv"))
+    simulate_policy(
+        world, ThompsonPolicy(30, 4, seed=5), contexts, seed=4, metrics=resumed,
+        checkpoint_path=ckpt, resume=True, store_successes=False,
+    )
+    for name, col in reference.series().items():
+        np.testing.assert_allclose(resumed.series()[name], col)
+
+
+def test_lttb_keeps_endpoints_and_extremes():
+    x = np.arange(10000.0)
+    y = np.sin(x / 300.0)
+    y[4321] = 5.0
+    dx, dy = lttb(x, y, 200)
+    assert len(dx) == 200 and dx[0] == 0 and dx[-1] == 9999
+    assert np.all(np.diff(dx) > 0) and 5.0 in dy
+    np.testing.assert_array_equal(lttb(x[:50], y[:50], 200)[1], y[:50])
@@ -0,0 +1,204 @@
+import numpy as np
+import pytest
+
+from src.world import World, LazyWorld, ACTION_EDIT, ACTION_NO_EDIT
+from src.run_sim import make_contexts
+from src.policies import (
+    ThompsonPolicy,
+    CohortThompsonPolicy,
+    UCBPolicy,
+    CohortUCBPolicy,
+    LinearThompsonPolicy,
+    arm_features,
+    enumerate_feasible_arms,
+    feasible_arm_arrays,
+    feasible_mask,
+)
+
+
+def test_feasible_arms_match_scalar_acceptability():
+    world = World(seed=2, num_videos=40, num_brands=4)
+    assert world.acceptable.shape == (40, 4)
+    vids = np.array([5, 1, 30, 17])
+    brands = np.array([3, 0, 2])
+
+    expected = []
+    for v in vids:
+        for b in brands:
+            expected.append((v, b, ACTION_NO_EDIT))
+            if world.eta <= world.kappa_b[b] * world.s_v[v]:
+                expected.append((v, b, ACTION_EDIT))
+    assert enumerate_feasible_arms(world, vids, brands) == expected
+
+    v, b, a = feasible_arm_arrays(world, vids, brands)
+    assert list(zip(v, b, a)) == expected
+    mask = feasible_mask(world, vids, brands)
+    assert mask.shape == (4, 3, 2)
+    assert mask[..., ACTION_NO_EDIT].all()
+    assert mask.sum() == len(expected)
+
+
+def test_thompson_select_follows_rng_stream_contract():
+    world = World(seed=4, num_videos=30, num_brands=3)
+    policy = ThompsonPolicy(world.num_videos, world.num_brands, seed=11)
+    policy.alpha += np.random.default_rng(0).integers(0, 5, size=policy.alpha.shape)
+    vids = np.array([2, 9, 21, 14])
+    brands = np.array([1, 2])
+
+    ref_rng = np.random.default_rng(11)
+    for _ in range(20):
+        best, best_sample = None, -1.0
+        for v, b, a in enumerate_feasible_arms(world, vids, brands):
+            mu = ref_rng.beta(policy.alpha[v, b, a], policy.beta[v, b, a])
+            if mu > best_sample:
+                best, best_sample = (v, b, a), mu
+        assert policy.select_arm(world, 0, vids, brands) == best
+
+
+def test_ucb_batch_update_matches_sequential_and_cohorts_are_isolated():
+    world = World(seed=4, num_videos=20, num_brands=3)
+    rng = np.random.default_rng(1)
+    v = rng.integers(20, size=40)
+    b = rng.integers(3, size=40)
+    a = rng.integers(2, size=40)
+    succ = rng.integers(0, 6, size=40)
+    fail = 5 - succ
+    cohorts = rng.integers(0, 2, size=40)
+
+    seq, batch = UCBPolicy(20, 3), UCBPolicy(20, 3)
+    cseq, cbatch = CohortUCBPolicy(2, 20, 3), CohortUCBPolicy(2, 20, 3)
+    for i in range(40):
+        seq.update((v[i], b[i], a[i]), succ[i], fail[i])
+        cseq.update((v[i], b[i], a[i]), succ[i], fail[i], cohort_id=cohorts[i])
+    batch.update_batch(v, b, a, succ, fail)
+    cbatch.update_batch(v, b, a, succ, fail, cohort_ids=cohorts)
+    np.testing.assert_allclose(batch.means, seq.means)
+    np.testing.assert_array_equal(batch.counts, seq.counts)
+    np.testing.assert_allclose(cbatch.means, cseq.means)
+    assert cbatch.totals.tolist() == [5 * np.sum(cohorts == c) for c in (0, 1)]
+
+    # Unpulled feasible arms are explored before any exploitation.
+    fresh = UCBPolicy(20, 3)
+    assert fresh.select_arm(world, 0, np.array([4, 7]), np.array([2])) == (4, 2, ACTION_NO_EDIT)
+
+    # An empty batch is a no-op (no log(0) on a fresh policy).
+    empty = np.zeros(0, dtype=int)
+    cfresh = CohortUCBPolicy(2, 20, 3)
+    with np.errstate(all="raise"):
+        fresh.update_batch(empty, empty, empty, empty, empty)
+        cfresh.update_batch(empty, empty, empty, empty, empty, cohort_ids=empty)
+    assert fresh.total == 0 and cfresh.totals.sum() == 0
+
+    # Zero-pull updates leave unpulled arms and log t untouched (no 0 / 0).
+    with np.errstate(all="raise"):
+        fresh.update((0, 0, 0), 0, 0)
+        fresh.update_batch([1], [1], [0], [0], [0])
+        cfresh.update((0, 0, 0), 0, 0, cohort_id=1)
+        cfresh.update_batch([1], [1], [0], [0], [0], cohort_ids=[1])
+    assert not fresh.means.any() and not cfresh.means.any() and not cfresh.counts.any()
+    assert fresh._log_t == 0.0 and not cfresh._log_t.any()
+    fresh.update_batch([1, 2], [1, 0], [0, 1], [0, 2], [0, 1])
+    assert fresh.means[2, 0, 1] == 2 / 3 and fresh.means[1, 1, 0] == 0 and fresh._log_t == np.log(3)
+
+    # Plain lists are accepted like arrays.
+    listed, clisted = UCBPolicy(20, 3), CohortUCBPolicy(2, 20, 3)
+    listed.update_batch(v.tolist(), b.tolist(), a.tolist(), succ.tolist(), fail.tolist())
+    clisted.update_batch(
+        v.tolist(), b.tolist(), a.tolist(), succ.tolist(), fail.tolist(), cohort_ids=cohorts.tolist()
+    )
+    np.testing.assert_allclose(listed.means, seq.means)
+    np.testing.assert_allclose(clisted.means, cseq.means)
+    assert listed.total == batch.total and clisted.totals.tolist() == cbatch.totals.tolist()
+
+
+def test_linear_thompson_sherman_morrison_matches_direct_inverse():
+    world = World(seed=3, num_users=20, num_videos=30, num_brands=3, dim=4)
+    policy = LinearThompsonPolicy(world.dim, seed=0, reg=2.0)
+    rng = np.random.default_rng(2)
+    design = 2.0 * np.eye(13)
+    rewards = np.zeros(13)
+    for t in range(25):
+        vids = rng.choice(30, size=5, replace=False)
+        arm = policy.select_arm(world, int(rng.integers(20)), vids, np.arange(3))
+        phi = policy._pending[-1]
+        succ = int(rng.integers(0, 4))
+        design += 3 * np.outer(phi, phi)
+        rewards += succ * phi
+        if t % 2:
+            policy.update(arm, succ, 3 - succ)
+        else:
+            policy.update_batch(*[np.array([x]) for x in arm], np.array([succ]), np.array([3 - succ]))
+    np.testing.assert_allclose(policy.B_inv, np.linalg.inv(design), atol=1e-10)
+    np.testing.assert_allclose(policy.theta_hat, np.linalg.solve(design, rewards), atol=1e-10)
+    np.testing.assert_allclose(policy.chol @ policy.chol.T, policy.B_inv, atol=1e-12)
+
+    # Updates must name the arms in selection order; a rejected update or batch
+    # consumes nothing.
+    first = policy.select_arm(world, 0, np.array([1, 2]), np.arange(3))
+    second = policy.select_arm(world, 1, np.array([3, 4]), np.arange(3))
+    B_inv = policy.B_inv.copy()
+    with pytest.raises(ValueError, match="next selected arm"):
+        policy.update((first[0], first[1], 1 - first[2]), 1, 0)
+    with pytest.raises(ValueError, match="next selected arm"):
+        policy.update_batch(*[np.array(x) for x in zip(first, first)], np.ones(2), np.zeros(2))
+    with pytest.raises(ValueError, match="pending select_arm"):
+        policy.update_batch(*[np.array(x) for x in zip(first, second, second)], np.ones(3), np.zeros(3))
+    np.testing.assert_array_equal(policy.B_inv, B_inv)
+    policy.update_batch(*[np.array(x) for x in zip(first, second)], np.ones(2), np.zeros(2))
+    assert not policy._pending and not policy._pending_arms
+    assert arm_features(world, 0, np.array([1, 2]), np.array([0])).shape == (2, 1, 2, 13)
+
+    # Batched features match row-by-row ones, with and without tables.
+    for w in (world, LazyWorld(seed=3, num_users=20, num_videos=30, num_brands=3, dim=4, block_size=8)):
+        contexts = make_contexts(w, 6, 4, 2, np.zeros(20, dtype=int), seed=1)
+        rows = np.stack([arm_features(w, u, v, b) for u, _, v, b in contexts])
+        np.testing.assert_allclose(arm_features(w, contexts.users, contexts.videos, contexts.brands), rows)
+
+
+def test_batched_select_matches_row_by_row_select():
+    world = World(seed=6, num_users=30, num_videos=25, num_brands=4)
+    user_to_cohort = np.arange(30) % 3
+    contexts = make_contexts(world, 40, 5, 3, user_to_cohort, segment_len=2, seed=1)
+    for make in (
+        lambda: ThompsonPolicy(25, 4, seed=9),
+        lambda: CohortThompsonPolicy(3, 25, 4, seed=9),
+    ):
+        rowwise, batched = make(), make()
+        expected = [rowwise.select_arm(world, u, v, b, cohort_id=c) for u, c, v, b in contexts]
+        v, b, a = batched.select_arms(world, contexts)
+        assert list(zip(v.tolist(), b.tolist(), a.tolist())) == expected
+
+    policy = CohortThompsonPolicy(3, 25, 4)
+    assert policy.successes.dtype == np.uint32
+    assert policy.nbytes == 2 * 3 * 25 * 4 * 2 * 4
+    policy.update((1, 2, ACTION_EDIT), 3, 2, cohort_id=1)
+    assert policy.alpha[1, 1, 2, ACTION_EDIT] == 4.0 and policy.beta[1, 1, 2, ACTION_EDIT] == 3.0
+
+
+def test_sparse_thompson_backend_matches_dense():
+    world = World(seed=7, num_users=30, num_videos=25, num_brands=4)
+    user_to_cohort = np.arange(30) % 3
+    contexts = make_contexts(world, 60, 5, 3, user_to_cohort, segment_len=2, seed=2)
+    rng = np.random.default_rng(0)
+    for make in (
+        lambda backend: ThompsonPolicy(25, 4, seed=9, backend=backend),
+        lambda backend: CohortThompsonPolicy(3, 25, 4, seed=9, backend=backend),
+    ):
+        dense, sparse = make("dense"), make("sparse")
+        sparse.counts.delta_capacity = 8
+        for t, (u, c, v, b) in enumerate(contexts):
+            arm = dense.select_arm(world, u, v, b, cohort_id=c)
+            assert sparse.select_arm(world, u, v, b, cohort_id=c) == arm
+            succ = int(rng.integers(0, 3))
+            if t % 2:
+                dense.update(arm, succ, 2 - succ, cohort_id=c)
+                sparse.update(arm, succ, 2 - succ, cohort_id=c)
+            else:
+                batch = [np.array([x, x]) for x in arm] + [np.array([succ, 1]), np.array([2 - succ, 1])]
+                dense.update_batch(*batch, cohort_ids=np.array([c, c]))
+                sparse.update_batch(*batch, cohort_ids=np.array([c, c]))
+        assert np.array_equal(dense.select_arms(world, contexts), sparse.select_arms(world, contexts))
+        assert len(sparse.counts) <= 60 and sparse.nbytes < dense.nbytes
+
+    assert ThompsonPolicy(10**5, 10**3).backend == "sparse"
+    assert ThompsonPolicy(25, 4).backend == "dense"
@@ -0,0 +1,35 @@
+import numpy as np
+
+from src.world import World
+from src.run_sim import make_contexts, simulate_policy
+from src.profiling import PhaseProfiler, PHASES
+from src.policies import CohortThompsonPolicy
+
+
+def test_profiled_run_matches_unprofiled_and_times_every_phase(tmp_path):
+    user_to_cohort = np.arange(30) % 2
+    world = World(seed=4, num_users=30, num_videos=20, num_brands=3, user_to_cohort=user_to_cohort, num_cohorts=2)
+    contexts = make_contexts(world, 120, 4, 3, user_to_cohort, seed=5)
+    for batch_size in (1, 16):
+        plain = CohortThompsonPolicy(2, 20, 3, seed=6)
+        expected = simulate_policy(world, plain, contexts, seed=7, impressions_per_pull=2, batch_size=batch_size)
+
+        profiler = PhaseProfiler()
+        profiled = CohortThompsonPolicy(2, 20, 3, seed=6)
+        with profiler.scope("thompson"):
+            succ = simulate_policy(
+                world, profiled, contexts, seed=7, impressions_per_pull=2, batch_size=batch_size,
+                profiler=profiler, checkpoint_path=str(tmp_path / f"ckpt{batch_size}"),
+            )
+        np.testing.assert_array_equal(succ, expected)
+        np.testing.assert_array_equal(profiled.successes, plain.successes)
+        calls = {phase: n for (scope, phase), n in profiler.calls.items() if scope == "thompson"}
+        assert set(calls) == set(PHASES)
+        assert calls["sample"] == calls["binomial"] == calls["update"] == -(-120 // batch_size)
+        assert all(s >= 0 for s in profiler.seconds.values())
+
+    merged = PhaseProfiler()
+    merged.merge(profiler.records())
+    merged.merge(profiler.records())
+    assert merged.calls[("thompson", "sample")] == 2 * profiler.calls[("thompson", "sample")]
+    assert "| thompson | enumerate |" in merged.table()
@@ -0,0 +1,67 @@
+import numpy as np
+
+from src.world import World, LazyWorld
+from src.retrieval import ExactIndex, RandomProjectionIndex, recall_report
+
+
+def test_exact_index_matches_brute_force():
+    world = World(seed=0, num_users=20, num_videos=300, num_brands=4, dim=6)
+    index = ExactIndex(world, block_size=64)
+    ids, scores = index.top_k_videos([3, 11], 5)
+    brute = world.p_u[[3, 11]] @ world.video_norm.T
+    np.testing.assert_array_equal(ids, np.argsort(-brute, axis=1)[:, :5])
+    np.testing.assert_allclose(scores, np.sort(brute, axis=1)[:, ::-1][:, :5])
+
+    v, b, a, ctr = index.top_k_arms(3, 4)
+    grid = world.expected_ctr_grid(3, np.arange(300), np.arange(4))
+    grid[..., 1][~world.acceptable] = -np.inf
+    best = np.argsort(-grid.ravel())[:4]
+    np.testing.assert_array_equal(np.ravel_multi_index((v, b, a), grid.shape), best)
+    np.testing.assert_allclose(ctr, grid.ravel()[best])
+
+
+def test_random_projection_index_on_lazy_world():
+    world = LazyWorld(seed=1, num_users=100, num_videos=3000, dim=6)
+    approx = RandomProjectionIndex(world, num_bits=6, num_tables=6, seed=0, block_size=512)
+    report = recall_report(ExactIndex(world, block_size=512), approx, np.arange(20), 10)
+    assert report["recall_at_k"] > 0.8
+    counts = approx.candidate_counts(np.arange(20))
+    assert report["candidate_fraction"] == np.mean(counts) / 3000 < 1
+    assert report["fallback_fraction"] == np.mean(counts < 10)
+    assert counts[3] == len(approx.candidates(3))
+    ids, _ = approx.top_k_videos([0, 1], 10)
+    assert ((ids >= 0) & (ids < 3000)).all()
+
+
+def test_random_projection_index_batches_and_falls_back_to_exact():
+    world = World(seed=2, num_users=30, num_videos=400, num_brands=3, dim=6)
+    approx = RandomProjectionIndex(world, num_bits=8, num_tables=4, seed=1, query_block=7)
+    single = RandomProjectionIndex(world, num_bits=8, num_tables=4, seed=1, query_block=1)
+    users = np.arange(30)
+    ids, scores = approx.top_k_videos(users, 5)
+    np.testing.assert_array_equal(ids, single.top_k_videos(users, 5)[0])
+    np.testing.assert_allclose(scores, np.take_along_axis(world.p_u @ world.video_norm.T, ids, axis=1))
+    assert approx.vectors is None
+    cached = RandomProjectionIndex(world, num_bits=8, num_tables=4, seed=1, cache_vectors=True)
+    cached_ids, cached_scores = cached.top_k_videos(users, 5)
+    np.testing.assert_allclose(cached_scores, scores)
+
+    # Queries whose buckets hold fewer than k videos are re-probed at a wider
+    # Hamming radius, and served by the exact scan only past max_radius.
+    sparse = RandomProjectionIndex(world, num_bits=16, num_tables=1, probe_neighbors=False, max_radius=0)
+    short = np.array([len(sparse.candidates(u)) < 5 for u in users])
+    assert short.any()
+    exact_ids = ExactIndex(world).top_k_videos(users, 5)[0]
+    np.testing.assert_array_equal(sparse.top_k_videos(users, 5)[0][short], exact_ids[short])
+
+    widened = RandomProjectionIndex(world, num_bits=16, num_tables=1, probe_neighbors=False, max_radius=3)
+    counts = widened.candidate_counts(users, radius=3)
+    assert (counts[short] >= 5).any() and (counts < 400).all()
+    ids, scores = widened.top_k_videos(users, 5)
+    rescued = np.flatnonzero(short & (counts >= 5))
+    wide_pairs = widened._candidate_pairs(world.p_u[rescued], widened._masks(3))
+    for row, u in enumerate(rescued):
+        assert set(ids[u]) <= set(wide_pairs[1][wide_pairs[0] == row])
+    np.testing.assert_allclose(scores, np.take_along_axis(world.p_u @ world.video_norm.T, ids, axis=1))
+    report = recall_report(ExactIndex(world), widened, users, 5)
+    assert report["widened_fraction"] == short.mean() and report["fallback_fraction"] == np.mean(counts < 5)
@@ -0,0 +1,53 @@
+import numpy as np
+
+from src.world import World
+from src.run_sim import make_contexts, simulate_policy, compute_acceptability_stats
+from src.policies import OraclePolicy, CohortThompsonPolicy
+
+
+def _setup(num_cohorts=3, rounds=400):
+    rng = np.random.default_rng(0)
+    user_to_cohort = rng.integers(0, num_cohorts, size=50)
+    world = World(seed=1, num_users=50, num_videos=40, num_brands=3, user_to_cohort=user_to_cohort, num_cohorts=num_cohorts)
+    contexts = make_contexts(world, rounds, 6, 3, user_to_cohort, segment_len=4, seed=2)
+    return world, contexts
+
+
+def test_batched_simulation_matches_serial_for_stateless_policy():
+    world, contexts = _setup()
+    serial = simulate_policy(world, OraclePolicy(), contexts, seed=3, impressions_per_pull=4)
+    batched = simulate_policy(world, OraclePolicy(), contexts, seed=3, impressions_per_pull=4, batch_size=64)
+    np.testing.assert_array_equal(serial, batched)
+
+
+def test_batched_simulation_applies_all_updates():
+    world, contexts = _setup()
+    policy = CohortThompsonPolicy(3, world.num_videos, world.num_brands, seed=4)
+    succ = simulate_policy(world, policy, contexts, seed=5, impressions_per_pull=4, batch_size=50)
+    alpha = policy.successes.sum()
+    beta = policy.failures.sum()
+    assert alpha == succ.sum()
+    assert alpha + beta == len(contexts) * 4
+
+
+def test_vectorized_acceptability_stats_match_loop():
+    world, contexts = _setup(rounds=60)
+    total = rejected = better_total = better = 0
+    by_brand = np.zeros((world.num_brands, 2))
+    for u, _c, vids, brands in contexts:
+        for v in vids:
+            for b in brands:
+                total += 1
+                by_brand[b, 0] += 1
+                if not world.is_edit_acceptable(v, b):
+                    rejected += 1
+                    by_brand[b, 1] += 1
+                    continue
+                better_total += 1
+                better += world.expected_ctr(u, v, b, 1) > world.expected_ctr(u, v, b, 0)
+
+    rejected_frac, better_frac, details = compute_acceptability_stats(world, contexts, breakdown=True, chunk_size=7)
+    assert np.isclose(rejected_frac, rejected / total)
+    assert np.isclose(better_frac, better / better_total)
+    np.testing.assert_allclose(details["by_brand"]["rejected_frac"], by_brand[:, 1] / by_brand[:, 0])
+    assert details["by_cohort"]["pairs"].sum() == total
@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+from src.metrics import read_series
+from src.seed_sweep import plot_seed_bands, run_tasks, run_path, series_path
+
+
+def _tasks():
+    return [
+        {
+            "variant": variant,
+            "seed": seed,
+            "rounds": 150,
+            "candidate_videos": 6,
+            "candidate_brands": 3,
+            "num_cohorts": num_cohorts,
+            "segment_len": 2,
+            "impressions_per_pull": 3,
+        }
+        for variant, num_cohorts in (("main", 3), ("ablation_no_cohorts", 1))
+        for seed in range(2)
+    ]
+
+
+def test_parallel_sweep_matches_serial_and_resumes(tmp_path):
+    tasks = _tasks()
+    serial = run_tasks(tasks, str(tmp_path / "serial"))
+    parallel = run_tasks(tasks, str(tmp_path / "parallel"), workers=2)
+    assert serial == parallel
+
+    path = run_path(str(tmp_path / "parallel"), tasks[1])
+    with open(path) as f:
+        row = json.load(f)
+    row["thompson"] = -1.0
+    with open(path, "w") as f:
+        json.dump(row, f)
+    resumed = run_tasks(tasks, str(tmp_path / "parallel"), resume=True)
+    assert resumed[1]["thompson"] == -1.0
+    assert resumed[0] == serial[0]
+
+
+def test_stacked_sweep_matches_per_seed_runs(tmp_path):
+    tasks = _tasks()
+    serial = run_tasks(tasks, str(tmp_path / "serial"))
+    stacked = run_tasks(tasks, str(tmp_path / "stacked"), stacked=True)
+    assert serial == stacked
+
+
+def test_series_feed_seed_band_plot(tmp_path):
+    tasks = [task for task in _tasks() if task["variant"] == "main"]
+    rows = run_tasks(tasks, str(tmp_path), series=True)
+    series = read_series(os.path.join(series_path(str(tmp_path / "series"), tasks[0]), "thompson.csv"))
+    assert series["round"][-1] == 150 and series["click_rate"][-1] == rows[0]["thompson"]
+    plot_seed_bands(rows, str(tmp_path), str(tmp_path / "bands.png"))
+    assert os.path.getsize(tmp_path / "bands.png") > 0
+
+
+def test_resume_with_series_reruns_runs_missing_them(tmp_path, capsys):
+    tasks = [task for task in _tasks() if task["variant"] == "main"]
+    plain = run_tasks(tasks, str(tmp_path))
+    with pytest.raises(ValueError, match="no metric series"):
+        plot_seed_bands(plain, str(tmp_path), str(tmp_path / "bands.png"))
+
+    run_tasks(tasks[:1], str(tmp_path), resume=True, series=True)
+    plot_seed_bands(plain, str(tmp_path), str(tmp_path / "bands.png"))
+    assert "skipping main seed=1" in capsys.readouterr().out
+
+    resumed = run_tasks(tasks, str(tmp_path), resume=True, series=True)
+    assert resumed == plain
+    assert all(os.path.isdir(series_path(str(tmp_path / "series"), task)) for task in tasks)
+    plot_seed_bands(resumed, str(tmp_path), str(tmp_path / "bands.png"))
+
+
+def test_failing_run_is_reported_and_skipped_serially_and_in_parallel(tmp_path, capsys):
+    tasks = [task for task in _tasks() if task["variant"] == "main"]
+    tasks[1] = {**tasks[1], "batch_size": 0}
+    for workers in (1, 2):
+        rows = run_tasks(tasks, str(tmp_path / f"workers{workers}"), workers=workers)
+        assert [row["seed"] for row in rows] == [0]
+        assert "run main seed=1 failed" in capsys.readouterr().out
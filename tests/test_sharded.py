@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from src.run_sim import RoundKeyedRewards, simulate_policy
+from src.policies import CohortThompsonPolicy, ThompsonPolicy
+from src.sharded import simulate_sharded
+
+
+def test_sharded_runs_are_deterministic_and_merge_all_feedback(small_world):
+    world, contexts = small_world(3, 400, num_cohorts=2, segment_len=2)
+    make = lambda shard: ThompsonPolicy(30, 4, seed=5 + shard)
+    local = simulate_sharded(world, make, contexts, 3, 50, seed=6, impressions_per_pull=2, processes=False)
+    forked = simulate_sharded(world, make, contexts, 3, 50, seed=6, impressions_per_pull=2)
+    np.testing.assert_array_equal(local["successes"], forked["successes"])
+    assert local["cumulative_regret"] == forked["cumulative_regret"] and local["syncs"] == 8
+
+    alpha, beta = local["posterior"]
+    assert alpha.sum() - alpha.size == local["successes"].sum()
+    assert alpha.sum() + beta.sum() - 2 * alpha.size == 2 * len(contexts)
+
+    by_user = simulate_sharded(
+        world,
+        lambda shard: CohortThompsonPolicy(2, 30, 4, seed=7 + shard),
+        contexts,
+        2,
+        100,
+        partition="users",
+        processes=False,
+    )
+    successes, failures = by_user["posterior"]
+    assert successes.sum() == by_user["successes"].sum() and failures.sum() + successes.sum() == len(contexts)
+
+
+def test_one_shard_is_an_ordinary_run_at_any_sync_every(small_world):
+    world, contexts = small_world(3, 400, num_cohorts=2, segment_len=2)
+    make = lambda shard: ThompsonPolicy(30, 4, seed=5 + shard)
+    plain = simulate_policy(
+        world, make(0), contexts, impressions_per_pull=3, rewards=RoundKeyedRewards(6, 3)
+    )
+    for sync_every in (1, 37, 400):
+        report = simulate_sharded(world, make, contexts, 1, sync_every, seed=6, impressions_per_pull=3)
+        np.testing.assert_array_equal(report["successes"], plain)
+
+    # Batched draws equal row-by-row draws.
+    rewards = RoundKeyedRewards(6, 3, rounds=np.arange(4090, 4100))
+    ctr = np.linspace(0.1, 0.9, 10)
+    batched = rewards.clicks(0, 10, ctr)
+    assert batched.tolist() == [rewards.clicks(t, t + 1, ctr[t]) for t in range(10)]
+
+    # Spans split on gaps and on max_draws give the same draws as one span.
+    rounds = np.concatenate([np.arange(0, 3000, 7), np.arange(9000, 9300, 3), [20000]])
+    ctr = np.linspace(0.05, 0.95, len(rounds))
+    whole = RoundKeyedRewards(6, 9, rounds=rounds, max_gap=100000, max_draws=10**6).clicks(0, len(rounds), ctr)
+    split = RoundKeyedRewards(6, 9, rounds=rounds, max_gap=5, max_draws=64).clicks(0, len(rounds), ctr)
+    np.testing.assert_array_equal(whole, split)
+    assert abs(whole.mean() - 9 * ctr.mean()) < 0.3
+
+
+def _fail(*args, **kwargs):
+    raise RuntimeError("shard failed")
+
+
+def _failing_first_shard(shard):
+    policy = ThompsonPolicy(30, 4, seed=5 + shard)
+    if shard == 0:
+        policy.update_batch = _fail
+    return policy
+
+
+def test_failing_shard_raises_instead_of_hanging(small_world):
+    # One epoch over every round: the healthy shard's result fills its pipe
+    # and is never read once shard 0 has failed.
+    world, contexts = small_world(3, 40000, num_cohorts=2, segment_len=2)
+    with pytest.raises(RuntimeError, match="shard failed"):
+        simulate_sharded(world, _failing_first_shard, contexts, 2, 40000, seed=6, batch_size=400)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from src.run_sim import simulate_policy
+from src.seed_sweep import build_world_and_contexts, make_thompson
+from src.stacked import StackedWorld, simulate_stacked
+
+
+def test_stacked_thompson_matches_reference_runs():
+    seeds = [0, 1, 2]
+    built = [build_world_and_contexts(seed, 300, 6, 3, 3, 2) for seed in seeds]
+    worlds = [world for world, _ in built]
+
+    reference = [make_thompson(world, 3, seed) for world, seed in zip(worlds, seeds)]
+    ref_succ = np.stack(
+        [
+            simulate_policy(world, policy, contexts, seed=seed + 10, impressions_per_pull=5)
+            for (world, contexts), policy, seed in zip(built, reference, seeds)
+        ]
+    )
+
+    stacked = [make_thompson(world, 3, seed) for world, seed in zip(worlds, seeds)]
+    succ = simulate_stacked(
+        StackedWorld(worlds),
+        stacked,
+        [contexts for _, contexts in built],
+        [seed + 10 for seed in seeds],
+        impressions_per_pull=5,
+    )
+    np.testing.assert_array_equal(succ, ref_succ)
+    for ref, out in zip(reference, stacked):
+        np.testing.assert_array_equal(ref.successes, out.successes)
+        np.testing.assert_array_equal(ref.failures, out.failures)
@@ -1,6 +1,6 @@
 import numpy as np
 
-from src.world import World, ACTION_EDIT, ACTION_NO_EDIT
+from src.world import World, LazyWorld, ACTION_EDIT, ACTION_NO_EDIT
 from src.run_sim import make_contexts, simulate_policy
 from src.policies import RandomPolicy, CohortThompsonPolicy
 
@@ -51,3 +51,70 @@ def test_thompson_beats_random():
     )
 
     assert ts_clicks.mean() >= rand_clicks.mean() + 0.02
+
+
+def _reference_ctr(world, u, v, b, a):
+    # The CTR model written out per call, independent of World's batched code.
+    x = world.x_v[v] + world.eta * world.q_hat[b] if a == ACTION_EDIT else world.x_v[v]
+    x = x / (np.linalg.norm(x) + 1e-12)
+    p, q = world.p_u[u], world.q_b[b]
+    logit = world.beta0 + p @ x + world.gamma * (p @ q) + world.delta * (q @ x)
+    return 1.0 / (1.0 + np.exp(-logit))
+
+
+def test_expected_ctr_batch_matches_reference():
+    for precompute in (True, False):
+        world = World(seed=5, num_users=15, num_videos=20, num_brands=4, dim=6, precompute_tables=precompute)
+        rng = np.random.default_rng(0)
+        u = rng.integers(world.num_users, size=50)
+        v = rng.integers(world.num_videos, size=50)
+        b = rng.integers(world.num_brands, size=50)
+        a = np.arange(50) % 2
+        reference = [_reference_ctr(world, *ids) for ids in zip(u, v, b, a)]
+        np.testing.assert_allclose(world.expected_ctr_batch(u, v, b, a), reference, rtol=1e-12)
+        np.testing.assert_allclose([world.expected_ctr(*ids) for ids in zip(u, v, b, a)], reference, rtol=1e-12)
+
+        vids = np.array([3, 7, 11])
+        brands = np.array([0, 2])
+        grid = world.expected_ctr_grid(4, vids, brands)
+        assert grid.shape == (3, 2, 2)
+        for i, vid in enumerate(vids):
+            for j, br in enumerate(brands):
+                for act in (ACTION_NO_EDIT, ACTION_EDIT):
+                    assert np.isclose(grid[i, j, act], _reference_ctr(world, 4, vid, br, act), rtol=1e-12)
+
+
+def test_precomputed_tables_match_on_the_fly():
+    kwargs = dict(seed=6, num_users=10, num_videos=25, num_brands=3, dim=5)
+    tabled = World(precompute_tables=True, **kwargs)
+    direct = World(precompute_tables=False, **kwargs)
+    assert tabled.use_tables and not direct.use_tables
+    assert not World(table_budget_bytes=0, **kwargs).use_tables
+
+    grid_t = tabled.expected_ctr_grid(np.arange(10), np.tile(np.arange(25), (10, 1)), np.tile(np.arange(3), (10, 1)))
+    grid_d = direct.expected_ctr_grid(np.arange(10), np.tile(np.arange(25), (10, 1)), np.tile(np.arange(3), (10, 1)))
+    np.testing.assert_allclose(grid_t, grid_d, rtol=1e-12)
+    assert tabled.edited_norm.shape == (25, 3, 5)
+    assert tabled.brand_video_fit.shape == (25, 3, 2)
+    assert tabled.user_brand_affinity.shape == (10, 3)
+
+
+def test_lazy_world_rows_are_deterministic_under_eviction():
+    user_to_cohort = np.arange(1000) % 4
+    kwargs = dict(num_users=1000, num_videos=5000, num_brands=3, dim=6, user_to_cohort=user_to_cohort, num_cohorts=4, seed=3)
+    big = LazyWorld(block_size=16, cache_blocks=1000, **kwargs)
+    tiny = LazyWorld(block_size=16, cache_blocks=2, **kwargs)
+    ids = np.array([4999, 0, 17, 2500, 17, 33])
+    for world in (big, tiny):
+        world.video_embeddings(np.arange(0, 5000, 7))
+    np.testing.assert_array_equal(big.video_embeddings(ids), tiny.video_embeddings(ids))
+    np.testing.assert_array_equal(big.user_embeddings(ids[ids < 1000]), tiny.user_embeddings(ids[ids < 1000]))
+    assert len(tiny._cache) <= 2
+    # Every block draws from its own stream, so no rows repeat across blocks.
+    assert len(np.unique(tiny.video_embeddings(np.arange(5000)), axis=0)) == 5000
+
+    grid = tiny.expected_ctr_grid(7, ids[:3], np.arange(3))
+    assert grid.shape == (3, 3, 2)
+    assert np.isclose(grid[1, 2, ACTION_EDIT], tiny.expected_ctr(7, ids[1], 2, ACTION_EDIT))
+    frac = tiny.edit_acceptable_batch(np.arange(5000), 0).mean()
+    assert 0.1 < frac < 0.9